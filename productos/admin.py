@@ -1,6 +1,16 @@
+from django.conf import settings
 from django.contrib import admin
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Producto
+from .models import (
+    Producto, Tarea, Almacen, StockAlmacen, MovimientoStock, SnapshotStock, ResumenCategoria, umbral_stock_bajo
+)
+from .tareas import encolar
+from .eventos import notificar_cambios
+from .movimientos import lote_movimientos, registrar_movimientos
+from .conteo import PaginadorConteoEstimado
 
 @admin.register(Producto)
 class ProductoAdmin(admin.ModelAdmin):
@@ -19,7 +29,53 @@ class ProductoAdmin(admin.ModelAdmin):
     readonly_fields = ['codigo_producto', 'fecha_creacion', 'fecha_actualizacion']
     list_editable = ['activo', 'stock']
     list_per_page = 20
+    # Total del changelist cacheado o estimado, sin el segundo COUNT(*) de la tabla completa
+    paginator = PaginadorConteoEstimado
+    show_full_result_count = False
     
+    def get_queryset(self, request):
+        """Anota el estado del stock para mostrarlo y ordenarlo sin calcularlo por fila"""
+        return super().get_queryset(request).con_estado_stock()
+
+    def changelist_view(self, request, extra_context=None):
+        """Las ediciones de list_editable se acumulan y se guardan con un solo bulk_update"""
+        if request.method != 'POST' or '_save' not in request.POST:
+            return super().changelist_view(request, extra_context)
+        request.ediciones_en_lista = []
+        # El lote se abre dentro de la transacción: los movimientos se escriben juntos y antes del COMMIT
+        with transaction.atomic(), lote_movimientos():
+            response = super().changelist_view(request, extra_context)
+            self.guardar_ediciones(request.ediciones_en_lista)
+        return response
+
+    def save_model(self, request, obj, form, change):
+        ediciones = getattr(request, 'ediciones_en_lista', None)
+        if change and ediciones is not None:
+            ediciones.append(obj)
+            return
+        stock_anterior = obj.valor_original('stock')
+        super().save_model(request, obj, form, change)
+        # Los cambios de stock desde el formulario también quedan registrados
+        if change:
+            obj.registrar_movimiento(obj.stock - stock_anterior)
+
+    def guardar_ediciones(self, productos):
+        """Guarda las columnas modificadas de varios productos con un UPDATE por lote"""
+        modificados = [p for p in productos if p.campos_modificados()]
+        if not modificados:
+            return
+        campos = sorted({campo for p in modificados for campo in p.campos_modificados()})
+        ahora = timezone.now()
+        for producto in modificados:
+            producto.fecha_actualizacion = ahora
+        Producto.objects.bulk_update(modificados, campos + ['fecha_actualizacion'], batch_size=500)
+        for producto in modificados:
+            producto.registrar_movimiento(producto.stock - producto.valor_original('stock'))
+        for tipo, grupo in (('actualizado', [p for p in modificados if p.activo]),
+                            ('desactivado', [p for p in modificados if not p.activo])):
+            if grupo:
+                notificar_cambios(tipo, productos=grupo)
+
     fieldsets = (
         ('Información Básica', {
             'fields': ('codigo_producto', 'nombre', 'descripcion', 'categoria')
@@ -46,7 +102,7 @@ class ProductoAdmin(admin.ModelAdmin):
         """Muestra el stock con colores según el estado"""
         if obj.stock == 0:
             return format_html('<span style="color: red;">{}</span>', obj.stock)
-        elif obj.stock <= 5:
+        elif obj.stock <= umbral_stock_bajo():
             return format_html('<span style="color: orange;">{}</span>', obj.stock)
         else:
             return format_html('<span style="color: green;">{}</span>', obj.stock)
@@ -65,26 +121,109 @@ class ProductoAdmin(admin.ModelAdmin):
         else:
             return format_html('<span style="color: gray; font-weight: bold;">{}</span>', estado)
     estado_stock.short_description = "Estado"
+    estado_stock.admin_order_field = 'nivel_stock'
     
     actions = ['activar_productos', 'desactivar_productos', 'aumentar_stock']
+
+    def encolar_si_es_grande(self, request, ids, tipo, **parametros):
+        """Envía la acción a una tarea en segundo plano si la selección es muy grande"""
+        if len(ids) <= getattr(settings, 'PRODUCTOS_TAREAS_UMBRAL_ADMIN', 1000):
+            return False
+        tarea = encolar(tipo, {'ids': ids, **parametros})
+        self.message_user(request, f'La acción sobre {len(ids)} productos se procesará en segundo plano (tarea #{tarea.pk}).')
+        return True
     
     def activar_productos(self, request, queryset):
         """Acción para activar productos seleccionados"""
-        updated = queryset.update(activo=True)
+        ids = list(queryset.values_list('id', flat=True))
+        if self.encolar_si_es_grande(request, ids, 'activar_productos'):
+            return
+        updated = Producto.objects.filter(pk__in=ids).update(activo=True, fecha_actualizacion=timezone.now())
+        notificar_cambios('actualizado', ids=ids)
         self.message_user(request, f'{updated} productos han sido activados.')
     activar_productos.short_description = "Activar productos seleccionados"
     
     def desactivar_productos(self, request, queryset):
         """Acción para desactivar productos seleccionados"""
-        updated = queryset.update(activo=False)
+        ids = list(queryset.values_list('id', flat=True))
+        if self.encolar_si_es_grande(request, ids, 'desactivar_productos'):
+            return
+        updated = Producto.objects.filter(pk__in=ids).update(activo=False, fecha_actualizacion=timezone.now())
+        notificar_cambios('desactivado', ids=ids)
         self.message_user(request, f'{updated} productos han sido desactivados.')
     desactivar_productos.short_description = "Desactivar productos seleccionados"
     
     def aumentar_stock(self, request, queryset):
         """Acción para aumentar stock de productos seleccionados"""
-        # Esta es una acción de ejemplo, en un caso real podrías usar un formulario
-        for producto in queryset:
-            producto.stock += 10
-            producto.save()
-        self.message_user(request, f'Stock aumentado en 10 unidades para {queryset.count()} productos.')
+        ids = list(queryset.values_list('id', flat=True))
+        if self.encolar_si_es_grande(request, ids, 'aumentar_stock', cantidad=10):
+            return
+        # Un solo UPDATE en lugar de un save() por producto y un solo INSERT en el registro
+        with lote_movimientos():
+            updated = Producto.objects.filter(pk__in=ids).update(
+                stock=F('stock') + 10, fecha_actualizacion=timezone.now()
+            )
+            registrar_movimientos(ids, 10)
+        notificar_cambios('actualizado', ids=ids)
+        self.message_user(request, f'Stock aumentado en 10 unidades para {updated} productos.')
     aumentar_stock.short_description = "Aumentar stock en 10 unidades"
+
+
+@admin.register(Almacen)
+class AlmacenAdmin(admin.ModelAdmin):
+    list_display = ['codigo', 'nombre', 'activo']
+    list_filter = ['activo']
+    search_fields = ['codigo', 'nombre']
+
+
+class SoloLecturaAdmin(admin.ModelAdmin):
+    """Modelos que solo se modifican desde la API o las operaciones de stock"""
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockAlmacen)
+class StockAlmacenAdmin(SoloLecturaAdmin):
+    """Solo lectura: el stock por almacén se modifica con la API para mantener el total del producto"""
+    list_display = ['producto', 'almacen', 'cantidad', 'fecha_actualizacion']
+    list_filter = ['almacen']
+    list_select_related = ['producto', 'almacen']
+    search_fields = ['producto__nombre', 'producto__codigo_producto']
+
+
+@admin.register(MovimientoStock)
+class MovimientoStockAdmin(SoloLecturaAdmin):
+    """Registro de solo inserción; se escribe desde los cambios de stock"""
+    list_display = ['fecha', 'producto', 'almacen', 'tipo', 'cantidad', 'stock_resultante']
+    list_filter = ['tipo', 'almacen']
+    list_select_related = ['producto', 'almacen']
+    search_fields = ['producto__nombre', 'producto__codigo_producto']
+    date_hierarchy = 'fecha'
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SnapshotStock)
+class SnapshotStockAdmin(SoloLecturaAdmin):
+    list_display = ['fecha', 'producto', 'stock', 'entradas', 'salidas']
+    list_select_related = ['producto']
+    search_fields = ['producto__nombre', 'producto__codigo_producto']
+
+
+@admin.register(ResumenCategoria)
+class ResumenCategoriaAdmin(SoloLecturaAdmin):
+    list_display = ['fecha', 'periodo', 'categoria', 'total', 'activos', 'sin_stock', 'stock_bajo', 'precio_promedio']
+    list_filter = ['periodo', 'categoria']
+    date_hierarchy = 'fecha'
+
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tipo', 'estado', 'progreso', 'intentos', 'fecha_creacion', 'fecha_inicio', 'fecha_fin']
+    list_filter = ['estado', 'tipo']
+    readonly_fields = ['estado', 'progreso', 'resultado', 'error', 'intentos', 'fecha_creacion', 'fecha_inicio',
+                       'fecha_latido', 'fecha_fin']
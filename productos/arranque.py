@@ -0,0 +1,99 @@
+import gc
+import io
+import logging
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+
+from .autocompletar import obtener_indice
+from .catalogo import obtener_catalogo
+from .models import Producto
+
+logger = logging.getLogger(__name__)
+
+
+def host_local():
+    """Host aceptado por ALLOWED_HOSTS para las solicitudes internas de calentamiento"""
+    for host in settings.ALLOWED_HOSTS:
+        if host and host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+def solicitar(aplicacion, ruta, parametros=None):
+    """Ejecuta un GET contra la aplicación WSGI sin pasar por la red y retorna el status"""
+    respuesta = {}
+
+    def start_response(status, headers, exc_info=None):
+        respuesta['status'] = status
+        return lambda datos: None
+
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': ruta,
+        'QUERY_STRING': urlencode(parametros or {}),
+        'SERVER_NAME': host_local(),
+        'SERVER_PORT': '80',
+        'HTTP_HOST': host_local(),
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0),
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    cuerpo = aplicacion(environ, start_response)
+    try:
+        for _ in cuerpo:
+            pass
+    finally:
+        if hasattr(cuerpo, 'close'):
+            cuerpo.close()
+    if not respuesta.get('status', '').startswith('2'):
+        logger.warning("El calentamiento de %s respondió %s", ruta, respuesta.get('status'))
+    return respuesta.get('status', '')
+
+
+def calentar(aplicacion, maximo_categorias=50):
+    """
+    Carga lo que de otro modo se construiría en el primer request de cada worker.
+
+    Compila las rutas, carga el catálogo y el índice de autocompletado y recorre el listado
+    general y el de cada categoría para dejar cacheados sus conteos. Retorna [(paso, segundos)].
+    """
+    pasos = []
+
+    def medir(nombre, funcion):
+        inicio = time.perf_counter()
+        funcion()
+        pasos.append((nombre, time.perf_counter() - inicio))
+
+    def categorias():
+        nombres = (
+            Producto.objects.filter(activo=True).exclude(categoria__isnull=True).exclude(categoria='')
+            .order_by('categoria').values_list('categoria', flat=True).distinct()[:maximo_categorias]
+        )
+        for categoria in nombres:
+            solicitar(aplicacion, '/api/productos/', {'categoria': categoria})
+
+    medir('rutas', lambda: get_resolver().reverse_dict)
+    medir('catalogo', obtener_catalogo)
+    medir('autocompletar', obtener_indice)
+    medir('listado', lambda: solicitar(aplicacion, '/api/productos/'))
+    medir('categorias', categorias)
+    return pasos
+
+
+def preparar_fork():
+    """Deja el proceso maestro listo para que los workers compartan su memoria"""
+    # Las conexiones abiertas no se pueden compartir entre procesos
+    connections.close_all()
+    # Mueve los objetos ya creados a la generación permanente para que el recolector de basura
+    # de cada worker no los recorra y no copie sus páginas de memoria
+    gc.collect()
+    gc.freeze()
@@ -0,0 +1,185 @@
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .models import Producto
+from .sincronizacion import obtener_cambios
+
+# Sufijo para convertir un prefijo en un rango [prefijo, prefijo + FIN) indexable
+FIN = '\uffff'
+
+
+def normalizar(texto):
+    """Quita acentos y mayúsculas para comparar nombres en español ("Cámaras" -> "camaras")"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).casefold().strip()
+
+
+class IndicePrefijos:
+    """Arreglo ordenado de (clave normalizada, id) para buscar productos activos por prefijo"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.entradas = []
+        self.claves_por_id = {}
+        self.datos = {}
+        self.marca = None
+        self.ultimo_refresco = 0.0
+
+    @staticmethod
+    def claves(producto):
+        """Nombre completo, código y cada palabra del nombre, normalizados"""
+        nombre = normalizar(producto.nombre)
+        claves = {nombre, normalizar(producto.codigo_producto)}
+        claves.update(palabra for palabra in nombre.split()[1:] if len(palabra) > 1)
+        claves.discard('')
+        return claves
+
+    def quitar(self, producto_id):
+        """Quita un producto del índice, por ejemplo tras borrarlo de la base de datos"""
+        with self._lock:
+            for clave in self.claves_por_id.pop(producto_id, ()):
+                posicion = bisect_left(self.entradas, (clave, producto_id))
+                if posicion < len(self.entradas) and self.entradas[posicion] == (clave, producto_id):
+                    del self.entradas[posicion]
+            self.datos.pop(producto_id, None)
+
+    def actualizar(self, producto):
+        """Agrega, reemplaza o quita un producto del índice"""
+        with self._lock:
+            self.quitar(producto.id)
+            if not producto.activo:
+                return
+            claves = self.claves(producto)
+            for clave in claves:
+                insort(self.entradas, (clave, producto.id))
+            self.claves_por_id[producto.id] = claves
+            self.datos[producto.id] = {
+                'id': producto.id,
+                'codigo_producto': producto.codigo_producto,
+                'nombre': producto.nombre,
+                'categoria': producto.categoria,
+            }
+
+    def refrescar(self):
+        """Aplica los productos modificados desde la última marca de agua"""
+        inicial = self.marca is None
+        hay_mas = True
+        while hay_mas:
+            productos, self.marca, hay_mas = obtener_cambios(
+                self.marca, 5000, campos=['nombre', 'codigo_producto', 'categoria', 'activo']
+            )
+            if inicial:
+                # Carga inicial: construir el arreglo de una vez en lugar de insertar uno a uno
+                self._cargar(productos)
+            else:
+                for producto in productos:
+                    self.actualizar(producto)
+        self.ultimo_refresco = time.monotonic()
+
+    def _cargar(self, productos):
+        with self._lock:
+            for producto in productos:
+                if not producto.activo:
+                    continue
+                claves = self.claves(producto)
+                self.entradas.extend((clave, producto.id) for clave in claves)
+                self.claves_por_id[producto.id] = claves
+                self.datos[producto.id] = {
+                    'id': producto.id,
+                    'codigo_producto': producto.codigo_producto,
+                    'nombre': producto.nombre,
+                    'categoria': producto.categoria,
+                }
+            self.entradas.sort()
+
+    def buscar(self, texto, limite=10):
+        """Retorna hasta `limite` productos cuyo nombre, palabra o código empieza por `texto`"""
+        prefijo = normalizar(texto)
+        if not prefijo:
+            return []
+        resultados = []
+        vistos = set()
+        with self._lock:
+            posicion = bisect_left(self.entradas, (prefijo,))
+            while posicion < len(self.entradas) and len(resultados) < limite:
+                clave, producto_id = self.entradas[posicion]
+                if not clave.startswith(prefijo):
+                    break
+                if producto_id not in vistos:
+                    vistos.add(producto_id)
+                    resultados.append(self.datos[producto_id])
+                posicion += 1
+        return resultados
+
+
+def buscar_en_base_de_datos(texto, limite=10):
+    """
+    Búsqueda por prefijo con rangos sobre índices de Lower(nombre) y codigo_producto.
+
+    A diferencia del índice en memoria distingue acentos: "cam" no encuentra "Cámaras".
+    """
+    texto = (texto or '').strip()
+    if not texto:
+        return []
+    minusculas = texto.lower()
+    mayusculas = texto.upper()
+    return list(
+        Producto.objects.annotate(nombre_minusculas=Lower('nombre'))
+        .filter(
+            Q(nombre_minusculas__gte=minusculas, nombre_minusculas__lt=minusculas + FIN)
+            | Q(codigo_producto__gte=mayusculas, codigo_producto__lt=mayusculas + FIN),
+            activo=True,
+        )
+        .order_by('nombre_minusculas', 'id')
+        .values('id', 'codigo_producto', 'nombre', 'categoria')[:limite]
+    )
+
+
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def obtener_indice():
+    """Retorna el índice de prefijos del proceso, o None si PRODUCTOS_AUTOCOMPLETAR_EN_MEMORIA está desactivado"""
+    global _indice
+    if not getattr(settings, 'PRODUCTOS_AUTOCOMPLETAR_EN_MEMORIA', True):
+        return None
+    with _indice_lock:
+        if _indice is None:
+            _indice = IndicePrefijos()
+            _indice.refrescar()
+    # Recoge los cambios hechos por otros procesos o con queryset.update()
+    intervalo = getattr(settings, 'PRODUCTOS_AUTOCOMPLETAR_REFRESCO_SEGUNDOS', 5)
+    if time.monotonic() - _indice.ultimo_refresco > intervalo and _indice_lock.acquire(blocking=False):
+        try:
+            _indice.refrescar()
+        finally:
+            _indice_lock.release()
+    return _indice
+
+
+def actualizar_indice(producto):
+    """Actualiza el índice del proceso tras guardar un producto, si ya está cargado"""
+    if _indice is not None:
+        _indice.actualizar(producto)
+
+
+def quitar_del_indice(producto_id):
+    """Quita un producto borrado del índice del proceso, si ya está cargado"""
+    # Un borrado no deja fecha_actualizacion, así que refrescar() nunca lo vería
+    if _indice is not None:
+        _indice.quitar(producto_id)
+
+
+def autocompletar(texto, limite=10):
+    """Busca por prefijo en memoria o, si el índice está desactivado, en la base de datos"""
+    indice = obtener_indice()
+    if indice is None:
+        return buscar_en_base_de_datos(texto, limite)
+    return indice.buscar(texto, limite)
@@ -0,0 +1,319 @@
+import sys
+import threading
+import time
+from array import array
+from bisect import insort
+
+from django.conf import settings
+from rest_framework import serializers
+
+from .models import EstadoStock, umbral_stock_bajo
+from .sincronizacion import obtener_cambios
+
+CAMPOS = ['nombre', 'descripcion', 'codigo_producto', 'categoria', 'precio', 'stock', 'activo', 'fecha_creacion']
+CAMPOS_ORDEN = ['precio', 'stock', 'nombre', 'fecha_creacion', 'categoria']
+# Cambios por refresco que se corrigen en los órdenes existentes con el lock tomado. Cada uno
+# cuesta O(n), así que con más se reconstruyen los órdenes sin bloquear las consultas
+REUBICAR_MAXIMO = 20
+
+_formato_fecha = serializers.DateTimeField()
+
+
+class CatalogoEnMemoria:
+    """
+    Instantánea columnar de los productos para responder filtros y ordenamientos sin la base de datos.
+
+    Las columnas numéricas se guardan en arrays compactos, los órdenes por campo y los grupos por
+    categoría se mantienen ya calculados, y la instantánea se actualiza con los cambios de
+    fecha_actualizacion (ver productos.sincronizacion).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._lock_refresco = threading.Lock()
+        self.ids = array('q')
+        self.precios = array('q')  # en centavos
+        self.stocks = array('q')
+        self.categorias = array('l')  # código de categoría, -1 si no tiene
+        self.activos = array('b')
+        self.fechas = array('d')  # timestamp de fecha_creacion
+        self.nombres = []
+        self.descripciones = []
+        self.codigos = []
+        self.fechas_texto = []
+        self.actualizaciones_texto = []
+        self.posicion = {}
+        self.nombres_categoria = []
+        self.codigo_categoria = {}
+        self.ordenes = {}
+        self.por_categoria = {}
+        self.marca = None
+        self.ultimo_refresco = 0.0
+
+    # Carga y refresco
+
+    def refrescar(self):
+        """Aplica los productos modificados desde la última marca de agua"""
+        with self._lock_refresco:
+            cambiados = []
+            hay_mas = True
+            while hay_mas:
+                productos, self.marca, hay_mas = obtener_cambios(self.marca, 5000, campos=CAMPOS)
+                with self._lock:
+                    cambiados.extend(self._aplicar(producto) for producto in productos)
+            if len(cambiados) > REUBICAR_MAXIMO:
+                self._reconstruir_ordenes()
+            else:
+                with self._lock:
+                    # Primero se quitan todas: insort necesita que el resto del orden siga ordenado
+                    # con los valores nuevos
+                    for fila, categoria_anterior in cambiados:
+                        self._quitar_de_ordenes(fila, categoria_anterior)
+                    for fila, _ in cambiados:
+                        self._insertar_en_ordenes(fila)
+            self.ultimo_refresco = time.monotonic()
+            return len(cambiados)
+
+    def _aplicar(self, producto):
+        fila = self.posicion.get(producto.id)
+        categoria = self._codigo_de(producto.categoria)
+        valores = (
+            int(producto.precio * 100), producto.stock, categoria,
+            int(producto.activo), producto.fecha_creacion.timestamp(),
+        )
+        if fila is None:
+            fila = len(self.ids)
+            self.posicion[producto.id] = fila
+            self.ids.append(producto.id)
+            for columna, valor in zip(self._numericas(), valores):
+                columna.append(valor)
+            self.nombres.append(producto.nombre)
+            self.descripciones.append(producto.descripcion)
+            self.codigos.append(producto.codigo_producto)
+            self.fechas_texto.append(_formato_fecha.to_representation(producto.fecha_creacion))
+            self.actualizaciones_texto.append(_formato_fecha.to_representation(producto.fecha_actualizacion))
+            return fila, None
+
+        categoria_anterior = self.categorias[fila]
+        for columna, valor in zip(self._numericas(), valores):
+            columna[fila] = valor
+        self.nombres[fila] = producto.nombre
+        self.descripciones[fila] = producto.descripcion
+        self.codigos[fila] = producto.codigo_producto
+        self.actualizaciones_texto[fila] = _formato_fecha.to_representation(producto.fecha_actualizacion)
+        return fila, categoria_anterior
+
+    def eliminar(self, producto_id):
+        """Quita de las consultas un producto borrado de la base de datos"""
+        # Un borrado no deja fecha_actualizacion, así que refrescar() nunca lo vería. Espera a que
+        # termine un refresco en curso, que puede estar reconstruyendo los órdenes sin el lock
+        with self._lock_refresco, self._lock:
+            fila = self.posicion.get(producto_id)
+            if fila is None or not self.activos[fila]:
+                return
+            self.activos[fila] = 0
+            self._quitar_de_ordenes(fila, self.categorias[fila])
+
+    def _numericas(self):
+        return (self.precios, self.stocks, self.categorias, self.activos, self.fechas)
+
+    def _codigo_de(self, categoria):
+        if categoria is None:
+            return -1
+        codigo = self.codigo_categoria.get(categoria)
+        if codigo is None:
+            codigo = len(self.nombres_categoria)
+            self.codigo_categoria[categoria] = codigo
+            self.nombres_categoria.append(categoria)
+        return codigo
+
+    def _clave(self, campo):
+        """Retorna la función de orden ascendente (valor, id) de una fila"""
+        columna = {
+            'precio': self.precios,
+            'stock': self.stocks,
+            'nombre': self.nombres,
+            'fecha_creacion': self.fechas,
+        }.get(campo)
+        if campo == 'categoria':
+            return lambda fila: (self._nombre_categoria(self.categorias[fila]) or '', self.ids[fila])
+        return lambda fila: (columna[fila], self.ids[fila])
+
+    def _clave_defecto(self, fila):
+        # Orden por defecto del modelo: -fecha_creacion
+        return (-self.fechas[fila], -self.ids[fila])
+
+    def _nombre_categoria(self, codigo):
+        return self.nombres_categoria[codigo] if codigo >= 0 else None
+
+    def _reconstruir_ordenes(self):
+        """
+        Calcula los órdenes y los grupos por categoría y los reemplaza de una vez.
+
+        Se llama con _lock_refresco tomado: las columnas no cambian mientras se ordenan, así que
+        el cálculo se hace sin _lock y las consultas siguen respondiendo con los órdenes anteriores.
+        """
+        activas = [fila for fila in range(len(self.ids)) if self.activos[fila]]
+        ordenes = {
+            campo: array('q', sorted(activas, key=self._clave(campo)))
+            for campo in CAMPOS_ORDEN
+        }
+        por_categoria = {}
+        for fila in sorted(activas, key=self._clave_defecto):
+            por_categoria.setdefault(self.categorias[fila], array('q')).append(fila)
+        with self._lock:
+            self.ordenes, self.por_categoria = ordenes, por_categoria
+
+    def _quitar_de_ordenes(self, fila, categoria_anterior):
+        if categoria_anterior is None:
+            return
+        for orden in self.ordenes.values():
+            if fila in orden:
+                orden.remove(fila)
+        grupo = self.por_categoria.get(categoria_anterior)
+        if grupo is not None and fila in grupo:
+            grupo.remove(fila)
+
+    def _insertar_en_ordenes(self, fila):
+        if not self.activos[fila]:
+            return
+        for campo in CAMPOS_ORDEN:
+            insort(self.ordenes.setdefault(campo, array('q')), fila, key=self._clave(campo))
+        grupo = self.por_categoria.setdefault(self.categorias[fila], array('q'))
+        insort(grupo, fila, key=self._clave_defecto)
+
+    # Consultas
+
+    def consultar(self, estado=None, con_stock=False, categoria=None, ordenar='-fecha_creacion',
+                  limite=None, campos=None):
+        """
+        Retorna los productos activos con la misma representación que ProductoSerializer.
+
+        estado: EstadoStock.SIN_STOCK o EstadoStock.STOCK_BAJO
+        con_stock: solo productos con stock mayor a 0
+        categoria: texto contenido en la categoría (sin distinguir mayúsculas)
+        ordenar: campo de CAMPOS_ORDEN o '-fecha_creacion', con '-' para descendente
+        campos: subconjunto de campos a retornar, por ejemplo los de ProductoListSerializer
+        """
+        umbral = umbral_stock_bajo()
+        stocks = self.stocks
+        condiciones = []
+        if con_stock:
+            condiciones.append(lambda fila: stocks[fila] > 0)
+        if estado == EstadoStock.SIN_STOCK:
+            condiciones.append(lambda fila: stocks[fila] == 0)
+        elif estado == EstadoStock.STOCK_BAJO:
+            condiciones.append(lambda fila: 0 < stocks[fila] <= umbral)
+
+        with self._lock:
+            filas = self._candidatas(categoria, ordenar)
+            resultado = []
+            for fila in filas:
+                if all(condicion(fila) for condicion in condiciones):
+                    resultado.append(fila)
+                    if limite is not None and len(resultado) >= limite:
+                        break
+            return [self.materializar(fila, umbral, campos) for fila in resultado]
+
+    def _candidatas(self, categoria, ordenar):
+        campo = ordenar.lstrip('-')
+        descendente = ordenar.startswith('-')
+        if categoria:
+            codigos = [
+                codigo for nombre, codigo in self.codigo_categoria.items()
+                if categoria.lower() in nombre.lower()
+            ]
+            filas = [fila for codigo in codigos for fila in self.por_categoria.get(codigo, ())]
+            if ordenar == '-fecha_creacion' and len(codigos) <= 1:
+                return filas
+            if campo == 'fecha_creacion':
+                return sorted(filas, key=self._clave_defecto, reverse=not descendente)
+            return sorted(filas, key=self._clave(campo), reverse=descendente)
+
+        if ordenar == '-fecha_creacion':
+            return reversed(self.ordenes.get('fecha_creacion', ()))
+        orden = self.ordenes.get(campo, array('q'))
+        return reversed(orden) if descendente else orden
+
+    def materializar(self, fila, umbral=None, campos=None):
+        """Construye la representación de ProductoSerializer de una fila"""
+        umbral = umbral_stock_bajo() if umbral is None else umbral
+        stock = self.stocks[fila]
+        if stock == 0:
+            estado = EstadoStock.SIN_STOCK.value
+        elif stock <= umbral:
+            estado = EstadoStock.STOCK_BAJO.value
+        else:
+            estado = EstadoStock.DISPONIBLE.value
+        centavos = self.precios[fila]
+        datos = {
+            'id': self.ids[fila],
+            'estado_stock': estado,
+            'nombre': self.nombres[fila],
+            'descripcion': self.descripciones[fila],
+            'precio': f"{centavos // 100}.{centavos % 100:02d}",
+            'stock': stock,
+            'fecha_creacion': self.fechas_texto[fila],
+            'fecha_actualizacion': self.actualizaciones_texto[fila],
+            'activo': True,
+            'categoria': self._nombre_categoria(self.categorias[fila]),
+            'codigo_producto': self.codigos[fila],
+        }
+        if campos:
+            return {campo: datos[campo] for campo in campos}
+        return datos
+
+    def reporte_memoria(self):
+        """Retorna los bytes ocupados por cada columna e índice de la instantánea"""
+        def tamano_lista(lista):
+            return sys.getsizeof(lista) + sum(sys.getsizeof(valor) for valor in lista)
+
+        with self._lock:
+            reporte = {
+                'ids': sys.getsizeof(self.ids),
+                'precios': sys.getsizeof(self.precios),
+                'stocks': sys.getsizeof(self.stocks),
+                'categorias': sys.getsizeof(self.categorias) + tamano_lista(self.nombres_categoria),
+                'activos': sys.getsizeof(self.activos),
+                'fechas': (sys.getsizeof(self.fechas) + tamano_lista(self.fechas_texto)
+                           + tamano_lista(self.actualizaciones_texto)),
+                'nombres': tamano_lista(self.nombres),
+                'descripciones': tamano_lista(self.descripciones),
+                'codigos': tamano_lista(self.codigos),
+                'posicion': sys.getsizeof(self.posicion),
+                'ordenes': sum(sys.getsizeof(orden) for orden in self.ordenes.values()),
+                'por_categoria': sum(sys.getsizeof(grupo) for grupo in self.por_categoria.values()),
+            }
+            reporte['total'] = sum(reporte.values())
+            reporte['productos'] = len(self.ids)
+        return reporte
+
+
+_catalogo = None
+_catalogo_lock = threading.Lock()
+
+
+def obtener_catalogo():
+    """
+    Retorna el catálogo en memoria del proceso, o None si PRODUCTOS_CATALOGO_EN_MEMORIA está desactivado.
+
+    Se refresca con los cambios cuando pasaron más de PRODUCTOS_CATALOGO_REFRESCO_SEGUNDOS.
+    """
+    global _catalogo
+    if not getattr(settings, 'PRODUCTOS_CATALOGO_EN_MEMORIA', False):
+        return None
+    with _catalogo_lock:
+        if _catalogo is None:
+            _catalogo = CatalogoEnMemoria()
+    intervalo = getattr(settings, 'PRODUCTOS_CATALOGO_REFRESCO_SEGUNDOS', 2)
+    if time.monotonic() - _catalogo.ultimo_refresco > intervalo:
+        # Si otro hilo ya está refrescando se responde con la instantánea actual
+        if not _catalogo._lock_refresco.locked() or not _catalogo.ultimo_refresco:
+            _catalogo.refrescar()
+    return _catalogo
+
+
+def eliminar_del_catalogo(producto_id):
+    """Quita un producto borrado del catálogo del proceso, si ya está cargado"""
+    if _catalogo is not None:
+        _catalogo.eliminar(producto_id)
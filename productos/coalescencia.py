@@ -0,0 +1,144 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+
+class _Vuelo:
+    """Cálculo en curso al que esperan las solicitudes idénticas del mismo proceso"""
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class Coalescedor:
+    """
+    Comparte un único cálculo entre solicitudes idénticas concurrentes.
+
+    Dentro del proceso las solicitudes esperan al hilo líder; entre procesos el líder se elige con
+    un cache.add() y el resultado se publica en la cache. Un resultado vencido se sigue sirviendo
+    durante la ventana de obsolescencia mientras un solo líder lo recalcula.
+    """
+
+    def __init__(self, prefijo='coalescencia'):
+        self.prefijo = prefijo
+        self._lock = threading.Lock()
+        self._en_vuelo = {}
+        self.contadores = Counter()
+
+    def _contar(self, origen):
+        with self._lock:
+            self.contadores[origen] += 1
+
+    def ejecutar(self, clave, funcion, ttl=None, obsoleto=None, espera=None):
+        """
+        Ejecuta `funcion` una sola vez para todas las llamadas concurrentes con la misma clave.
+
+        `funcion` retorna (valor, cacheable). Retorna (valor, origen) donde origen es
+        'lider', 'coalescido', 'cache' u 'obsoleto'.
+        """
+        ttl = getattr(settings, 'PRODUCTOS_COALESCENCIA_TTL', 1) if ttl is None else ttl
+        obsoleto = getattr(settings, 'PRODUCTOS_COALESCENCIA_OBSOLETO', 5) if obsoleto is None else obsoleto
+        espera = getattr(settings, 'PRODUCTOS_COALESCENCIA_ESPERA', 10) if espera is None else espera
+        clave_cache = f"{self.prefijo}:{hashlib.sha1(clave.encode()).hexdigest()}"
+
+        entrada = cache.get(clave_cache)
+        if entrada is not None and entrada['fresco_hasta'] > time.time():
+            self._contar('cache')
+            return entrada['valor'], 'cache'
+
+        with self._lock:
+            vuelo = self._en_vuelo.get(clave_cache)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._en_vuelo[clave_cache] = _Vuelo()
+
+        if not lider:
+            # Mientras otro hilo recalcula se sirve el valor obsoleto, si lo hay
+            if entrada is not None:
+                self._contar('obsoleto')
+                return entrada['valor'], 'obsoleto'
+            vuelo.listo.wait(espera)
+            if vuelo.listo.is_set() and vuelo.error is None:
+                self._contar('coalescido')
+                return vuelo.resultado, 'coalescido'
+            # El líder falló o tardó demasiado: se calcula sin compartir
+            valor, _ = funcion()
+            return valor, 'lider'
+
+        try:
+            vuelo.resultado, origen = self._calcular(clave_cache, entrada, funcion, ttl, obsoleto, espera)
+            return vuelo.resultado, origen
+        except Exception as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._en_vuelo[clave_cache]
+            vuelo.listo.set()
+
+    def _calcular(self, clave_cache, entrada, funcion, ttl, obsoleto, espera):
+        clave_lock = f"{clave_cache}:lock"
+        if not cache.add(clave_lock, 1, timeout=espera):
+            # Otro proceso es el líder: servir lo obsoleto o esperar a que publique su resultado
+            if entrada is not None:
+                self._contar('obsoleto')
+                return entrada['valor'], 'obsoleto'
+            limite = time.monotonic() + espera
+            while time.monotonic() < limite:
+                time.sleep(0.05)
+                entrada = cache.get(clave_cache)
+                if entrada is not None:
+                    self._contar('coalescido')
+                    return entrada['valor'], 'coalescido'
+        try:
+            valor, cacheable = funcion()
+            if cacheable:
+                cache.set(
+                    clave_cache,
+                    {'valor': valor, 'fresco_hasta': time.time() + ttl},
+                    timeout=ttl + obsoleto
+                )
+            self._contar('lider')
+            return valor, 'lider'
+        finally:
+            cache.delete(clave_lock)
+
+
+coalescedor = Coalescedor()
+
+
+def clave_solicitud(request):
+    """Clave de una solicitud segura: host, ruta y parámetros ordenados sin valores vacíos"""
+    parametros = sorted(
+        (nombre, valor)
+        for nombre, valores in request.query_params.lists()
+        for valor in valores
+        if valor != ''
+    )
+    # La versión del contenido (el ETag calculado por condicionales) evita reutilizar un
+    # resultado anterior a la última escritura
+    return f"{request.get_host()}|{request.path}|{parametros}|{getattr(request, 'version_contenido', '')}"
+
+
+def coalescer(vista):
+    """Decorador para acciones GET de un ViewSet que comparte las respuestas 200 idénticas"""
+    @wraps(vista)
+    def envoltura(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return vista(self, request, *args, **kwargs)
+
+        def calcular():
+            response = vista(self, request, *args, **kwargs)
+            return (response.status_code, response.data), response.status_code == 200
+
+        (codigo, datos), origen = coalescedor.ejecutar(clave_solicitud(request), calcular)
+        return Response(datos, status=codigo, headers={'X-Coalescencia': origen})
+    return envoltura
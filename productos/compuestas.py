@@ -0,0 +1,198 @@
+import contextvars
+import io
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections
+from django.urls import Resolver404, resolve
+
+from .condicionales import compartir_validadores, olvidar_validadores
+
+logger = logging.getLogger(__name__)
+
+PREFIJO_PERMITIDO = '/api/productos/'
+RUTAS_EXCLUIDAS = ('/api/productos/eventos/',)
+METODOS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class SolicitudCompuestaInvalida(ValueError):
+    """El cuerpo de /api/batch/ no tiene el formato esperado"""
+
+
+def maximo_partes():
+    """Sub-solicitudes aceptadas por cada llamada a /api/batch/"""
+    return getattr(settings, 'PRODUCTOS_BATCH_MAXIMO', 20)
+
+
+def hilos():
+    """Lecturas de una misma solicitud compuesta que se ejecutan en paralelo"""
+    return max(getattr(settings, 'PRODUCTOS_BATCH_HILOS', 4), 1)
+
+
+def obtener_executor():
+    """Pool de hilos del proceso; se crea en el primer uso para no heredarlo con fork"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=hilos(), thread_name_prefix='batch')
+        return _executor
+
+
+def normalizar(solicitudes):
+    """
+    Valida la lista de sub-solicitudes y retorna [(id, metodo, ruta, query string, datos)].
+
+    La ruta puede traer su query string; "parametros" se agrega a ella.
+    """
+    if not isinstance(solicitudes, list) or not solicitudes:
+        raise SolicitudCompuestaInvalida('"solicitudes" debe ser una lista no vacía')
+    if len(solicitudes) > maximo_partes():
+        raise SolicitudCompuestaInvalida(f'Máximo {maximo_partes()} solicitudes por llamada')
+
+    partes = []
+    for posicion, solicitud in enumerate(solicitudes):
+        if not isinstance(solicitud, dict) or not isinstance(solicitud.get('ruta'), str):
+            raise SolicitudCompuestaInvalida(f'La solicitud {posicion} debe tener una "ruta"')
+        metodo = str(solicitud.get('metodo', 'GET')).upper()
+        if metodo not in METODOS:
+            raise SolicitudCompuestaInvalida(f'Método inválido en la solicitud {posicion}: {metodo}')
+        parametros = solicitud.get('parametros') or {}
+        if not isinstance(parametros, dict):
+            raise SolicitudCompuestaInvalida(f'"parametros" de la solicitud {posicion} debe ser un objeto')
+        url = urlsplit(solicitud['ruta'])
+        query = '&'.join(filter(None, [url.query, urlencode(sorted(parametros.items()), doseq=True)]))
+        partes.append((solicitud.get('id', posicion), metodo, url.path, query, solicitud.get('datos')))
+    return partes
+
+
+def construir_subsolicitud(request, metodo, ruta, query, datos):
+    """
+    Request de Django para una parte, con el host, las cookies y la autenticación del original.
+
+    Los encabezados If-* del original no se copian porque se refieren a /api/batch/.
+    """
+    cuerpo = json.dumps(datos).encode() if datos is not None else b''
+    environ = {
+        clave: valor for clave, valor in request.META.items()
+        if isinstance(valor, str) and clave not in ('CONTENT_TYPE', 'CONTENT_LENGTH')
+        and not clave.startswith('HTTP_IF_')
+    }
+    environ.update({
+        'REQUEST_METHOD': metodo,
+        'PATH_INFO': ruta,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(cuerpo)),
+        'wsgi.input': io.BytesIO(cuerpo),
+        'wsgi.url_scheme': request.scheme,
+    })
+    subsolicitud = WSGIRequest(environ)
+    # La autenticación, la sesión y el CSRF ya se validaron en la solicitud compuesta
+    subsolicitud.user = request.user
+    if hasattr(request, 'session'):
+        subsolicitud.session = request.session
+    subsolicitud._dont_enforce_csrf_checks = True
+    return subsolicitud
+
+
+def _contenido(response):
+    if hasattr(response, 'data'):
+        return response.data
+    if not getattr(response, 'content', b''):
+        return None
+    try:
+        return json.loads(response.content)
+    except ValueError:
+        return response.content.decode(errors='replace')
+
+
+def ejecutar_parte(request, metodo, ruta, query, datos):
+    """Ejecuta una sub-solicitud llamando directo a la vista y retorna su resultado"""
+    inicio = time.perf_counter()
+    if not ruta.startswith(PREFIJO_PERMITIDO) or ruta in RUTAS_EXCLUIDAS:
+        estado, contenido = 400, {'error': f'Solo se aceptan rutas de {PREFIJO_PERMITIDO}'}
+    else:
+        try:
+            coincidencia = resolve(ruta)
+        except Resolver404:
+            estado, contenido = 404, {'error': 'Ruta no encontrada'}
+        else:
+            try:
+                subsolicitud = construir_subsolicitud(request, metodo, ruta, query, datos)
+                response = coincidencia.func(subsolicitud, *coincidencia.args, **coincidencia.kwargs)
+                estado, contenido = response.status_code, _contenido(response)
+            except Exception:
+                logger.exception('Error en la sub-solicitud %s %s', metodo, ruta)
+                estado, contenido = 500, {'error': 'Error interno'}
+    return {
+        'estado': estado,
+        'tiempo_ms': round((time.perf_counter() - inicio) * 1000, 2),
+        'datos': contenido,
+    }
+
+
+def _en_hilo(contexto, *args):
+    # Cada hilo del pool usa su propia conexión; se cierra según CONN_MAX_AGE como al final de un request
+    close_old_connections()
+    try:
+        return contexto.run(ejecutar_parte, *args)
+    finally:
+        close_old_connections()
+
+
+def _ejecutar_lecturas(request, grupo, resultados):
+    """Ejecuta un grupo de GET consecutivos; los idénticos se ejecutan una sola vez"""
+    unicas = {}
+    for posicion, (_, _, ruta, query, _) in grupo:
+        unicas.setdefault((ruta, query), []).append(posicion)
+
+    if hilos() == 1 or len(unicas) == 1:
+        calculados = {clave: ejecutar_parte(request, 'GET', *clave, None) for clave in unicas}
+    else:
+        # Todos los hilos comparten el mismo contexto y con él los validadores ya calculados
+        contexto = contextvars.copy_context()
+        futuros = {
+            clave: obtener_executor().submit(_en_hilo, contexto.copy(), request, 'GET', *clave, None)
+            for clave in unicas
+        }
+        calculados = {clave: futuro.result() for clave, futuro in futuros.items()}
+
+    for clave, posiciones in unicas.items():
+        for orden, posicion in enumerate(posiciones):
+            resultados[posicion] = dict(calculados[clave], compartida=orden > 0)
+
+
+def ejecutar(request, solicitudes):
+    """
+    Ejecuta las sub-solicitudes y retorna sus resultados en el mismo orden.
+
+    Los GET consecutivos se ejecutan en paralelo y los idénticos se resuelven una vez; cualquier
+    otro método se ejecuta solo y en orden, así las lecturas posteriores ven sus cambios.
+    """
+    partes = normalizar(solicitudes)
+    resultados = [None] * len(partes)
+    grupo = []
+    with compartir_validadores():
+        for posicion, parte in enumerate(partes):
+            if parte[1] == 'GET':
+                grupo.append((posicion, parte))
+                continue
+            if grupo:
+                _ejecutar_lecturas(request, grupo, resultados)
+                grupo = []
+            resultados[posicion] = dict(ejecutar_parte(request, *parte[1:]), compartida=False)
+            # Las lecturas siguientes deben ver la nueva versión de los listados
+            olvidar_validadores()
+        if grupo:
+            _ejecutar_lecturas(request, grupo, resultados)
+    return [{'id': parte[0], **resultado} for parte, resultado in zip(partes, resultados)]
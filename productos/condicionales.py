@@ -0,0 +1,149 @@
+import contextvars
+import hashlib
+from contextlib import contextmanager
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .catalogo import obtener_catalogo
+from .models import Producto, umbral_stock_bajo
+
+ENCABEZADOS_CONDICIONALES = (
+    'HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE', 'HTTP_IF_UNMODIFIED_SINCE',
+)
+
+# Agregado de validadores_coleccion compartido por las partes de una solicitud compuesta
+_agregado_compartido = contextvars.ContextVar('agregado_compartido', default=None)
+
+
+def es_condicional(request):
+    """Indica si la solicitud trae algún encabezado If-*"""
+    return any(encabezado in request.META for encabezado in ENCABEZADOS_CONDICIONALES)
+
+
+def calcular_etag(*partes):
+    """ETag fuerte a partir de las partes que identifican la representación"""
+    return '"%s"' % hashlib.sha1('|'.join(str(parte) for parte in partes).encode()).hexdigest()
+
+
+def formato(request):
+    renderer = getattr(request, 'accepted_renderer', None)
+    return renderer.format if renderer else ''
+
+
+def validadores_producto(request, producto_id=None, fecha_actualizacion=None, bloquear=False):
+    """
+    (etag, fecha) de un producto a partir de su fecha_actualizacion.
+
+    Si no se pasa la fecha se lee con una consulta de una sola columna, bloqueando la fila con
+    bloquear=True. Retorna None si el producto no existe o el id no es válido.
+    """
+    if fecha_actualizacion is None:
+        try:
+            producto_id = int(producto_id)
+        except (TypeError, ValueError):
+            return None
+        productos = Producto.objects.select_for_update() if bloquear else Producto.objects
+        fecha_actualizacion = productos.filter(pk=producto_id).values_list(
+            'fecha_actualizacion', flat=True
+        ).first()
+        if fecha_actualizacion is None:
+            return None
+    etag = calcular_etag('producto', producto_id, fecha_actualizacion.isoformat(), umbral_stock_bajo(), formato(request))
+    return etag, fecha_actualizacion
+
+
+def validadores_coleccion(request):
+    """
+    (etag, fecha) de un listado con una sola consulta de max(fecha_actualizacion) y conteo.
+
+    El conteo detecta los productos borrados. Si el catálogo en memoria responde parte del
+    listado su versión también forma parte del ETag, y no se informa fecha porque la instantánea
+    puede ir unos segundos detrás de la base de datos.
+    """
+    compartido = _agregado_compartido.get()
+    agregado = compartido.get('agregado') if compartido is not None else None
+    if agregado is None:
+        agregado = Producto.objects.aggregate(ultima=Max('fecha_actualizacion'), total=Count('id'))
+        if compartido is not None:
+            compartido['agregado'] = agregado
+    ultima = agregado['ultima']
+    parametros = sorted(
+        (nombre, valor)
+        for nombre, valores in request.query_params.lists()
+        for valor in valores
+    )
+    partes = [
+        request.path, parametros, formato(request), umbral_stock_bajo(),
+        ultima.isoformat() if ultima else '', agregado['total'],
+    ]
+    catalogo = obtener_catalogo()
+    if catalogo is not None:
+        partes += [catalogo.marca, len(catalogo.ids)]
+        ultima = None
+    return calcular_etag(*partes), ultima
+
+
+@contextmanager
+def compartir_validadores():
+    """
+    Calcula una sola vez el agregado de validadores_coleccion dentro del bloque.
+
+    Los hilos que ejecutan el bloque con una copia del contexto comparten el mismo valor.
+    """
+    token = _agregado_compartido.set({})
+    try:
+        yield
+    finally:
+        _agregado_compartido.reset(token)
+
+
+def olvidar_validadores():
+    """Descarta el agregado compartido, p. ej. después de una escritura"""
+    compartido = _agregado_compartido.get()
+    if compartido is not None:
+        compartido.clear()
+
+
+def agregar_validadores(response, etag, fecha=None):
+    """Agrega ETag y Last-Modified a una respuesta exitosa"""
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if fecha is not None:
+            response['Last-Modified'] = http_date(fecha.timestamp())
+    return response
+
+
+def respuesta_condicional(request, etag, fecha=None):
+    """304 o 412 según los encabezados If-*, o None si hay que responder normalmente"""
+    return get_conditional_response(
+        request, etag=etag, last_modified=int(fecha.timestamp()) if fecha else None
+    )
+
+
+def condicional(validadores):
+    """
+    Decorador para acciones GET de un ViewSet que responde 304 sin ejecutar la vista.
+
+    `validadores(request)` retorna (etag, fecha), o None si la solicitud no es cacheable; se
+    calculan antes que la respuesta, así que un cambio concurrente solo puede hacer que el ETag sea
+    más viejo que el contenido, nunca al revés.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(self, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return vista(self, request, *args, **kwargs)
+            validados = validadores(request)
+            if validados is None:
+                return vista(self, request, *args, **kwargs)
+            etag, fecha = validados
+            request.version_contenido = etag
+            response = respuesta_condicional(request, etag, fecha)
+            if response is None:
+                response = vista(self, request, *args, **kwargs)
+            return agregar_validadores(response, etag, fecha)
+        return envoltura
+    return decorador
@@ -0,0 +1,87 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+CLAVE_VERSION = 'productos:conteo:version'
+
+
+def version_conteos():
+    """Versión actual de los conteos cacheados; cambia con cada escritura de productos"""
+    cache.add(CLAVE_VERSION, 1, timeout=None)
+    return cache.get(CLAVE_VERSION, 1)
+
+
+def invalidar_conteos():
+    """Descarta los conteos cacheados subiendo la versión"""
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.add(CLAVE_VERSION, 1, timeout=None)
+
+
+def firma_queryset(queryset):
+    """Identifica la consulta por su SQL y parámetros"""
+    sql, params = queryset.query.sql_with_params()
+    return hashlib.sha1(f"{sql}|{params!r}".encode()).hexdigest()
+
+
+def estimar(queryset):
+    """Estimación de filas del planificador; None si la base de datos no la ofrece"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table]
+            )
+            fila = cursor.fetchone()
+            # reltuples es -1 si la tabla nunca fue analizada
+            return fila[0] if fila and fila[0] >= 0 else None
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+def contar(queryset):
+    """
+    Retorna (total, estimado) para un queryset.
+
+    Sobre PRODUCTOS_CONTEO_UMBRAL_ESTIMADO filas se usa la estimación del planificador; por debajo
+    se hace el COUNT(*) exacto. Ambos se cachean por firma de la consulta hasta la siguiente escritura.
+    """
+    clave = f"productos:conteo:{version_conteos()}:{firma_queryset(queryset)}"
+    guardado = cache.get(clave)
+    if guardado is not None:
+        return guardado
+
+    umbral = getattr(settings, 'PRODUCTOS_CONTEO_UMBRAL_ESTIMADO', 100000)
+    estimacion = estimar(queryset)
+    if estimacion is not None and estimacion >= umbral:
+        resultado = (estimacion, True)
+    else:
+        resultado = (queryset.count(), False)
+    cache.set(clave, resultado, timeout=getattr(settings, 'PRODUCTOS_CONTEO_CACHE_SEGUNDOS', 60))
+    return resultado
+
+
+class PaginadorConteoEstimado(Paginator):
+    """Paginator que obtiene el total con contar(): cacheado y estimado en tablas grandes"""
+
+    estimado = False
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        total, self.estimado = contar(self.object_list)
+        return total
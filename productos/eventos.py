@@ -0,0 +1,199 @@
+import asyncio
+import itertools
+import json
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class BackendMemoria:
+    """Backend de eventos que entrega lo publicado a los suscriptores del mismo proceso"""
+
+    # Un backend distribuido lo declara True: los suscriptores de otros procesos no se ven aquí
+    distribuido = False
+
+    def __init__(self):
+        self.entregar = None
+
+    def conectar(self, entregar):
+        """Registra la función del broker que reparte los eventos recibidos"""
+        self.entregar = entregar
+
+    def publicar(self, evento):
+        """Publica un evento; un backend distribuido lo enviaría a los demás procesos"""
+        if self.entregar:
+            self.entregar(evento)
+
+
+class Suscripcion:
+    """Cola acotada de eventos de un cliente conectado"""
+
+    def __init__(self, ids=None, categorias=None, maximo=100):
+        self.loop = asyncio.get_running_loop()
+        self.cola = asyncio.Queue(maxsize=maximo)
+        self.ids = set(ids or [])
+        self.categorias = set(categorias or [])
+        self.perdidos = 0
+
+    def encolar(self, evento):
+        """Encola el evento; debe llamarse desde el event loop de la suscripción"""
+        # Si el cliente no consume a tiempo se descarta el evento más antiguo
+        if self.cola.full():
+            self.cola.get_nowait()
+            self.perdidos += 1
+        self.cola.put_nowait(evento)
+
+    async def siguiente(self, espera=None):
+        """Retorna el siguiente evento o None si se agota la espera"""
+        try:
+            return await asyncio.wait_for(self.cola.get(), timeout=espera)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broker:
+    """Reparte los eventos de productos entre las suscripciones por id y categoría"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.backend.conectar(self._repartir)
+        self._lock = threading.Lock()
+        self._todos = set()
+        self._por_id = {}
+        self._por_categoria = {}
+        self._secuencia = itertools.count(1)
+
+    def suscribir(self, ids=None, categorias=None):
+        """Crea una suscripción; debe llamarse desde el event loop del cliente"""
+        suscripcion = Suscripcion(ids, categorias, getattr(settings, 'PRODUCTOS_EVENTOS_COLA_MAXIMA', 100))
+        with self._lock:
+            if not suscripcion.ids and not suscripcion.categorias:
+                self._todos.add(suscripcion)
+            for producto_id in suscripcion.ids:
+                self._por_id.setdefault(producto_id, set()).add(suscripcion)
+            for categoria in suscripcion.categorias:
+                self._por_categoria.setdefault(categoria, set()).add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        """Elimina una suscripción de todos los índices"""
+        with self._lock:
+            self._todos.discard(suscripcion)
+            for producto_id in suscripcion.ids:
+                self._quitar(self._por_id, producto_id, suscripcion)
+            for categoria in suscripcion.categorias:
+                self._quitar(self._por_categoria, categoria, suscripcion)
+
+    @staticmethod
+    def _quitar(indice, clave, suscripcion):
+        grupo = indice.get(clave)
+        if grupo is not None:
+            grupo.discard(suscripcion)
+            if not grupo:
+                del indice[clave]
+
+    def total_suscripciones(self):
+        """Retorna el número de suscripciones activas"""
+        with self._lock:
+            return len(set().union(self._todos, *self._por_id.values(), *self._por_categoria.values()))
+
+    def hay_destinatarios(self):
+        """Indica si un evento publicado ahora podría llegar a algún suscriptor"""
+        return getattr(self.backend, 'distribuido', False) or self.total_suscripciones() > 0
+
+    def publicar(self, evento):
+        """Publica un evento a través del backend configurado"""
+        evento.setdefault('secuencia', next(self._secuencia))
+        self.backend.publicar(evento)
+
+    def _repartir(self, evento):
+        with self._lock:
+            destinos = set(self._todos)
+            destinos.update(self._por_id.get(evento.get('id'), ()))
+            destinos.update(self._por_categoria.get(evento.get('categoria'), ()))
+        # Una sola llamada entre hilos por event loop, no una por suscriptor
+        por_loop = {}
+        for suscripcion in destinos:
+            por_loop.setdefault(suscripcion.loop, []).append(suscripcion)
+        for loop, grupo in por_loop.items():
+            try:
+                loop.call_soon_threadsafe(_encolar_grupo, grupo, evento)
+            except RuntimeError:
+                # El event loop ya se cerró: sus suscripciones quedaron huérfanas
+                for suscripcion in grupo:
+                    self.cancelar(suscripcion)
+
+
+def _encolar_grupo(suscripciones, evento):
+    for suscripcion in suscripciones:
+        suscripcion.encolar(evento)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def obtener_broker():
+    """Retorna el broker del proceso con el backend de PRODUCTOS_EVENTOS_BACKEND"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = getattr(settings, 'PRODUCTOS_EVENTOS_BACKEND', 'productos.eventos.BackendMemoria')
+                _broker = Broker(import_string(backend)())
+    return _broker
+
+
+CAMPOS_EVENTO = ('id', 'codigo_producto', 'categoria', 'stock', 'activo', 'estado_stock')
+
+
+def evento_producto(producto, tipo):
+    """Construye el evento publicado para un producto"""
+    return {
+        'tipo': tipo,
+        'id': producto.id,
+        'codigo_producto': producto.codigo_producto,
+        'categoria': producto.categoria,
+        'stock': producto.stock,
+        'activo': producto.activo,
+        'estado_stock': producto.estado_stock,
+    }
+
+
+def notificar_cambios(tipo, productos=None, ids=None):
+    """
+    Publica eventos de cambio cuando la transacción actual se confirma.
+
+    Es el punto por el que pasan todas las escrituras de productos, por eso también invalida
+    los conteos cacheados.
+
+    Acepta instancias de Producto o, para actualizaciones con queryset.update(), una lista de ids.
+    Sin suscriptores que puedan recibirlos no se construyen los eventos ni se leen los productos.
+    """
+    from .models import Producto
+    from .conteo import invalidar_conteos
+
+    def publicar():
+        invalidar_conteos()
+        broker = obtener_broker()
+        if not broker.hay_destinatarios():
+            return
+        if productos is not None:
+            eventos = [evento_producto(producto, tipo) for producto in productos]
+        else:
+            # Solo las columnas del evento, no la fila completa
+            filas = Producto.objects.con_estado_stock().filter(pk__in=list(ids or [])).values(*CAMPOS_EVENTO)
+            eventos = [{'tipo': tipo, **fila} for fila in filas]
+        for evento in eventos:
+            broker.publicar(evento)
+
+    transaction.on_commit(publicar)
+
+
+def formatear_sse(evento):
+    """Serializa un evento en formato Server-Sent Events"""
+    datos = json.dumps(evento, cls=DjangoJSONEncoder)
+    return f"id: {evento.get('secuencia', '')}\nevent: producto\ndata: {datos}\n\n"
@@ -0,0 +1,33 @@
+import django_filters
+from rest_framework.filters import OrderingFilter
+from .models import Producto, EstadoStock
+
+
+class ProductoFilter(django_filters.FilterSet):
+    """Filtros del listado de productos"""
+    estado_stock = django_filters.ChoiceFilter(
+        choices=EstadoStock.choices,
+        method='filtrar_estado_stock'
+    )
+
+    class Meta:
+        model = Producto
+        fields = ['activo', 'stock', 'categoria', 'estado_stock']
+
+    def filtrar_estado_stock(self, queryset, name, value):
+        """Traduce el estado a condiciones sobre activo y stock para usar el índice"""
+        return queryset.por_estado_stock(value)
+
+
+class OrdenamientoProductos(OrderingFilter):
+    """OrderingFilter que ordena estado_stock por su nivel (ver NIVEL_ESTADO_STOCK) y no por el texto"""
+    equivalentes = {'estado_stock': 'nivel_stock'}
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        return [
+            ('-' if campo.startswith('-') else '') + self.equivalentes.get(campo.lstrip('-'), campo.lstrip('-'))
+            for campo in ordering
+        ]
@@ -0,0 +1,132 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Producto, Almacen, StockAlmacen, MovimientoStock
+from .eventos import notificar_cambios
+from .movimientos import lote_movimientos, registrar_movimiento
+
+
+class StockInsuficiente(ValueError):
+    """Un movimiento dejaría stock negativo en un almacén"""
+
+
+class AlmacenInvalido(ValueError):
+    """El almacén indicado no existe, o está inactivo y el movimiento le suma stock"""
+
+
+def mover_stock(producto_id, movimientos, tipo=MovimientoStock.Tipo.AJUSTE):
+    """
+    Aplica varios movimientos de stock de un producto en una sola transacción.
+
+    movimientos: lista de (almacen_id, cantidad) con cantidades positivas o negativas.
+    Actualiza las filas por almacén y suma la diferencia neta a Producto.stock, de modo que el
+    total nunca necesita agregarse en las lecturas. Cada movimiento queda en el registro de
+    stock con el tipo indicado. Retorna (producto, {almacen_id: cantidad}).
+    """
+    deltas = defaultdict(int)
+    for almacen_id, cantidad in movimientos:
+        deltas[int(almacen_id)] += int(cantidad)
+
+    with transaction.atomic(), lote_movimientos():
+        # Bloquear el producto serializa los movimientos concurrentes sobre el mismo total
+        producto = Producto.objects.select_for_update().get(pk=producto_id)
+        # Un almacén inactivo no recibe stock, pero el que le quedó se puede sacar
+        almacenes = dict(Almacen.objects.filter(pk__in=deltas).values_list('id', 'activo'))
+        invalidos = sorted(
+            almacen_id for almacen_id, delta in deltas.items()
+            if almacen_id not in almacenes or (delta > 0 and not almacenes[almacen_id])
+        )
+        if invalidos:
+            raise AlmacenInvalido(f"Almacenes inválidos o inactivos: {', '.join(map(str, invalidos))}")
+
+        existentes = {
+            s.almacen_id: s
+            for s in StockAlmacen.objects.select_for_update().filter(producto=producto, almacen_id__in=deltas)
+        }
+        nuevos, modificados = [], []
+        for almacen_id, delta in deltas.items():
+            fila = existentes.get(almacen_id)
+            actual = fila.cantidad if fila else 0
+            if actual + delta < 0:
+                raise StockInsuficiente(
+                    f"Stock insuficiente en el almacén {almacen_id}: hay {actual}, se piden {-delta}"
+                )
+            if fila is None:
+                nuevos.append(StockAlmacen(producto=producto, almacen_id=almacen_id, cantidad=delta))
+            else:
+                fila.cantidad = actual + delta
+                fila.fecha_actualizacion = timezone.now()
+                modificados.append(fila)
+
+        StockAlmacen.objects.bulk_create(nuevos)
+        StockAlmacen.objects.bulk_update(modificados, ['cantidad', 'fecha_actualizacion'])
+
+        total = sum(deltas.values())
+        if total:
+            Producto.objects.filter(pk=producto.pk).update(
+                stock=F('stock') + total, fecha_actualizacion=timezone.now()
+            )
+            producto.refresh_from_db(fields=['stock', 'fecha_actualizacion'])
+        for almacen_id, delta in deltas.items():
+            registrar_movimiento(producto.pk, delta, tipo, stock_resultante=producto.stock, almacen_id=almacen_id)
+        notificar_cambios('actualizado', productos=[producto])
+
+    saldos = {fila.almacen_id: fila.cantidad for fila in nuevos + modificados}
+    return producto, saldos
+
+
+def validar_stock_total(producto_id, stock):
+    """
+    Verifica que un nuevo total no quede por debajo del stock asignado a almacenes.
+
+    Dentro de una transacción bloquea el producto hasta que termine, igual que mover_stock, para
+    que nadie asigne stock entre la verificación y el guardado.
+    """
+    productos = Producto.objects.filter(pk=producto_id)
+    if not transaction.get_autocommit():
+        productos = productos.select_for_update()
+    asignado = productos.con_stock_asignado().values_list('stock_asignado', flat=True).first() or 0
+    if stock < asignado:
+        raise StockInsuficiente(
+            f"El stock total no puede ser menor que el asignado a almacenes ({asignado})"
+        )
+
+
+def ajustar_stock_sin_almacen(producto_id, cantidad, tipo=MovimientoStock.Tipo.AJUSTE):
+    """
+    Suma `cantidad` al stock del producto que no está asignado a ningún almacén.
+
+    El stock sin almacén es el total menos la suma por almacén, así que una resta nunca puede
+    tomar unidades de un almacén. Retorna el producto actualizado.
+    """
+    with transaction.atomic(), lote_movimientos():
+        producto = Producto.objects.select_for_update().con_stock_asignado().get(pk=producto_id)
+        sin_almacen = producto.stock - producto.stock_asignado
+        if sin_almacen + cantidad < 0:
+            raise StockInsuficiente(
+                f"Stock sin almacén insuficiente: hay {sin_almacen}, se piden {-cantidad}"
+            )
+        if cantidad:
+            producto.stock += cantidad
+            producto.save(update_fields=['stock', 'fecha_actualizacion'])
+            registrar_movimiento(producto.pk, cantidad, tipo, stock_resultante=producto.stock)
+    return producto
+
+
+def transferir_stock(producto_id, transferencias):
+    """
+    Mueve stock entre almacenes sin cambiar el total del producto.
+
+    transferencias: lista de (origen_id, destino_id, cantidad) con cantidades positivas.
+    """
+    movimientos = []
+    for origen, destino, cantidad in transferencias:
+        if int(cantidad) <= 0:
+            raise ValueError("La cantidad a transferir debe ser mayor a 0")
+        if int(origen) == int(destino):
+            raise ValueError("El almacén de origen y destino deben ser distintos")
+        movimientos += [(origen, -int(cantidad)), (destino, int(cantidad))]
+    return mover_stock(producto_id, movimientos, MovimientoStock.Tipo.TRANSFERENCIA)
@@ -0,0 +1,77 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from productos.catalogo import CatalogoEnMemoria
+from productos.models import Producto, EstadoStock
+from productos.serializers import ProductoSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compara la latencia del catálogo en memoria con la del ORM y reporta su memoria'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=100,
+            help='Veces que se ejecuta cada consulta (default: 100)'
+        )
+
+    def handle(self, *args, **options):
+        repeticiones = options['repeticiones']
+        activos = Producto.objects.con_estado_stock().filter(activo=True)
+
+        inicio = time.perf_counter()
+        catalogo = CatalogoEnMemoria()
+        catalogo.refrescar()
+        carga = time.perf_counter() - inicio
+
+        consultas = {
+            'activos': (
+                lambda: ProductoSerializer(activos.all(), many=True).data,
+                lambda: catalogo.consultar(),
+            ),
+            'con_stock': (
+                lambda: ProductoSerializer(activos.filter(stock__gt=0), many=True).data,
+                lambda: catalogo.consultar(con_stock=True),
+            ),
+            'stock_bajo': (
+                lambda: ProductoSerializer(activos.por_estado_stock(EstadoStock.STOCK_BAJO), many=True).data,
+                lambda: catalogo.consultar(estado=EstadoStock.STOCK_BAJO),
+            ),
+            'top 5 -precio': (
+                lambda: ProductoSerializer(activos.order_by('-precio')[:5], many=True).data,
+                lambda: catalogo.consultar(ordenar='-precio', limite=5),
+            ),
+        }
+
+        self.stdout.write(self.style.SUCCESS('\n📊 Catálogo en memoria vs ORM (ms, p50 / p99):'))
+        for nombre, (orm, memoria) in consultas.items():
+            tiempos_orm = self.medir(orm, repeticiones)
+            tiempos_memoria = self.medir(memoria, repeticiones)
+            self.stdout.write(
+                f'   {nombre:<15} ORM {self.percentil(tiempos_orm, 50):8.3f} / {self.percentil(tiempos_orm, 99):8.3f}'
+                f'   memoria {self.percentil(tiempos_memoria, 50):8.3f} / {self.percentil(tiempos_memoria, 99):8.3f}'
+            )
+
+        reporte = catalogo.reporte_memoria()
+        self.stdout.write(self.style.SUCCESS(f'\n📦 Memoria de la instantánea ({reporte.pop("productos")} productos, carga {carga * 1000:.1f} ms):'))
+        total = reporte.pop('total')
+        for columna, tamano in reporte.items():
+            self.stdout.write(f'   {columna:<15} {tamano / 1024:10.1f} KiB')
+        self.stdout.write(f'   {"total":<15} {total / 1024:10.1f} KiB')
+
+    def medir(self, funcion, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return tiempos
+
+    def percentil(self, tiempos, percentil):
+        if len(tiempos) < 2:
+            return tiempos[0]
+        return statistics.quantiles(tiempos, n=100)[percentil - 1] if percentil < 100 else max(tiempos)
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from productos.eventos import Broker, BackendMemoria
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo del broker de eventos con muchos suscriptores inactivos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--suscriptores',
+            type=int,
+            default=5000,
+            help='Número de suscriptores inactivos (default: 5000)'
+        )
+        parser.add_argument(
+            '--eventos',
+            type=int,
+            default=100,
+            help='Número de eventos publicados (default: 100)'
+        )
+
+    def handle(self, *args, **options):
+        asyncio.run(self.medir(options['suscriptores'], options['eventos']))
+
+    async def medir(self, total_suscriptores, total_eventos):
+        broker = Broker(BackendMemoria())
+
+        # Memoria de suscriptores esperando eventos, la mitad filtrados por producto
+        tracemalloc.start()
+        antes = tracemalloc.get_traced_memory()[0]
+        suscripciones = [
+            broker.suscribir(ids=[i % 100] if i % 2 else None)
+            for i in range(total_suscriptores)
+        ]
+        tareas = [asyncio.create_task(s.cola.get()) for s in suscripciones]
+        await asyncio.sleep(0)
+        memoria = tracemalloc.get_traced_memory()[0] - antes
+        tracemalloc.stop()
+
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+
+        # Publicación desde otro hilo, como lo hacen las vistas síncronas
+        esperados = sum(
+            len(broker._todos) + len(broker._por_id.get(n % 100, ()))
+            for n in range(total_eventos)
+        )
+        inicio = time.perf_counter()
+        hilo = threading.Thread(target=lambda: [
+            broker.publicar({'tipo': 'actualizado', 'id': n % 100, 'categoria': None})
+            for n in range(total_eventos)
+        ])
+        hilo.start()
+        await asyncio.to_thread(hilo.join)
+        publicado = time.perf_counter() - inicio
+        while sum(s.cola.qsize() + s.perdidos for s in suscripciones) < esperados:
+            await asyncio.sleep(0.001)
+        entregado = time.perf_counter() - inicio
+
+        for suscripcion in suscripciones:
+            broker.cancelar(suscripcion)
+
+        self.stdout.write(self.style.SUCCESS('\n📊 Broker de eventos:'))
+        self.stdout.write(f'   Suscriptores inactivos: {total_suscriptores}')
+        self.stdout.write(f'   Memoria por suscriptor: {memoria / total_suscriptores:,.0f} bytes')
+        self.stdout.write(f'   Eventos publicados: {total_eventos} ({esperados} entregas)')
+        self.stdout.write(f'   Tiempo de publicación: {publicado * 1000:.1f} ms')
+        self.stdout.write(f'   Tiempo hasta entregar todo: {entregado * 1000:.1f} ms')
+        self.stdout.write(f'   Entregas por segundo: {esperados / entregado:,.0f}')
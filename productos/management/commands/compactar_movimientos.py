@@ -0,0 +1,42 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from productos.movimientos import compactar, parsear_fecha
+
+
+class Command(BaseCommand):
+    help = 'Guarda un snapshot del stock por producto y opcionalmente elimina los movimientos cubiertos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hasta',
+            type=str,
+            help='Fecha u hora de corte (default: inicio del día de hoy)'
+        )
+        parser.add_argument(
+            '--eliminar',
+            action='store_true',
+            help='Elimina los movimientos anteriores al corte una vez guardado el snapshot'
+        )
+
+    def handle(self, *args, **options):
+        hasta = self.fecha_corte(options['hasta'])
+        try:
+            creados = compactar(hasta, eliminar=options['eliminar'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if creados:
+            self.stdout.write(self.style.SUCCESS(f'Snapshot al {hasta:%Y-%m-%d %H:%M} guardado para {creados} productos'))
+        else:
+            self.stdout.write(f'Ya existía un snapshot al {hasta:%Y-%m-%d %H:%M}; no se hizo nada')
+
+    def fecha_corte(self, valor):
+        if not valor:
+            return timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+        try:
+            return parsear_fecha(valor)
+        except ValueError as e:
+            raise CommandError(str(e))
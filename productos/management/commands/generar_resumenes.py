@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from productos.models import ResumenCategoria
+from productos.resumenes import generar_resumenes
+
+
+class Command(BaseCommand):
+    help = 'Guarda los agregados por categoría del día (y opcionalmente de la hora) actual'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--periodo',
+            choices=[p.value for p in ResumenCategoria.Periodo] + ['ambos'],
+            default=ResumenCategoria.Periodo.DIA.value,
+            help='Periodo del resumen: dia, hora o ambos (default: dia)'
+        )
+
+    def handle(self, *args, **options):
+        periodos = [p.value for p in ResumenCategoria.Periodo] if options['periodo'] == 'ambos' else [options['periodo']]
+        for periodo in periodos:
+            fecha, filas, recalculado = generar_resumenes(periodo)
+            origen = 'calculado desde los productos' if recalculado else 'sin cambios, copiado del resumen anterior'
+            self.stdout.write(self.style.SUCCESS(
+                f'Resumen por {periodo} del {fecha:%Y-%m-%d %H:%M}: {filas} categorías ({origen})'
+            ))
@@ -0,0 +1,74 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from productos.tareas import (
+    reclamar_siguiente, ejecutar_tarea, renovar_latidos, recuperar_vencidas, vencimiento
+)
+
+
+class Command(BaseCommand):
+    help = 'Procesa las tareas en segundo plano encoladas en la base de datos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hilos',
+            type=int,
+            default=4,
+            help='Número de tareas ejecutadas en paralelo (default: 4)'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=1.0,
+            help='Segundos de espera cuando no hay tareas pendientes (default: 1)'
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesa las tareas pendientes y termina'
+        )
+
+    def handle(self, *args, **options):
+        hilos = options['hilos']
+        self.stdout.write(self.style.SUCCESS(f'Worker de tareas iniciado con {hilos} hilos'))
+
+        en_curso = {}
+        ultimo_latido = 0
+        with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+            try:
+                while True:
+                    # Señal de vida de las tareas en curso y rescate de las de workers caídos
+                    if time.monotonic() - ultimo_latido >= vencimiento() / 3:
+                        close_old_connections()
+                        renovar_latidos(list(en_curso.values()))
+                        reencoladas, fallidas = recuperar_vencidas()
+                        if reencoladas or fallidas:
+                            self.stdout.write(self.style.WARNING(
+                                f'Tareas abandonadas: {reencoladas} reencoladas, {fallidas} fallidas'
+                            ))
+                        ultimo_latido = time.monotonic()
+
+                    # Reclamar tareas mientras haya hilos libres
+                    while len(en_curso) < hilos:
+                        close_old_connections()
+                        tarea = reclamar_siguiente()
+                        if tarea is None:
+                            break
+                        self.stdout.write(f'Ejecutando {tarea}')
+                        en_curso[ejecutor.submit(ejecutar_tarea, tarea)] = tarea.pk
+
+                    if en_curso:
+                        terminadas, _ = wait(en_curso, timeout=options['intervalo'], return_when=FIRST_COMPLETED)
+                        for futuro in terminadas:
+                            del en_curso[futuro]
+                    elif options['una_vez']:
+                        break
+                    else:
+                        time.sleep(options['intervalo'])
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.WARNING('Deteniendo worker, esperando tareas en curso...'))
+
+        self.stdout.write(self.style.SUCCESS('Worker de tareas detenido'))
@@ -0,0 +1,119 @@
+import multiprocessing
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Inicia el servidor de producción (gunicorn) con la aplicación precargada y las caches calientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bind',
+            default=f"0.0.0.0:{os.environ.get('PORT', '10000')}",
+            help='Dirección de escucha (default: 0.0.0.0:$PORT o 0.0.0.0:10000)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=int(os.environ.get('WEB_CONCURRENCY', 0)) or multiprocessing.cpu_count() * 2 + 1,
+            help='Procesos worker (default: $WEB_CONCURRENCY o 2 × CPUs + 1)'
+        )
+        parser.add_argument(
+            '--hilos',
+            type=int,
+            default=4,
+            help='Hilos por worker WSGI; se ignora con --asgi (default: 4)'
+        )
+        parser.add_argument(
+            '--asgi',
+            action='store_true',
+            help='Sirve la aplicación ASGI con workers de uvicorn; necesario para /api/productos/eventos/'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=int,
+            default=30,
+            help='Segundos sin respuesta antes de reiniciar un worker (default: 30)'
+        )
+        parser.add_argument(
+            '--sin-calentar',
+            action='store_true',
+            help='No precalienta rutas, catálogo, índice ni conteos antes de aceptar tráfico'
+        )
+        parser.add_argument(
+            '--debug',
+            action='store_true',
+            help='Mantiene DEBUG del entorno; por defecto se desactiva en este modo'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        try:
+            from gunicorn.app.base import BaseApplication
+        except ImportError:
+            raise CommandError('gunicorn no está instalado; instálalo con "pip install gunicorn"')
+
+        if not options['debug']:
+            # Sin DEBUG no se guardan en memoria las consultas SQL de cada request
+            settings.DEBUG = False
+
+        clase_worker = None
+        if options['asgi']:
+            clase_worker = self.clase_worker_asgi()
+
+        comando = self
+
+        class Servidor(BaseApplication):
+            def load_config(self):
+                self.cfg.set('bind', [options['bind']])
+                self.cfg.set('workers', options['workers'])
+                if clase_worker:
+                    self.cfg.set('worker_class', clase_worker)
+                else:
+                    self.cfg.set('threads', options['hilos'])
+                self.cfg.set('timeout', options['timeout'])
+                # La aplicación se carga una vez en el maestro y los workers la heredan con fork
+                self.cfg.set('preload_app', True)
+                self.cfg.set('accesslog', '-')
+                self.cfg.set('when_ready', lambda servidor: comando.listo(inicio, options['asgi']))
+
+            def load(self):
+                return comando.cargar_aplicacion(options)
+
+        Servidor().run()
+
+    def clase_worker_asgi(self):
+        """Worker de uvicorn para gunicorn, del paquete uvicorn-worker o del propio uvicorn"""
+        for modulo in ('uvicorn_worker', 'uvicorn.workers'):
+            try:
+                __import__(modulo)
+            except ImportError:
+                continue
+            return f'{modulo}.UvicornWorker'
+        raise CommandError('--asgi requiere uvicorn; instálalo con "pip install uvicorn uvicorn-worker"')
+
+    def cargar_aplicacion(self, options):
+        from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler, StaticFilesHandler
+        from django.core.asgi import get_asgi_application
+        from django.core.wsgi import get_wsgi_application
+        from productos.arranque import calentar, preparar_fork
+
+        # Sin servidor de estáticos aparte, Django sirve los del admin como lo hacía runserver
+        aplicacion = StaticFilesHandler(get_wsgi_application())
+        if not options['sin_calentar']:
+            # El calentamiento hace solicitudes internas síncronas también en modo ASGI
+            for paso, segundos in calentar(aplicacion):
+                self.stdout.write(f'  {paso}: {segundos * 1000:.0f} ms')
+        if options['asgi']:
+            aplicacion = ASGIStaticFilesHandler(get_asgi_application())
+        preparar_fork()
+        return aplicacion
+
+    def listo(self, inicio, asgi=False):
+        self.stdout.write(self.style.SUCCESS(
+            f'Servidor listo en {time.perf_counter() - inicio:.2f} s '
+            f'(DEBUG={settings.DEBUG}, {"ASGI" if asgi else "WSGI"})'
+        ))
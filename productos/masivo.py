@@ -0,0 +1,146 @@
+from decimal import ROUND_DOWN, Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, F, Value
+from django.db.models.functions import Cast, Greatest, Round
+from django.utils import timezone
+
+from .eventos import notificar_cambios
+from .models import Producto, MovimientoStock
+from .movimientos import lote_movimientos, registrar_movimiento
+
+# Operación -> (requiere valor, tipo de evento publicado)
+OPERACIONES = {
+    'activar': (False, 'actualizado'),
+    'desactivar': (False, 'desactivado'),
+    'eliminar': (False, 'desactivado'),
+    'fijar_stock': (True, 'actualizado'),
+    'ajustar_stock': (True, 'actualizado'),
+    'precio_porcentaje': (True, 'actualizado'),
+}
+
+# Límites de las columnas: stock es un entero de 32 bits y precio tiene max_digits=10, decimal_places=2
+STOCK_MAXIMO = 2147483647
+PRECIO_MAXIMO = Decimal('99999999.99')
+PORCENTAJE_MAXIMO = 1000
+
+
+class OperacionInvalida(ValueError):
+    """La operación masiva o su valor no son válidos"""
+
+
+def tamano_lote():
+    """Productos modificados por cada UPDATE de una operación masiva"""
+    return getattr(settings, 'PRODUCTOS_MASIVO_LOTE', 1000)
+
+
+def validar_valor(operacion, valor):
+    """Convierte y valida el valor de la operación"""
+    if operacion not in OPERACIONES:
+        raise OperacionInvalida(
+            f"Operación inválida: {operacion}. Opciones: {', '.join(OPERACIONES)}"
+        )
+    if not OPERACIONES[operacion][0]:
+        return None
+    if valor is None or valor == '':
+        raise OperacionInvalida(f"La operación {operacion} requiere un valor")
+    try:
+        if operacion == 'precio_porcentaje':
+            valor = Decimal(str(valor))
+            if not valor.is_finite():
+                raise InvalidOperation
+        else:
+            valor = int(valor)
+    except (InvalidOperation, TypeError, ValueError):
+        raise OperacionInvalida("El valor debe ser numérico")
+    if operacion == 'fijar_stock' and not 0 <= valor <= STOCK_MAXIMO:
+        raise OperacionInvalida(f"El stock debe estar entre 0 y {STOCK_MAXIMO}")
+    if operacion == 'ajustar_stock' and abs(valor) > STOCK_MAXIMO:
+        raise OperacionInvalida(f"El ajuste debe estar entre -{STOCK_MAXIMO} y {STOCK_MAXIMO}")
+    if operacion == 'precio_porcentaje':
+        if not -100 < valor <= PORCENTAJE_MAXIMO:
+            raise OperacionInvalida(f"El porcentaje debe ser mayor a -100 y como máximo {PORCENTAJE_MAXIMO}")
+        # El factor del UPDATE tiene seis decimales
+        valor = valor.quantize(Decimal('0.0001'))
+    return valor
+
+
+def filas_que_cambian(queryset, operacion, valor):
+    """Restringe el queryset a los productos que la operación modificaría"""
+    if operacion == 'activar':
+        return queryset.filter(activo=False)
+    if operacion in ('desactivar', 'eliminar'):
+        return queryset.filter(activo=True)
+    # Los productos cuyo total quedaría por debajo del stock asignado a almacenes no se modifican
+    if operacion == 'fijar_stock':
+        return queryset.exclude(stock=valor).con_stock_asignado().filter(stock_asignado__lte=valor)
+    if operacion == 'ajustar_stock':
+        if not valor:
+            return queryset.none()
+        # Tampoco los que se saldrían del rango de la columna
+        if valor > 0:
+            queryset = queryset.filter(stock__lte=STOCK_MAXIMO - valor)
+        return queryset.con_stock_asignado().filter(stock__gte=F('stock_asignado') - valor)
+    if not valor:
+        return queryset.none()
+    if valor > 0:
+        # Ni los que superarían el precio máximo
+        return queryset.filter(precio__lte=(PRECIO_MAXIMO / (1 + valor / 100)).quantize(Decimal('0.01'), ROUND_DOWN))
+    return queryset
+
+
+def valores_update(operacion, valor):
+    """Columnas del UPDATE de cada operación"""
+    if operacion == 'activar':
+        return {'activo': True}
+    if operacion in ('desactivar', 'eliminar'):
+        return {'activo': False}
+    if operacion == 'fijar_stock':
+        return {'stock': valor}
+    if operacion == 'ajustar_stock':
+        return {'stock': F('stock') + valor}
+    factor = Value(1 + valor / 100, output_field=DecimalField(max_digits=12, decimal_places=6))
+    return {'precio': Cast(
+        Greatest(Round(F('precio') * factor, 2), Value(Decimal('0.01'))),
+        DecimalField(max_digits=10, decimal_places=2)
+    )}
+
+
+def aplicar(queryset, operacion, valor=None, simulacion=False):
+    """
+    Aplica una operación a todos los productos del queryset con un UPDATE por lote.
+
+    Los lotes se recorren por id, así que la memoria no depende del tamaño del conjunto.
+    Con simulacion=True solo cuenta los productos que cambiarían. Retorna la cantidad de
+    productos afectados.
+    """
+    valor = validar_valor(operacion, valor)
+    candidatos = filas_que_cambian(queryset.order_by(), operacion, valor)
+    if simulacion:
+        return candidatos.count()
+
+    modifica_stock = operacion in ('fijar_stock', 'ajustar_stock')
+    tipo_evento = OPERACIONES[operacion][1]
+    afectados, ultimo = 0, 0
+    while True:
+        with transaction.atomic(), lote_movimientos():
+            lote = candidatos.filter(pk__gt=ultimo).order_by('pk')
+            if modifica_stock:
+                # Se bloquean las filas para registrar el movimiento exacto de cada producto
+                filas = list(lote.select_for_update().values_list('pk', 'stock')[:tamano_lote()])
+            else:
+                filas = [(pk, None) for pk in lote.values_list('pk', flat=True)[:tamano_lote()]]
+            if not filas:
+                break
+            ids = [pk for pk, _ in filas]
+            afectados += Producto.objects.filter(pk__in=ids).update(
+                fecha_actualizacion=timezone.now(), **valores_update(operacion, valor)
+            )
+            if modifica_stock:
+                for pk, stock in filas:
+                    nuevo = valor if operacion == 'fijar_stock' else stock + valor
+                    registrar_movimiento(pk, nuevo - stock, MovimientoStock.Tipo.MASIVO, stock_resultante=nuevo)
+            notificar_cambios(tipo_evento, ids=ids)
+        ultimo = ids[-1]
+    return afectados
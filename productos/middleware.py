@@ -0,0 +1,22 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .movimientos import lote_movimientos
+
+
+class LoteMovimientosMiddleware:
+    """Escribe con un solo INSERT los movimientos de stock registrados durante un request"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            # Las vistas asíncronas (eventos) no modifican stock
+            return self.get_response(request)
+        with lote_movimientos():
+            return self.get_response(request)
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['activo', 'stock'], name='productos_p_activo_399673_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0003_tarea'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['fecha_actualizacion', 'id'], name='productos_p_fecha_a_9ceae7_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:11
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0004_producto_fecha_actualizacion_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(django.db.models.functions.text.Lower('nombre'), name='producto_nombre_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:16
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0005_producto_nombre_lower_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Almacen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, unique=True, verbose_name='Nombre del Almacén')),
+                ('codigo', models.CharField(max_length=20, unique=True, verbose_name='Código de Almacén')),
+                ('activo', models.BooleanField(default=True, verbose_name='Activo')),
+            ],
+            options={
+                'verbose_name': 'Almacén',
+                'verbose_name_plural': 'Almacenes',
+                'ordering': ['nombre'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockAlmacen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0, message='El stock no puede ser negativo')], verbose_name='Cantidad')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')),
+                ('almacen', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stocks', to='productos.almacen', verbose_name='Almacén')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stocks_almacen', to='productos.producto', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Stock por Almacén',
+                'verbose_name_plural': 'Stock por Almacén',
+                'indexes': [models.Index(fields=['almacen', 'producto'], name='productos_s_almacen_86eeaf_idx')],
+                'constraints': [models.UniqueConstraint(fields=('producto', 'almacen'), name='stock_almacen_producto_almacen_unico'), models.CheckConstraint(condition=models.Q(('cantidad__gte', 0)), name='stock_almacen_cantidad_no_negativa')],
+            },
+        ),
+    ]
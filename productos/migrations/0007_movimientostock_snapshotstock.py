@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0006_almacen_stockalmacen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.IntegerField(verbose_name='Cantidad')),
+                ('stock_resultante', models.IntegerField(blank=True, null=True, verbose_name='Stock Resultante')),
+                ('tipo', models.CharField(choices=[('inicial', 'Stock inicial'), ('ajuste', 'Ajuste'), ('transferencia', 'Transferencia'), ('masivo', 'Operación masiva')], default='ajuste', max_length=20, verbose_name='Tipo')),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha')),
+                ('almacen', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movimientos', to='productos.almacen', verbose_name='Almacén')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='productos.producto', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Stock',
+                'verbose_name_plural': 'Movimientos de Stock',
+                'ordering': ['-fecha', '-id'],
+                'indexes': [models.Index(fields=['producto', 'fecha'], name='productos_m_product_21750f_idx'), models.Index(fields=['fecha'], name='productos_m_fecha_4cdfe4_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SnapshotStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(verbose_name='Fecha')),
+                ('stock', models.IntegerField(verbose_name='Stock')),
+                ('entradas', models.BigIntegerField(default=0, verbose_name='Entradas Acumuladas')),
+                ('salidas', models.BigIntegerField(default=0, verbose_name='Salidas Acumuladas')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots_stock', to='productos.producto', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Snapshot de Stock',
+                'verbose_name_plural': 'Snapshots de Stock',
+                'ordering': ['-fecha'],
+                'indexes': [models.Index(fields=['fecha'], name='productos_s_fecha_995f47_idx')],
+                'constraints': [models.UniqueConstraint(fields=('producto', 'fecha'), name='snapshot_stock_producto_fecha_unico')],
+            },
+        ),
+    ]
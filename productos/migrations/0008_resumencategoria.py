@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0007_movimientostock_snapshotstock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenCategoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.CharField(choices=[('dia', 'Día'), ('hora', 'Hora')], max_length=4, verbose_name='Periodo')),
+                ('fecha', models.DateTimeField(verbose_name='Inicio del Periodo')),
+                ('categoria', models.CharField(blank=True, default='', max_length=50, verbose_name='Categoría')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total de Productos')),
+                ('activos', models.PositiveIntegerField(default=0, verbose_name='Productos Activos')),
+                ('sin_stock', models.PositiveIntegerField(default=0, verbose_name='Productos sin Stock')),
+                ('stock_bajo', models.PositiveIntegerField(default=0, verbose_name='Productos con Stock Bajo')),
+                ('unidades', models.BigIntegerField(default=0, verbose_name='Unidades en Stock')),
+                ('suma_precios', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Suma de Precios Activos')),
+                ('fecha_calculo', models.DateTimeField(verbose_name='Fecha de Cálculo')),
+            ],
+            options={
+                'verbose_name': 'Resumen por Categoría',
+                'verbose_name_plural': 'Resúmenes por Categoría',
+                'ordering': ['periodo', 'fecha', 'categoria'],
+                'indexes': [models.Index(fields=['periodo', 'categoria', 'fecha'], name='productos_r_periodo_a0d83c_idx')],
+                'constraints': [models.UniqueConstraint(fields=('periodo', 'fecha', 'categoria'), name='resumen_categoria_periodo_fecha_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0008_resumencategoria'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='producto',
+            constraint=models.CheckConstraint(condition=models.Q(('stock__gte', 0)), name='producto_stock_no_negativo'),
+        ),
+    ]
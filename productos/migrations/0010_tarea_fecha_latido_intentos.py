@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0009_producto_stock_no_negativo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tarea',
+            name='fecha_latido',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Última Señal del Worker'),
+        ),
+        migrations.AddField(
+            model_name='tarea',
+            name='intentos',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Intentos'),
+        ),
+    ]
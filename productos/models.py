@@ -1,12 +1,88 @@
 from django.db import models
 from typing import Any
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.core.exceptions import ValidationError
+from django.db.models import Case, When, Value, Q, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Lower
 from decimal import Decimal
+from django.utils import timezone
 
 # Create your models here.
 
+def umbral_stock_bajo():
+    """Retorna el umbral configurado a partir del cual el stock se considera bajo"""
+    return getattr(settings, 'PRODUCTOS_UMBRAL_STOCK_BAJO', 5)
+
+
+class EstadoStock(models.TextChoices):
+    INACTIVO = "Inactivo", "Inactivo"
+    SIN_STOCK = "Sin stock", "Sin stock"
+    STOCK_BAJO = "Stock bajo", "Stock bajo"
+    DISPONIBLE = "Disponible", "Disponible"
+
+
+def filtro_estado_stock(estado):
+    """Retorna el filtro Q equivalente a un estado de stock sobre activo y stock"""
+    umbral = umbral_stock_bajo()
+    filtros = {
+        EstadoStock.INACTIVO: Q(activo=False),
+        EstadoStock.SIN_STOCK: Q(activo=True, stock=0),
+        EstadoStock.STOCK_BAJO: Q(activo=True, stock__gt=0, stock__lte=umbral),
+        EstadoStock.DISPONIBLE: Q(activo=True, stock__gt=umbral),
+    }
+    return filtros[estado]
+
+
+# Nivel numérico de cada estado para ordenar de menor a mayor disponibilidad
+NIVEL_ESTADO_STOCK = {
+    EstadoStock.INACTIVO: 0,
+    EstadoStock.SIN_STOCK: 1,
+    EstadoStock.STOCK_BAJO: 2,
+    EstadoStock.DISPONIBLE: 3,
+}
+
+
+class ProductoQuerySet(models.QuerySet):
+    def con_estado_stock(self):
+        """
+        Anota el estado del stock calculado por la base de datos.
+
+        Junto al texto anota nivel_stock (ver NIVEL_ESTADO_STOCK), que es por lo que se ordena:
+        el orden alfabético de los estados no dice nada.
+        """
+        umbral = umbral_stock_bajo()
+
+        def segun_estado(valores, campo):
+            return Case(
+                When(activo=False, then=Value(valores[EstadoStock.INACTIVO])),
+                When(stock=0, then=Value(valores[EstadoStock.SIN_STOCK])),
+                When(stock__lte=umbral, then=Value(valores[EstadoStock.STOCK_BAJO])),
+                default=Value(valores[EstadoStock.DISPONIBLE]),
+                output_field=campo,
+            )
+
+        return self.annotate(
+            estado_stock=segun_estado({estado: estado.value for estado in EstadoStock},
+                                      models.CharField(max_length=20)),
+            nivel_stock=segun_estado(NIVEL_ESTADO_STOCK, models.IntegerField()),
+        )
+
+    def por_estado_stock(self, estado):
+        """Filtra por estado de stock con predicados indexables sobre (activo, stock)"""
+        return self.filter(filtro_estado_stock(estado))
+
+    def con_stock_asignado(self):
+        """Anota stock_asignado: la suma del stock del producto en todos sus almacenes"""
+        suma = StockAlmacen.objects.filter(producto=OuterRef('pk')).order_by().values('producto').annotate(
+            total=Sum('cantidad')
+        ).values('total')
+        return self.annotate(stock_asignado=Coalesce(Subquery(suma), 0))
+
+
 class Producto(models.Model):
-    objects: models.Manager  # type: ignore
+    objects = ProductoQuerySet.as_manager()
     nombre = models.CharField(
         max_length=100,
         verbose_name="Nombre del Producto",
@@ -54,6 +130,12 @@ class Producto(models.Model):
             models.Index(fields=['nombre']),
             models.Index(fields=['categoria']),
             models.Index(fields=['activo']),
+            models.Index(fields=['activo', 'stock']),
+            models.Index(fields=['fecha_actualizacion', 'id']),
+            models.Index(Lower('nombre'), name='producto_nombre_lower_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=Q(stock__gte=0), name='producto_stock_no_negativo'),
         ]
 
     def __str__(self):
@@ -64,29 +146,90 @@ class Producto(models.Model):
         return self.stock > 0 and self.activo
 
     def reducir_stock(self, cantidad):
-        """Reduce el stock del producto"""
-        if self.stock >= cantidad:
-            self.stock -= cantidad
-            self.save()
-            return True
-        return False
+        """Reduce el stock sin almacén del producto; retorna False si no alcanza"""
+        from .inventario import StockInsuficiente
+        try:
+            self._ajustar_stock_sin_almacen(-cantidad)
+        except StockInsuficiente:
+            return False
+        return True
 
     def aumentar_stock(self, cantidad):
-        """Aumenta el stock del producto"""
-        self.stock += cantidad
-        self.save()
+        """Aumenta el stock sin almacén del producto"""
+        self._ajustar_stock_sin_almacen(cantidad)
+
+    def _ajustar_stock_sin_almacen(self, cantidad):
+        from .inventario import ajustar_stock_sin_almacen
+        producto = ajustar_stock_sin_almacen(self.pk, cantidad)
+        self.stock, self.fecha_actualizacion = producto.stock, producto.fecha_actualizacion
+        self._marcar_guardados(['stock', 'fecha_actualizacion'])
+
+    def registrar_movimiento(self, cantidad, tipo='ajuste'):
+        """Anota en el registro de movimientos un cambio de stock ya guardado"""
+        from .movimientos import registrar_movimiento
+        registrar_movimiento(self.pk, cantidad, tipo, stock_resultante=self.stock)
 
     @property
     def estado_stock(self):
         """Retorna el estado del stock como texto"""
+        # Si el queryset trae el estado anotado y el producto no cambió, se reutiliza
+        anotado = self.__dict__.get('_estado_stock')
+        if anotado and anotado[1:] == (self.__dict__.get('activo'), self.__dict__.get('stock')):
+            return anotado[0]
         if not self.activo:
-            return "Inactivo"
+            return EstadoStock.INACTIVO.value
         elif self.stock == 0:
-            return "Sin stock"
-        elif self.stock <= 5:
-            return "Stock bajo"
+            return EstadoStock.SIN_STOCK.value
+        elif self.stock <= umbral_stock_bajo():
+            return EstadoStock.STOCK_BAJO.value
         else:
-            return "Disponible"
+            return EstadoStock.DISPONIBLE.value
+
+    @estado_stock.setter
+    def estado_stock(self, valor):
+        """Guarda el estado anotado por ProductoQuerySet.con_estado_stock()"""
+        # Se leen del __dict__ para no cargar campos diferidos con .only()
+        self._estado_stock = (valor, self.__dict__.get('activo'), self.__dict__.get('stock'))
+
+    # Seguimiento de cambios: valores de las columnas tal como se leyeron o guardaron por última vez
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._originales = instancia._valores_cargados()
+        return instancia
+
+    def _valores_cargados(self):
+        """Valores actuales de las columnas cargadas (las diferidas no se leen)"""
+        return {
+            campo.attname: getattr(self, campo.attname)
+            for campo in self._meta.concrete_fields
+            if campo.attname in self.__dict__
+        }
+
+    def valor_original(self, campo):
+        """Valor de la columna al leerla de la base de datos, o el actual si no se conoce"""
+        return self.__dict__.get('_originales', {}).get(campo, getattr(self, campo))
+
+    def campos_modificados(self):
+        """Columnas cambiadas desde que se leyó el producto; None si no se leyó de la base de datos"""
+        originales = self.__dict__.get('_originales')
+        if originales is None:
+            return None
+        return [
+            campo for campo, valor in originales.items()
+            if campo in self.__dict__ and self.__dict__[campo] != valor
+        ]
+
+    def clean(self):
+        super().clean()
+        # El total no puede quedar por debajo de lo que está asignado a almacenes
+        if self.pk and self.stock is not None and self.stock != self.valor_original('stock'):
+            from .inventario import validar_stock_total, StockInsuficiente
+            try:
+                validar_stock_total(self.pk, self.stock)
+            except StockInsuficiente as e:
+                raise ValidationError({'stock': str(e)})
 
     def save(self, *args, **kwargs):
         # Generar código de producto automáticamente si no existe
@@ -97,4 +240,246 @@ class Producto(models.Model):
                 self.codigo_producto = f"PRO{ultimo_numero + 1:04d}"
             else:
                 self.codigo_producto = "PRO0001"
+
+        # Un producto leído de la base de datos solo escribe las columnas que cambiaron
+        modificados = self.campos_modificados()
+        if modificados is not None and kwargs.get('update_fields') is None and not self._state.adding \
+                and not kwargs.get('force_insert'):
+            if not modificados:
+                return
+            kwargs['update_fields'] = list(dict.fromkeys(modificados + ['fecha_actualizacion']))
         super().save(*args, **kwargs)
+        self._marcar_guardados(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._marcar_guardados(fields)
+
+    def _marcar_guardados(self, campos=None):
+        """Toma como originales los valores actuales de las columnas indicadas (o de todas)"""
+        actuales = self._valores_cargados()
+        if campos is None or '_originales' not in self.__dict__:
+            self._originales = actuales
+            return
+        for nombre in campos:
+            attname = self._meta.get_field(nombre).attname
+            if attname in actuales:
+                self._originales[attname] = actuales[attname]
+
+
+class Almacen(models.Model):
+    nombre = models.CharField(max_length=100, unique=True, verbose_name="Nombre del Almacén")
+    codigo = models.CharField(max_length=20, unique=True, verbose_name="Código de Almacén")
+    activo = models.BooleanField(default=True, verbose_name="Activo")
+
+    class Meta:
+        verbose_name = "Almacén"
+        verbose_name_plural = "Almacenes"
+        ordering = ['nombre']
+
+    def __str__(self):
+        return f"{self.codigo} - {self.nombre}"
+
+
+class StockAlmacen(models.Model):
+    """Stock de un producto en un almacén; Producto.stock guarda el total de todos los almacenes"""
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='stocks_almacen',
+        verbose_name="Producto"
+    )
+    almacen = models.ForeignKey(
+        Almacen,
+        on_delete=models.PROTECT,
+        related_name='stocks',
+        verbose_name="Almacén"
+    )
+    cantidad = models.IntegerField(
+        default=0,
+        validators=[MinValueValidator(0, message="El stock no puede ser negativo")],
+        verbose_name="Cantidad"
+    )
+    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name="Fecha de Actualización")
+
+    class Meta:
+        verbose_name = "Stock por Almacén"
+        verbose_name_plural = "Stock por Almacén"
+        constraints = [
+            models.UniqueConstraint(fields=['producto', 'almacen'], name='stock_almacen_producto_almacen_unico'),
+            models.CheckConstraint(condition=Q(cantidad__gte=0), name='stock_almacen_cantidad_no_negativa'),
+        ]
+        indexes = [
+            models.Index(fields=['almacen', 'producto']),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id} @ {self.almacen_id}: {self.cantidad}"
+
+
+class MovimientoStock(models.Model):
+    """Registro de solo inserción con cada cambio de stock de un producto"""
+
+    class Tipo(models.TextChoices):
+        INICIAL = "inicial", "Stock inicial"
+        AJUSTE = "ajuste", "Ajuste"
+        TRANSFERENCIA = "transferencia", "Transferencia"
+        MASIVO = "masivo", "Operación masiva"
+
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='movimientos',
+        verbose_name="Producto"
+    )
+    almacen = models.ForeignKey(
+        Almacen,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='movimientos',
+        verbose_name="Almacén"
+    )
+    cantidad = models.IntegerField(verbose_name="Cantidad")
+    stock_resultante = models.IntegerField(null=True, blank=True, verbose_name="Stock Resultante")
+    tipo = models.CharField(max_length=20, choices=Tipo.choices, default=Tipo.AJUSTE, verbose_name="Tipo")
+    fecha = models.DateTimeField(default=timezone.now, verbose_name="Fecha")
+
+    class Meta:
+        verbose_name = "Movimiento de Stock"
+        verbose_name_plural = "Movimientos de Stock"
+        ordering = ['-fecha', '-id']
+        indexes = [
+            models.Index(fields=['producto', 'fecha']),
+            models.Index(fields=['fecha']),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id}: {self.cantidad:+d} ({self.tipo})"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Los movimientos de stock no se pueden modificar")
+        super().save(*args, **kwargs)
+
+
+class SnapshotStock(models.Model):
+    """Stock y totales acumulados de un producto al cierre de una compactación"""
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='snapshots_stock',
+        verbose_name="Producto"
+    )
+    fecha = models.DateTimeField(verbose_name="Fecha")
+    stock = models.IntegerField(verbose_name="Stock")
+    entradas = models.BigIntegerField(default=0, verbose_name="Entradas Acumuladas")
+    salidas = models.BigIntegerField(default=0, verbose_name="Salidas Acumuladas")
+
+    class Meta:
+        verbose_name = "Snapshot de Stock"
+        verbose_name_plural = "Snapshots de Stock"
+        ordering = ['-fecha']
+        constraints = [
+            models.UniqueConstraint(fields=['producto', 'fecha'], name='snapshot_stock_producto_fecha_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['fecha']),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id} @ {self.fecha:%Y-%m-%d %H:%M}: {self.stock}"
+
+
+class ResumenCategoria(models.Model):
+    """Agregados de los productos de una categoría al cierre de un día u hora"""
+
+    class Periodo(models.TextChoices):
+        DIA = "dia", "Día"
+        HORA = "hora", "Hora"
+
+    periodo = models.CharField(max_length=4, choices=Periodo.choices, verbose_name="Periodo")
+    fecha = models.DateTimeField(verbose_name="Inicio del Periodo")
+    categoria = models.CharField(max_length=50, blank=True, default='', verbose_name="Categoría")
+    total = models.PositiveIntegerField(default=0, verbose_name="Total de Productos")
+    activos = models.PositiveIntegerField(default=0, verbose_name="Productos Activos")
+    sin_stock = models.PositiveIntegerField(default=0, verbose_name="Productos sin Stock")
+    stock_bajo = models.PositiveIntegerField(default=0, verbose_name="Productos con Stock Bajo")
+    unidades = models.BigIntegerField(default=0, verbose_name="Unidades en Stock")
+    suma_precios = models.DecimalField(
+        max_digits=16,
+        decimal_places=2,
+        default=0,
+        verbose_name="Suma de Precios Activos"
+    )
+    fecha_calculo = models.DateTimeField(verbose_name="Fecha de Cálculo")
+
+    class Meta:
+        verbose_name = "Resumen por Categoría"
+        verbose_name_plural = "Resúmenes por Categoría"
+        ordering = ['periodo', 'fecha', 'categoria']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['periodo', 'fecha', 'categoria'], name='resumen_categoria_periodo_fecha_unico'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['periodo', 'categoria', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f"{self.categoria or 'Sin categoría'} @ {self.fecha:%Y-%m-%d %H:%M} ({self.periodo})"
+
+    @property
+    def precio_promedio(self):
+        """Precio promedio de los productos activos"""
+        if not self.activos:
+            return None
+        return (self.suma_precios / self.activos).quantize(Decimal('0.01'))
+
+
+class Tarea(models.Model):
+    """Trabajo en segundo plano encolado en la base de datos"""
+
+    class Estado(models.TextChoices):
+        PENDIENTE = "pendiente", "Pendiente"
+        EN_PROCESO = "en_proceso", "En proceso"
+        COMPLETADA = "completada", "Completada"
+        FALLIDA = "fallida", "Fallida"
+
+    tipo = models.CharField(max_length=50, verbose_name="Tipo")
+    parametros = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder, verbose_name="Parámetros")
+    estado = models.CharField(
+        max_length=20,
+        choices=Estado.choices,
+        default=Estado.PENDIENTE,
+        verbose_name="Estado"
+    )
+    progreso = models.PositiveSmallIntegerField(
+        default=0,
+        validators=[MaxValueValidator(100)],
+        verbose_name="Progreso (%)"
+    )
+    resultado = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder, verbose_name="Resultado")
+    error = models.TextField(blank=True, default='', verbose_name="Error")
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
+    fecha_inicio = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Inicio")
+    fecha_fin = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Fin")
+    fecha_latido = models.DateTimeField(null=True, blank=True, verbose_name="Última Señal del Worker")
+    intentos = models.PositiveSmallIntegerField(default=0, verbose_name="Intentos")
+
+    class Meta:
+        verbose_name = "Tarea"
+        verbose_name_plural = "Tareas"
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_creacion']),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} #{self.pk} ({self.estado})"
+
+    def actualizar_progreso(self, progreso):
+        """Registra el avance de la tarea sin tocar el resto de columnas"""
+        self.progreso = max(0, min(100, int(progreso)))
+        Tarea.objects.filter(pk=self.pk).update(progreso=self.progreso, fecha_latido=timezone.now())
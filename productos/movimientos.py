@@ -0,0 +1,214 @@
+import threading
+from contextlib import contextmanager
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Producto, MovimientoStock, SnapshotStock
+
+# Movimientos pendientes de escribir por hilo (None fuera de un lote) y las transacciones
+# abiertas al empezar el lote
+_local = threading.local()
+
+
+def parsear_fecha(valor):
+    """Convierte una fecha (AAAA-MM-DD) o fecha y hora ISO en un datetime con zona horaria"""
+    fecha = parse_datetime(valor)
+    if fecha is None:
+        dia = parse_date(valor)
+        if dia is None:
+            raise ValueError(f"Fecha inválida: {valor}")
+        fecha = datetime.combine(dia, time.min)
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return fecha
+
+
+def tamano_maximo_lote():
+    """Cantidad de movimientos acumulados que fuerza la escritura del lote"""
+    return getattr(settings, 'PRODUCTOS_MOVIMIENTOS_LOTE_MAXIMO', 500)
+
+
+def registrar_movimiento(producto_id, cantidad, tipo=MovimientoStock.Tipo.AJUSTE,
+                         stock_resultante=None, almacen_id=None):
+    """
+    Agrega un movimiento al registro de stock.
+
+    Dentro de lote_movimientos() solo se acumula y se escribe con un INSERT de varias filas
+    al cerrar el lote; fuera de un lote, o en una transacción abierta después que el lote,
+    se escribe de inmediato para que quede en la misma transacción que el cambio de stock.
+    """
+    if not cantidad:
+        return
+    movimiento = MovimientoStock(
+        producto_id=producto_id,
+        almacen_id=almacen_id,
+        cantidad=cantidad,
+        stock_resultante=stock_resultante,
+        tipo=tipo,
+    )
+    pendientes = getattr(_local, 'pendientes', None)
+    if pendientes is None or len(connection.atomic_blocks) > _local.transacciones:
+        MovimientoStock.objects.bulk_create([movimiento])
+        return
+    pendientes.append(movimiento)
+    if len(pendientes) >= tamano_maximo_lote():
+        escribir_pendientes()
+
+
+def registrar_movimientos(ids, cantidad, tipo=MovimientoStock.Tipo.MASIVO):
+    """Registra el mismo movimiento para varios productos actualizados con un solo UPDATE"""
+    for producto_id in ids:
+        registrar_movimiento(producto_id, cantidad, tipo)
+
+
+def escribir_pendientes():
+    """Escribe los movimientos acumulados en el lote actual"""
+    pendientes = getattr(_local, 'pendientes', None)
+    if pendientes:
+        MovimientoStock.objects.bulk_create(pendientes, batch_size=tamano_maximo_lote())
+        pendientes.clear()
+
+
+@contextmanager
+def lote_movimientos():
+    """
+    Acumula los movimientos registrados dentro del bloque y los escribe juntos al salir.
+
+    Un lote anidado acumula aparte y escribe lo suyo al cerrarse, así que abierto dentro de
+    transaction.atomic() los movimientos se confirman junto con el stock y no al terminar el
+    lote exterior. Si el bloque falla dentro de una transacción los movimientos se descartan
+    junto con ella.
+    """
+    anterior = getattr(_local, 'pendientes', None), getattr(_local, 'transacciones', 0)
+    _local.pendientes, _local.transacciones = [], len(connection.atomic_blocks)
+    try:
+        yield
+    except BaseException:
+        if not connection.in_atomic_block:
+            escribir_pendientes()
+        raise
+    else:
+        escribir_pendientes()
+    finally:
+        _local.pendientes, _local.transacciones = anterior
+
+
+def _acumulados(hasta, producto_id=None):
+    """
+    Stock, entradas y salidas acumuladas por producto hasta una fecha.
+
+    Parte del último snapshot anterior y suma solo los movimientos posteriores a él, así que
+    el costo depende del tiempo desde la última compactación y no de toda la historia.
+    Retorna (fecha_snapshot, {producto_id: {'stock', 'entradas', 'salidas'}}).
+    """
+    snapshots = SnapshotStock.objects.filter(fecha__lte=hasta)
+    movimientos = MovimientoStock.objects.filter(fecha__lte=hasta)
+    if producto_id is not None:
+        snapshots = snapshots.filter(producto_id=producto_id)
+        movimientos = movimientos.filter(producto_id=producto_id)
+
+    fecha_snapshot = snapshots.aggregate(fecha=Max('fecha'))['fecha']
+    totales = {}
+    if fecha_snapshot is not None:
+        for producto, stock, entradas, salidas in snapshots.filter(fecha=fecha_snapshot).values_list(
+            'producto_id', 'stock', 'entradas', 'salidas'
+        ):
+            totales[producto] = {'stock': stock, 'entradas': entradas, 'salidas': salidas}
+        movimientos = movimientos.filter(fecha__gt=fecha_snapshot)
+
+    sin_transferencias = ~Q(tipo=MovimientoStock.Tipo.TRANSFERENCIA)
+    for fila in movimientos.values('producto_id').annotate(
+        neto=Sum('cantidad'),
+        entradas=Sum('cantidad', filter=sin_transferencias & Q(cantidad__gt=0)),
+        salidas=Sum('cantidad', filter=sin_transferencias & Q(cantidad__lt=0)),
+    ).order_by():
+        actual = totales.setdefault(fila['producto_id'], {'stock': None, 'entradas': 0, 'salidas': 0})
+        if actual['stock'] is not None:
+            actual['stock'] += fila['neto']
+        actual['entradas'] += fila['entradas'] or 0
+        actual['salidas'] += -(fila['salidas'] or 0)
+    return fecha_snapshot, totales
+
+
+def stock_en(producto, fecha):
+    """
+    Stock que tenía un producto en una fecha.
+
+    Usa el último snapshot anterior más los movimientos desde entonces; si no hay snapshot,
+    parte del siguiente snapshot (o del stock actual) y descuenta los movimientos intermedios.
+    """
+    _, totales = _acumulados(fecha, producto.pk)
+    actual = totales.get(producto.pk)
+    if actual and actual['stock'] is not None:
+        return actual['stock']
+    posteriores = MovimientoStock.objects.filter(producto_id=producto.pk, fecha__gt=fecha)
+    siguiente = SnapshotStock.objects.filter(producto_id=producto.pk, fecha__gt=fecha).order_by('fecha').first()
+    if siguiente is not None:
+        base = siguiente.stock
+        posteriores = posteriores.filter(fecha__lte=siguiente.fecha)
+    else:
+        base = producto.stock
+    return base - (posteriores.aggregate(total=Sum('cantidad'))['total'] or 0)
+
+
+def resumen_periodo(desde, hasta, producto_id=None):
+    """Entradas y salidas por producto entre dos fechas, sin contar transferencias entre almacenes"""
+    _, inicio = _acumulados(desde, producto_id)
+    _, fin = _acumulados(hasta, producto_id)
+    resumen = {}
+    for pk, totales in fin.items():
+        previos = inicio.get(pk, {'entradas': 0, 'salidas': 0})
+        entradas = totales['entradas'] - previos['entradas']
+        salidas = totales['salidas'] - previos['salidas']
+        if entradas or salidas:
+            resumen[pk] = {'entradas': entradas, 'salidas': salidas, 'neto': entradas - salidas}
+    return resumen
+
+
+def compactar(hasta, eliminar=False):
+    """
+    Guarda un snapshot por producto con el stock y los acumulados a la fecha indicada.
+
+    Es idempotente: si ya existe un snapshot en esa fecha no hace nada. Con eliminar=True borra
+    los movimientos cubiertos por el snapshot. Retorna la cantidad de snapshots creados.
+    """
+    with transaction.atomic():
+        if SnapshotStock.objects.filter(fecha=hasta).exists():
+            return 0
+        if SnapshotStock.objects.filter(fecha__gt=hasta).exists():
+            raise ValueError("Ya existe un snapshot posterior a la fecha indicada")
+
+        _, totales = _acumulados(hasta)
+        # Productos sin snapshot previo: el stock se reconstruye desde el actual hacia atrás
+        pendientes = [pk for pk, t in totales.items() if t['stock'] is None]
+        if pendientes:
+            actuales = dict(Producto.objects.filter(pk__in=pendientes).values_list('id', 'stock'))
+            posteriores = dict(
+                MovimientoStock.objects.filter(producto_id__in=pendientes, fecha__gt=hasta)
+                .values('producto_id').annotate(total=Sum('cantidad')).order_by()
+                .values_list('producto_id', 'total')
+            )
+            for pk in pendientes:
+                if pk not in actuales:
+                    del totales[pk]
+                    continue
+                totales[pk]['stock'] = actuales[pk] - (posteriores.get(pk) or 0)
+
+        SnapshotStock.objects.bulk_create(
+            [
+                SnapshotStock(
+                    producto_id=pk, fecha=hasta, stock=t['stock'],
+                    entradas=t['entradas'], salidas=t['salidas']
+                )
+                for pk, t in totales.items()
+            ],
+            batch_size=1000
+        )
+        if eliminar:
+            MovimientoStock.objects.filter(fecha__lte=hasta).delete()
+    return len(totales)
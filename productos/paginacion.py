@@ -0,0 +1,26 @@
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+from .conteo import PaginadorConteoEstimado
+
+
+class PaginacionConteoEstimado(PageNumberPagination):
+    """Paginación por número de página con total cacheado o estimado (ver productos.conteo)"""
+    django_paginator_class = PaginadorConteoEstimado
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.page.paginator.count,
+            'conteo_estimado': self.page.paginator.estimado,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        respuesta = super().get_paginated_response_schema(schema)
+        respuesta['properties']['conteo_estimado'] = {
+            'type': 'boolean',
+            'example': False,
+        }
+        return respuesta
@@ -0,0 +1,116 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+from .models import Producto, EstadoStock, ResumenCategoria, filtro_estado_stock
+
+CAMPOS_SUMABLES = ['total', 'activos', 'sin_stock', 'stock_bajo', 'unidades', 'suma_precios']
+
+
+def inicio_periodo(fecha, periodo):
+    """Inicio del día u hora (en la zona horaria local) que contiene la fecha"""
+    local = timezone.localtime(fecha).replace(minute=0, second=0, microsecond=0)
+    if periodo == ResumenCategoria.Periodo.DIA:
+        local = local.replace(hour=0)
+    return local
+
+
+def agregar_productos():
+    """Agregados actuales por categoría con una sola consulta GROUP BY"""
+    filas = Producto.objects.order_by().values('categoria').annotate(
+        total=Count('id'),
+        activos=Count('id', filter=Q(activo=True)),
+        sin_stock=Count('id', filter=filtro_estado_stock(EstadoStock.SIN_STOCK)),
+        stock_bajo=Count('id', filter=filtro_estado_stock(EstadoStock.STOCK_BAJO)),
+        unidades=Sum('stock'),
+        suma_precios=Sum('precio', filter=Q(activo=True)),
+    )
+    # NULL y '' son el mismo grupo "sin categoría"
+    agregados = defaultdict(lambda: dict.fromkeys(CAMPOS_SUMABLES, 0))
+    for fila in filas:
+        destino = agregados[fila['categoria'] or '']
+        for campo in CAMPOS_SUMABLES:
+            destino[campo] += fila[campo] or 0
+    return agregados
+
+
+def generar_resumenes(periodo=ResumenCategoria.Periodo.DIA, ahora=None):
+    """
+    Guarda los agregados por categoría del periodo actual.
+
+    Es idempotente: volver a ejecutarlo dentro del mismo periodo reemplaza sus filas con el
+    estado actual. Si ningún producto cambió desde el último resumen, copia sus filas en lugar
+    de recorrer la tabla de productos. Retorna (fecha del periodo, filas escritas, recalculado).
+    """
+    # Se toma antes de leer los productos para no perder cambios hechos durante el cálculo
+    calculo = timezone.now()
+    fecha = inicio_periodo(ahora or calculo, periodo)
+    anteriores = ResumenCategoria.objects.filter(periodo=periodo)
+    ultimo = anteriores.aggregate(fecha=Max('fecha'), calculo=Max('fecha_calculo'))
+
+    agregados = None
+    if ultimo['fecha'] is not None:
+        sin_cambios = not Producto.objects.filter(fecha_actualizacion__gt=ultimo['calculo']).exists()
+        filas_ultimo = list(anteriores.filter(fecha=ultimo['fecha']))
+        # El total detecta productos borrados, que no dejan fecha_actualizacion
+        if sin_cambios and sum(r.total for r in filas_ultimo) == Producto.objects.count():
+            agregados = {
+                r.categoria: {campo: getattr(r, campo) for campo in CAMPOS_SUMABLES}
+                for r in filas_ultimo
+            }
+    recalculado = agregados is None
+    if recalculado:
+        agregados = agregar_productos()
+
+    filas = [
+        ResumenCategoria(periodo=periodo, fecha=fecha, categoria=categoria, fecha_calculo=calculo, **valores)
+        for categoria, valores in agregados.items()
+    ]
+    with transaction.atomic():
+        ResumenCategoria.objects.filter(periodo=periodo, fecha=fecha).exclude(categoria__in=agregados).delete()
+        ResumenCategoria.objects.bulk_create(
+            filas,
+            update_conflicts=True,
+            unique_fields=['periodo', 'fecha', 'categoria'],
+            update_fields=CAMPOS_SUMABLES + ['fecha_calculo'],
+        )
+    return fecha, len(filas), recalculado
+
+
+def _punto(fecha, valores):
+    activos = valores['activos']
+    return {
+        'fecha': fecha,
+        'total': valores['total'],
+        'activos': activos,
+        'sin_stock': valores['sin_stock'],
+        'stock_bajo': valores['stock_bajo'],
+        'unidades': valores['unidades'],
+        'precio_promedio': (Decimal(valores['suma_precios']) / activos).quantize(Decimal('0.01')) if activos else None,
+    }
+
+
+def series_tendencias(periodo, desde, hasta, categoria=None):
+    """
+    Series de tiempo por categoría y del total, leídas solo de los resúmenes.
+
+    Los periodos en los que no se ejecutó generar_resumenes no aparecen en las series.
+    """
+    resumenes = ResumenCategoria.objects.filter(periodo=periodo, fecha__gte=desde, fecha__lte=hasta)
+    if categoria is not None:
+        resumenes = resumenes.filter(categoria=categoria)
+
+    por_categoria = defaultdict(list)
+    totales = defaultdict(lambda: dict.fromkeys(CAMPOS_SUMABLES, 0))
+    for resumen in resumenes.order_by('fecha', 'categoria'):
+        valores = {campo: getattr(resumen, campo) for campo in CAMPOS_SUMABLES}
+        por_categoria[resumen.categoria].append(_punto(resumen.fecha, valores))
+        for campo in CAMPOS_SUMABLES:
+            totales[resumen.fecha][campo] += valores[campo]
+    return {
+        'categorias': dict(por_categoria),
+        'total': [_punto(fecha, valores) for fecha, valores in sorted(totales.items())],
+    }
@@ -1,7 +1,21 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Producto
+from .models import Producto, Tarea, Almacen, StockAlmacen, MovimientoStock
+from .inventario import validar_stock_total, StockInsuficiente
 
-class ProductoSerializer(serializers.ModelSerializer):
+
+class CamposDinamicosMixin:
+    """Permite limitar los campos serializados con el argumento `campos`"""
+
+    def __init__(self, *args, **kwargs):
+        campos = kwargs.pop('campos', None)
+        super().__init__(*args, **kwargs)
+        if campos:
+            for nombre in set(self.fields) - set(campos):
+                self.fields.pop(nombre)
+
+
+class ProductoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     estado_stock = serializers.ReadOnlyField()
     
     class Meta:
@@ -35,4 +49,71 @@ class ProductoUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Producto
         fields = ['nombre', 'descripcion', 'precio', 'stock', 'categoria', 'activo']
-        read_only_fields = ('codigo_producto', 'fecha_creacion', 'fecha_actualizacion') 
\ No newline at end of file
+        read_only_fields = ('codigo_producto', 'fecha_creacion', 'fecha_actualizacion')
+
+    def update(self, instance, validated_data):
+        stock_anterior = instance.stock
+        if validated_data.get('stock', stock_anterior) == stock_anterior:
+            return super().update(instance, validated_data)
+        # El producto queda bloqueado desde la verificación hasta el guardado
+        with transaction.atomic():
+            try:
+                validar_stock_total(instance.pk, validated_data['stock'])
+            except StockInsuficiente as e:
+                raise serializers.ValidationError({'stock': str(e)})
+            instance = super().update(instance, validated_data)
+            instance.registrar_movimiento(instance.stock - stock_anterior)
+        return instance
+
+class TareaSerializer(serializers.ModelSerializer):
+    """Serializador para encolar y consultar tareas en segundo plano"""
+
+    class Meta:
+        model = Tarea
+        fields = ['id', 'tipo', 'parametros', 'estado', 'progreso', 'resultado', 'error',
+                  'fecha_creacion', 'fecha_inicio', 'fecha_fin']
+        read_only_fields = ('estado', 'progreso', 'resultado', 'error',
+                            'fecha_creacion', 'fecha_inicio', 'fecha_fin')
+
+    def validate_tipo(self, value):
+        """Validación de que el tipo de tarea esté registrado"""
+        from .tareas import REGISTRO
+        if value not in REGISTRO:
+            raise serializers.ValidationError(
+                f"Tipo de tarea desconocido. Opciones: {', '.join(sorted(REGISTRO))}"
+            )
+        return value
+
+    def validate(self, attrs):
+        """Validación de los parámetros según el tipo de tarea"""
+        from .tareas import validar_parametros, ParametrosInvalidos
+        try:
+            attrs['parametros'] = validar_parametros(attrs['tipo'], attrs.get('parametros'))
+        except ParametrosInvalidos as e:
+            raise serializers.ValidationError({'parametros': str(e)})
+        return attrs
+
+
+class AlmacenSerializer(serializers.ModelSerializer):
+    """Serializador de almacenes"""
+
+    class Meta:
+        model = Almacen
+        fields = ['id', 'codigo', 'nombre', 'activo']
+
+
+class StockAlmacenSerializer(serializers.ModelSerializer):
+    """Serializador del stock de un producto en un almacén"""
+    almacen_codigo = serializers.CharField(source='almacen.codigo', read_only=True)
+
+    class Meta:
+        model = StockAlmacen
+        fields = ['almacen', 'almacen_codigo', 'cantidad', 'fecha_actualizacion']
+
+
+class MovimientoStockSerializer(serializers.ModelSerializer):
+    """Serializador de un movimiento del registro de stock"""
+
+    class Meta:
+        model = MovimientoStock
+        fields = ['id', 'fecha', 'tipo', 'cantidad', 'stock_resultante', 'almacen']
@@ -0,0 +1,47 @@
+from django.db.models import Count, Avg
+from .models import Producto, EstadoStock
+from .catalogo import obtener_catalogo
+
+
+def calcular_estadisticas():
+    """Calcula el resumen de estadísticas de productos"""
+    from .serializers import ProductoListSerializer
+
+    total_productos = Producto.objects.count()
+    productos_activos = Producto.objects.filter(activo=True).count()
+    productos_sin_stock = Producto.objects.por_estado_stock(EstadoStock.SIN_STOCK).count()
+    productos_stock_bajo = Producto.objects.por_estado_stock(EstadoStock.STOCK_BAJO).count()
+
+    # Totales por estado de stock agregados en la base de datos
+    estados_stock = dict(
+        Producto.objects.con_estado_stock().order_by().values('estado_stock')
+        .annotate(total=Count('id')).values_list('estado_stock', 'total')
+    )
+
+    # Estadísticas por categoría
+    categorias = Producto.objects.filter(activo=True).values('categoria').annotate(
+        total=Count('id'),
+        precio_promedio=Avg('precio')
+    ).exclude(categoria__isnull=True).exclude(categoria='')
+
+    # Productos más caros
+    catalogo = obtener_catalogo()
+    if catalogo is not None:
+        productos_mas_caros = catalogo.consultar(
+            ordenar='-precio', limite=5, campos=ProductoListSerializer.Meta.fields
+        )
+    else:
+        productos_caros = Producto.objects.con_estado_stock().filter(activo=True).order_by('-precio')[:5]
+        productos_mas_caros = ProductoListSerializer(productos_caros, many=True).data
+
+    return {
+        'resumen': {
+            'total_productos': total_productos,
+            'productos_activos': productos_activos,
+            'productos_sin_stock': productos_sin_stock,
+            'productos_stock_bajo': productos_stock_bajo,
+        },
+        'estados_stock': estados_stock,
+        'categorias': list(categorias),
+        'productos_mas_caros': productos_mas_caros
+    }
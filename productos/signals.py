@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Producto, MovimientoStock
+from .eventos import notificar_cambios
+from .autocompletar import actualizar_indice, quitar_del_indice
+from .conteo import invalidar_conteos
+from .catalogo import eliminar_del_catalogo
+
+
+@receiver(post_save, sender=Producto)
+def producto_guardado(sender, instance, created, **kwargs):
+    """Publica los cambios de un producto guardado con save()"""
+    if created:
+        tipo = 'creado'
+        instance.registrar_movimiento(instance.stock, MovimientoStock.Tipo.INICIAL)
+    elif not instance.activo:
+        tipo = 'desactivado'
+    else:
+        tipo = 'actualizado'
+    notificar_cambios(tipo, productos=[instance])
+    transaction.on_commit(lambda: actualizar_indice(instance))
+
+
+@receiver(post_delete, sender=Producto)
+def producto_eliminado(sender, instance, **kwargs):
+    """Invalida los conteos y quita el producto de las estructuras en memoria cuando se borra"""
+    # Django pone el pk en None al terminar el borrado, antes de que corra on_commit
+    producto_id = instance.pk
+
+    def aplicar():
+        invalidar_conteos()
+        eliminar_del_catalogo(producto_id)
+        quitar_del_indice(producto_id)
+
+    transaction.on_commit(aplicar)
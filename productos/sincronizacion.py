@@ -0,0 +1,63 @@
+import base64
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Producto
+
+
+class TokenInvalido(ValueError):
+    """El token de sincronización no se pudo interpretar"""
+
+
+def codificar_token(fecha, producto_id):
+    """Codifica la marca de agua (fecha_actualizacion, id) como token opaco"""
+    crudo = f"{fecha.isoformat()}|{producto_id}"
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip('=')
+
+
+def decodificar_token(token):
+    """Retorna la marca de agua (fecha_actualizacion, id) contenida en el token"""
+    try:
+        relleno = '=' * (-len(token) % 4)
+        fecha, producto_id = base64.urlsafe_b64decode(token + relleno).decode().split('|')
+        fecha = parse_datetime(fecha)
+        if fecha is None:
+            raise ValueError
+        return fecha, int(producto_id)
+    except (ValueError, UnicodeDecodeError):
+        raise TokenInvalido("El token de sincronización no es válido")
+
+
+def obtener_cambios(desde=None, limite=500, campos=None):
+    """
+    Retorna los productos modificados después de la marca de agua `desde`.
+
+    Solo se incluyen cambios anteriores a ahora - PRODUCTOS_SYNC_MARGEN_SEGUNDOS, para que
+    una transacción en curso con una fecha_actualizacion anterior no quede detrás del token.
+    """
+    margen = getattr(settings, 'PRODUCTOS_SYNC_MARGEN_SEGUNDOS', 5)
+    corte = timezone.now() - timedelta(seconds=margen)
+
+    productos = Producto.objects.con_estado_stock().filter(fecha_actualizacion__lte=corte)
+    if campos:
+        productos = productos.only('id', 'fecha_actualizacion', *campos)
+    if desde:
+        fecha, producto_id = decodificar_token(desde)
+        productos = productos.filter(
+            Q(fecha_actualizacion__gt=fecha) | Q(fecha_actualizacion=fecha, id__gt=producto_id)
+        )
+
+    productos = list(productos.order_by('fecha_actualizacion', 'id')[:limite + 1])
+    hay_mas = len(productos) > limite
+    productos = productos[:limite]
+
+    if productos:
+        ultimo = productos[-1]
+        siguiente = codificar_token(ultimo.fecha_actualizacion, ultimo.id)
+    else:
+        siguiente = desde
+    return productos, siguiente, hay_mas
@@ -0,0 +1,229 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Producto, Tarea, ResumenCategoria
+from .eventos import notificar_cambios
+from .movimientos import lote_movimientos, registrar_movimientos
+
+logger = logging.getLogger(__name__)
+
+# Registro de funciones que se pueden ejecutar como tareas: tipo -> función(tarea)
+REGISTRO = {}
+# Validación de los parámetros de cada tipo: tipo -> función(parametros) -> parametros normalizados
+VALIDADORES = {}
+
+
+class ParametrosInvalidos(ValueError):
+    """Los parámetros no son válidos para el tipo de tarea"""
+
+
+def registrar_tarea(tipo, validar=None):
+    """
+    Decorador que registra una función como tipo de tarea ejecutable.
+
+    `validar(parametros)` retorna los parámetros normalizados o lanza ParametrosInvalidos.
+    """
+    def decorador(funcion):
+        REGISTRO[tipo] = funcion
+        if validar is not None:
+            VALIDADORES[tipo] = validar
+        return funcion
+    return decorador
+
+
+def validar_parametros(tipo, parametros):
+    """Valida los parámetros de una tarea antes de encolarla"""
+    if parametros is None:
+        parametros = {}
+    if not isinstance(parametros, dict):
+        raise ParametrosInvalidos("Los parámetros deben ser un objeto")
+    validar = VALIDADORES.get(tipo)
+    return validar(parametros) if validar else parametros
+
+
+def encolar(tipo, parametros=None):
+    """Crea una tarea pendiente para que la procese un worker"""
+    if tipo not in REGISTRO:
+        raise ValueError(f"Tipo de tarea desconocido: {tipo}")
+    return Tarea.objects.create(tipo=tipo, parametros=validar_parametros(tipo, parametros))
+
+
+def vencimiento():
+    """Segundos sin señales del worker tras los que una tarea en proceso se da por abandonada"""
+    return getattr(settings, 'PRODUCTOS_TAREAS_VENCIMIENTO_SEGUNDOS', 300)
+
+
+def reclamar_siguiente():
+    """Marca como en proceso la tarea pendiente más antigua y la retorna"""
+    candidatas = (
+        Tarea.objects.filter(estado=Tarea.Estado.PENDIENTE)
+        .order_by('fecha_creacion', 'id')
+        .values_list('id', flat=True)[:10]
+    )
+    for tarea_id in candidatas:
+        ahora = timezone.now()
+        # El UPDATE condicionado al estado garantiza que solo un worker la reclame
+        reclamada = Tarea.objects.filter(pk=tarea_id, estado=Tarea.Estado.PENDIENTE).update(
+            estado=Tarea.Estado.EN_PROCESO,
+            fecha_inicio=ahora,
+            fecha_latido=ahora,
+            intentos=F('intentos') + 1,
+        )
+        if reclamada:
+            return Tarea.objects.get(pk=tarea_id)
+    return None
+
+
+def renovar_latidos(ids):
+    """Indica que el worker sigue ejecutando estas tareas"""
+    if ids:
+        Tarea.objects.filter(pk__in=ids, estado=Tarea.Estado.EN_PROCESO).update(fecha_latido=timezone.now())
+
+
+def recuperar_vencidas():
+    """
+    Vuelve a encolar las tareas en proceso cuyo worker dejó de dar señales, por ejemplo porque
+    se cayó. Las que ya agotaron PRODUCTOS_TAREAS_INTENTOS_MAXIMOS se marcan como fallidas.
+    Retorna (reencoladas, fallidas).
+    """
+    ahora = timezone.now()
+    limite = ahora - timedelta(seconds=vencimiento())
+    vencidas = Tarea.objects.filter(
+        Q(fecha_latido__lt=limite) | Q(fecha_latido__isnull=True, fecha_inicio__lt=limite),
+        estado=Tarea.Estado.EN_PROCESO,
+    )
+    maximo = getattr(settings, 'PRODUCTOS_TAREAS_INTENTOS_MAXIMOS', 3)
+    fallidas = vencidas.filter(intentos__gte=maximo).update(
+        estado=Tarea.Estado.FALLIDA,
+        error=f"El worker dejó de responder en {maximo} intentos",
+        fecha_fin=ahora,
+    )
+    reencoladas = vencidas.filter(intentos__lt=maximo).update(estado=Tarea.Estado.PENDIENTE)
+    return reencoladas, fallidas
+
+
+def ejecutar_tarea(tarea):
+    """Ejecuta una tarea reclamada y guarda su resultado o error"""
+    close_old_connections()
+    try:
+        funcion = REGISTRO[tarea.tipo]
+        resultado = funcion(tarea)
+        Tarea.objects.filter(pk=tarea.pk).update(
+            estado=Tarea.Estado.COMPLETADA,
+            progreso=100,
+            resultado=resultado,
+            fecha_fin=timezone.now()
+        )
+    except Exception:
+        logger.exception("Error ejecutando la tarea %s", tarea.pk)
+        Tarea.objects.filter(pk=tarea.pk).update(
+            estado=Tarea.Estado.FALLIDA,
+            error=traceback.format_exc(),
+            fecha_fin=timezone.now()
+        )
+    finally:
+        close_old_connections()
+
+
+def _en_lotes(queryset, tarea, tamano=1000):
+    """Recorre los ids de un queryset en lotes reportando el progreso"""
+    ids = list(queryset.order_by('id').values_list('id', flat=True))
+    for inicio in range(0, len(ids), tamano):
+        yield ids[inicio:inicio + tamano]
+        tarea.actualizar_progreso((inicio + tamano) * 100 // len(ids))
+
+
+def _actualizar_productos(tarea, tipo_evento='actualizado', movimiento=0, **valores):
+    """
+    Aplica un UPDATE por lotes sobre los productos de la tarea.
+
+    Cada lote guarda un punto de control en la misma transacción, así una tarea reencolada
+    tras caerse el worker continúa después del último lote confirmado sin repetirlo.
+    """
+    avance = tarea.resultado if isinstance(tarea.resultado, dict) else {}
+    actualizados = avance.get('actualizados', 0)
+    queryset = Producto.objects.filter(
+        pk__in=tarea.parametros.get('ids', []), pk__gt=avance.get('ultimo_id', 0)
+    )
+    for lote in _en_lotes(queryset, tarea):
+        with transaction.atomic(), lote_movimientos():
+            actualizados += Producto.objects.filter(pk__in=lote).update(
+                fecha_actualizacion=timezone.now(), **valores
+            )
+            registrar_movimientos(lote, movimiento)
+            Tarea.objects.filter(pk=tarea.pk).update(
+                resultado={'ultimo_id': lote[-1], 'actualizados': actualizados}
+            )
+        notificar_cambios(tipo_evento, ids=lote)
+    return {'actualizados': actualizados}
+
+
+def _validar_ids(parametros):
+    ids = parametros.get('ids')
+    try:
+        if not isinstance(ids, list) or not ids:
+            raise TypeError
+        ids = [int(i) for i in ids]
+    except (TypeError, ValueError):
+        raise ParametrosInvalidos('"ids" debe ser una lista no vacía de números enteros')
+    return {**parametros, 'ids': ids}
+
+
+def _validar_aumentar_stock(parametros):
+    parametros = _validar_ids(parametros)
+    try:
+        cantidad = int(parametros.get('cantidad', 10))
+    except (TypeError, ValueError):
+        raise ParametrosInvalidos('"cantidad" debe ser un número entero')
+    if cantidad <= 0:
+        raise ParametrosInvalidos('"cantidad" debe ser mayor a 0')
+    return {**parametros, 'cantidad': cantidad}
+
+
+def _validar_resumenes(parametros):
+    periodo = parametros.get('periodo', ResumenCategoria.Periodo.DIA)
+    if periodo not in ResumenCategoria.Periodo.values:
+        raise ParametrosInvalidos(
+            f'"periodo" debe ser uno de: {", ".join(ResumenCategoria.Periodo.values)}'
+        )
+    return {**parametros, 'periodo': periodo}
+
+
+@registrar_tarea('estadisticas')
+def tarea_estadisticas(tarea):
+    """Calcula las estadísticas de productos fuera del request"""
+    from .servicios import calcular_estadisticas
+    return calcular_estadisticas()
+
+
+@registrar_tarea('activar_productos', _validar_ids)
+def tarea_activar_productos(tarea):
+    """Activa los productos indicados en parametros['ids']"""
+    return _actualizar_productos(tarea, activo=True)
+
+
+@registrar_tarea('desactivar_productos', _validar_ids)
+def tarea_desactivar_productos(tarea):
+    """Desactiva los productos indicados en parametros['ids']"""
+    return _actualizar_productos(tarea, 'desactivado', activo=False)
+
+
+@registrar_tarea('aumentar_stock', _validar_aumentar_stock)
+def tarea_aumentar_stock(tarea):
+    """Aumenta el stock de los productos indicados en parametros['ids']"""
+    cantidad = int(tarea.parametros.get('cantidad', 10))
+    return _actualizar_productos(tarea, movimiento=cantidad, stock=F('stock') + cantidad)
+
+
+@registrar_tarea('resumenes', _validar_resumenes)
+def tarea_resumenes(tarea):
+    """Guarda los resúmenes por categoría del periodo indicado en parametros['periodo']"""
+    from .resumenes import generar_resumenes
+    fecha, filas, recalculado = generar_resumenes(tarea.parametros.get('periodo', 'dia'))
+    return {'fecha': fecha, 'categorias': filas, 'recalculado': recalculado}
@@ -1,3 +1,1399 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import autocompletar, catalogo, compuestas, conteo, eventos, masivo
+from .inventario import StockInsuficiente, ajustar_stock_sin_almacen, mover_stock
+from .models import EstadoStock, Producto, Almacen, StockAlmacen, MovimientoStock, SnapshotStock, ResumenCategoria, Tarea
+from .movimientos import compactar, lote_movimientos, stock_en, resumen_periodo
+from .resumenes import generar_resumenes
+from .arranque import calentar
+from .coalescencia import Coalescedor
+from .tareas import encolar, reclamar_siguiente, ejecutar_tarea, recuperar_vencidas
+
+CATEGORIAS = ['Smartphones', 'Laptops', 'Audio', 'Gaming', 'Cámaras']
+
+LINEA_BASE = Path(__file__).resolve().parent / 'benchmark_baseline.json'
+
+
+def sembrar(total, lote=5000):
+    """Crea `total` productos con bulk_create, sin pasar por Producto.save()"""
+    creados = 0
+    while creados < total:
+        cantidad = min(lote, total - creados)
+        Producto.objects.bulk_create([
+            Producto(
+                nombre=f'Producto {i}',
+                descripcion=f'Descripción del producto {i}',
+                precio=Decimal(10 + i % 1000) + Decimal('0.99'),
+                stock=i % 20,
+                categoria=CATEGORIAS[i % len(CATEGORIAS)],
+                activo=i % 10 != 0,
+                codigo_producto=f'PRO{i + 1:07d}',
+            )
+            for i in range(creados, creados + cantidad)
+        ])
+        creados += cantidad
+
+
+def reiniciar_estado():
+    """Limpia la cache y los índices en memoria que sobreviven entre tests"""
+    cache.clear()
+    autocompletar._indice = None
+    catalogo._catalogo = None
+
+
+@override_settings(PRODUCTOS_COALESCENCIA_TTL=0, PRODUCTOS_COALESCENCIA_OBSOLETO=0, PRODUCTOS_SYNC_MARGEN_SEGUNDOS=0)
+class PresupuestoConsultasTests(TestCase):
+    """Número máximo de consultas SQL por endpoint para detectar N+1 y consultas de más"""
+
+    # Las dos aserciones ejecutan y cuentan los callbacks de on_commit (eventos, conteos), que
+    # dentro de TestCase no correrían nunca
+
+    @contextmanager
+    def assertNumQueries(self, num):
+        with super().assertNumQueries(num), self.captureOnCommitCallbacks(execute=True):
+            yield
+
+    @contextmanager
+    def assertMaxQueries(self, maximo):
+        with CaptureQueriesContext(connection) as contexto:
+            with self.captureOnCommitCallbacks(execute=True):
+                yield
+        self.assertLessEqual(
+            len(contexto), maximo,
+            '\n'.join(consulta['sql'] for consulta in contexto.captured_queries)
+        )
+
+    @contextmanager
+    def con_suscriptor(self):
+        """Conecta un cliente de eventos para que las escrituras lean y publiquen los productos"""
+        broker = eventos.Broker(eventos.BackendMemoria())
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        async def suscribir():
+            return broker.suscribir()
+
+        loop.run_until_complete(suscribir())
+        with mock.patch.object(eventos, '_broker', broker):
+            yield
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(50)
+        cls.producto = Producto.objects.filter(activo=True, stock__gt=5).first()
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def setUp(self):
+        reiniciar_estado()
+
+    def test_listado_cuenta_una_vez_por_filtro(self):
+        # Validadores (max(fecha_actualizacion) y conteo), conteo del filtro y página
+        with self.assertNumQueries(3):
+            self.client.get('/api/productos/?activo=true&ordering=-precio')
+        # El total ya está cacheado: la siguiente página son los validadores y una sola consulta
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/productos/?activo=true&ordering=-precio&page=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['conteo_estimado'])
+
+    def test_detalle(self):
+        with self.assertNumQueries(1):
+            self.client.get(f'/api/productos/{self.producto.pk}/')
+
+    def test_crear(self):
+        datos = {'nombre': 'Nuevo', 'descripcion': 'x', 'precio': '9.99', 'stock': 3}
+        # La tercera consulta es el movimiento de stock inicial
+        with self.assertNumQueries(3):
+            response = self.client.post('/api/productos/', datos, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_actualizar(self):
+        # SELECT, verificación del stock por almacén con la fila bloqueada, UPDATE, INSERT del
+        # movimiento y el SAVEPOINT/RELEASE de la transacción
+        with self.assertNumQueries(6):
+            response = self.client.patch(
+                f'/api/productos/{self.producto.pk}/', {'stock': 8}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_ajustar_stock(self):
+        # SELECT, SELECT ... FOR UPDATE con el stock por almacén, UPDATE, INSERT del movimiento y
+        # el SAVEPOINT/RELEASE de la transacción
+        with self.assertMaxQueries(6):
+            response = self.client.post(
+                f'/api/productos/{self.producto.pk}/ajustar_stock/',
+                {'cantidad': 1, 'operacion': 'restar'},
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_activar_desactivar(self):
+        with self.assertNumQueries(2):
+            self.client.post(f'/api/productos/{self.producto.pk}/activar_desactivar/')
+
+    def test_eliminar(self):
+        with self.assertNumQueries(2):
+            response = self.client.delete(f'/api/productos/{self.producto.pk}/')
+        self.assertEqual(response.status_code, 204)
+
+    def test_listas_especiales(self):
+        for accion in ['activos', 'con_stock', 'sin_stock', 'stock_bajo', 'por_categoria']:
+            with self.subTest(accion=accion), self.assertNumQueries(2):
+                self.client.get(f'/api/productos/{accion}/?categoria=Audio')
+
+    def test_estadisticas(self):
+        with self.assertNumQueries(8):
+            self.client.get('/api/productos/estadisticas/')
+
+    def test_estadisticas_asincronas(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/productos/estadisticas/?asincrono=true')
+        self.assertEqual(response.status_code, 202)
+
+    def test_cambios(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/productos/cambios/')
+
+    def test_autocompletar(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/productos/autocompletar/?q=prod')
+        # Con el índice cargado no se consulta la base de datos
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/productos/autocompletar/?q=producto 1')
+        self.assertTrue(response.json())
+
+    @override_settings(PRODUCTOS_AUTOCOMPLETAR_EN_MEMORIA=False)
+    def test_autocompletar_sin_indice(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/productos/autocompletar/?q=prod')
+
+    def test_lote(self):
+        ids = list(Producto.objects.order_by('-id').values_list('id', flat=True)[:20])
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                '/api/productos/lote/', {'ids': ids + [999999], 'campos': ['id', 'precio', 'estado_stock']},
+                content_type='application/json'
+            )
+        datos = response.json()
+        self.assertEqual([p['id'] for p in datos['resultados']], ids)
+        self.assertEqual(set(datos['resultados'][0]), {'id', 'precio', 'estado_stock'})
+        self.assertEqual(datos['faltantes'], [999999])
+
+    def test_lote_valores_escalares(self):
+        for datos in [{'ids': 5}, {'codigos': {'a': 1}}, {'ids': [1], 'campos': 3}]:
+            with self.subTest(datos=datos):
+                response = self.client.post('/api/productos/lote/', datos, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+
+    def test_acciones_admin(self):
+        self.client.force_login(self.admin)
+        ids = list(Producto.objects.values_list('id', flat=True)[:10])
+        url = reverse('admin:productos_producto_changelist')
+        for accion in ['activar_productos', 'desactivar_productos', 'aumentar_stock']:
+            # Sesión, usuario, conteo del changelist (la acción anterior lo invalidó), selección,
+            # UPDATE e INSERT de movimientos o guardado de sesión: no crece con la selección
+            with self.subTest(accion=accion), self.assertMaxQueries(6):
+                response = self.client.post(url, {'action': accion, '_selected_action': ids})
+            self.assertEqual(response.status_code, 302)
+
+    def test_escrituras_con_suscriptores(self):
+        # Con un cliente de eventos conectado se suma una sola lectura de los productos escritos
+        self.client.force_login(self.admin)
+        ids = list(Producto.objects.values_list('id', flat=True)[:10])
+        with self.con_suscriptor():
+            with self.assertMaxQueries(7):
+                self.client.post(reverse('admin:productos_producto_changelist'),
+                                 {'action': 'desactivar_productos', '_selected_action': ids})
+            # Sesión, usuario, SAVEPOINT/SELECT/UPDATE/RELEASE del lote, el lote vacío que termina el
+            # recorrido y la lectura para los eventos
+            with self.assertNumQueries(10):
+                response = self.client.post('/api/productos/masivo/', {'operacion': 'activar', 'ids': ids},
+                                            content_type='application/json')
+        self.assertEqual(response.json()['afectados'], 10)
+
+
+@override_settings(PRODUCTOS_COALESCENCIA_TTL=0, PRODUCTOS_COALESCENCIA_OBSOLETO=0, PRODUCTOS_UMBRAL_STOCK_BAJO=5)
+class EstadoStockTests(TestCase):
+    """El estado del stock se filtra y ordena en la base de datos con el mismo criterio que el modelo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Producto.objects.bulk_create([
+            Producto(nombre=nombre, descripcion='x', precio=Decimal('9.99'), stock=stock,
+                     activo=activo, codigo_producto=codigo)
+            for codigo, nombre, stock, activo in [
+                ('PRO0000001', 'Inactivo', 10, False),
+                ('PRO0000002', 'Agotado', 0, True),
+                ('PRO0000003', 'Escaso', 3, True),
+                ('PRO0000004', 'En el límite', 5, True),
+                ('PRO0000005', 'Abundante', 50, True),
+            ]
+        ])
+
+    def setUp(self):
+        reiniciar_estado()
+
+    def codigos(self, parametros):
+        response = self.client.get('/api/productos/', parametros)
+        self.assertEqual(response.status_code, 200)
+        return [p['codigo_producto'] for p in response.json()['results']]
+
+    def test_filtro_por_estado(self):
+        esperados = {
+            EstadoStock.INACTIVO: ['PRO0000001'],
+            EstadoStock.SIN_STOCK: ['PRO0000002'],
+            EstadoStock.STOCK_BAJO: ['PRO0000003', 'PRO0000004'],
+            EstadoStock.DISPONIBLE: ['PRO0000005'],
+        }
+        for estado, codigos in esperados.items():
+            with self.subTest(estado=estado):
+                self.assertEqual(self.codigos({'estado_stock': estado.value, 'ordering': 'stock'}), codigos)
+        self.assertEqual(self.client.get('/api/productos/', {'estado_stock': 'Agotado'}).status_code, 400)
+
+    def test_el_estado_anotado_coincide_con_el_modelo(self):
+        response = self.client.get('/api/productos/')
+        for datos in response.json()['results']:
+            producto = Producto.objects.get(pk=datos['id'])
+            self.assertEqual(datos['estado_stock'], producto.estado_stock)
+
+    def test_ordenamiento_por_estado(self):
+        # Por nivel, no por el texto: Inactivo, Sin stock, Stock bajo, Disponible
+        self.assertEqual(
+            self.codigos({'ordering': 'estado_stock,stock'}),
+            ['PRO0000001', 'PRO0000002', 'PRO0000003', 'PRO0000004', 'PRO0000005']
+        )
+        self.assertEqual(
+            self.codigos({'ordering': '-estado_stock,-stock'}),
+            ['PRO0000005', 'PRO0000004', 'PRO0000003', 'PRO0000002', 'PRO0000001']
+        )
+
+    @override_settings(PRODUCTOS_UMBRAL_STOCK_BAJO=2)
+    def test_respeta_el_umbral_configurado(self):
+        self.assertEqual(self.codigos({'estado_stock': EstadoStock.STOCK_BAJO.value}), [])
+        self.assertEqual(
+            self.codigos({'estado_stock': EstadoStock.DISPONIBLE.value, 'ordering': 'stock'}),
+            ['PRO0000003', 'PRO0000004', 'PRO0000005']
+        )
+
+
+@override_settings(PRODUCTOS_COALESCENCIA_TTL=0, PRODUCTOS_COALESCENCIA_OBSOLETO=0, PRODUCTOS_SYNC_MARGEN_SEGUNDOS=0)
+class SincronizacionTests(TestCase):
+    """El token de /cambios/ permite retomar la sincronización sin perder ni repetir productos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(6)
+        base = timezone.now() - timedelta(hours=1)
+        cls.ids = list(Producto.objects.order_by('id').values_list('id', flat=True))
+        # Los dos primeros comparten fecha: el id desempata
+        for posicion, pk in enumerate(cls.ids):
+            Producto.objects.filter(pk=pk).update(
+                activo=True, fecha_actualizacion=base + timedelta(minutes=max(posicion, 1))
+            )
+
+    def setUp(self):
+        reiniciar_estado()
+
+    def cambios(self, desde=None, limite=2):
+        parametros = {'limite': limite, **({'desde': desde} if desde else {})}
+        response = self.client.get('/api/productos/cambios/', parametros)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_recorre_todo_por_paginas_y_retoma_desde_el_token(self):
+        vistos, token, paginas = [], None, 0
+        while True:
+            datos = self.cambios(token)
+            vistos += [r['id'] for r in datos['resultados']]
+            token, paginas = datos['siguiente'], paginas + 1
+            if not datos['hay_mas']:
+                break
+        self.assertEqual(vistos, self.ids)
+        self.assertEqual(paginas, 3)
+
+        # Sin cambios nuevos el token se devuelve igual
+        datos = self.cambios(token)
+        self.assertEqual((datos['resultados'], datos['siguiente'], datos['hay_mas']), ([], token, False))
+
+        # Solo aparecen los productos modificados después del token, en el orden en que cambiaron
+        ahora = timezone.now() - timedelta(seconds=1)
+        Producto.objects.filter(pk=self.ids[3]).update(precio=Decimal('1.50'), fecha_actualizacion=ahora)
+        Producto.objects.filter(pk=self.ids[0]).update(precio=Decimal('2.50'), fecha_actualizacion=ahora)
+        datos = self.cambios(token, limite=10)
+        self.assertEqual([(r['id'], r['precio']) for r in datos['resultados']],
+                         [(self.ids[0], '2.50'), (self.ids[3], '1.50')])
+
+    def test_los_desactivados_llegan_como_marca_de_eliminacion(self):
+        token = self.cambios(limite=10)['siguiente']
+        self.client.delete(f'/api/productos/{self.ids[2]}/')
+        Producto.objects.filter(pk=self.ids[2]).update(fecha_actualizacion=timezone.now() - timedelta(seconds=1))
+
+        resultados = self.cambios(token)['resultados']
+        self.assertEqual(len(resultados), 1)
+        self.assertEqual(resultados[0]['id'], self.ids[2])
+        self.assertTrue(resultados[0]['eliminado'])
+        self.assertNotIn('precio', resultados[0])
+
+    @override_settings(PRODUCTOS_SYNC_MARGEN_SEGUNDOS=60)
+    def test_los_cambios_dentro_del_margen_esperan_al_siguiente_pedido(self):
+        token = self.cambios(limite=10)['siguiente']
+        Producto.objects.filter(pk=self.ids[0]).update(fecha_actualizacion=timezone.now())
+        self.assertEqual(self.cambios(token)['resultados'], [])
+
+    def test_token_y_limite_invalidos(self):
+        for parametros in [{'desde': 'no-es-un-token'}, {'limite': 'mucho'}]:
+            with self.subTest(parametros=parametros):
+                self.assertEqual(self.client.get('/api/productos/cambios/', parametros).status_code, 400)
+
+
+class BrokerEventosTests(TestCase):
+    """El broker entrega cada evento una sola vez a las suscripciones que coinciden con él"""
+
+    def setUp(self):
+        self.broker = eventos.Broker(eventos.BackendMemoria())
+
+    @staticmethod
+    async def recibidos(suscripcion):
+        eventos_recibidos = []
+        while (evento := await suscripcion.siguiente(espera=0.05)) is not None:
+            eventos_recibidos.append(evento)
+        return eventos_recibidos
+
+    def test_reparte_por_id_y_categoria(self):
+        async def escenario():
+            todos = self.broker.suscribir()
+            por_id = self.broker.suscribir(ids=[1])
+            por_categoria = self.broker.suscribir(categorias=['Audio'])
+            ambos = self.broker.suscribir(ids=[2], categorias=['Audio'])
+            # Se publica desde otro hilo, como hace on_commit en un worker WSGI
+            for evento in [{'id': 1, 'categoria': 'Laptops'}, {'id': 2, 'categoria': 'Audio'},
+                           {'id': 3, 'categoria': 'Gaming'}]:
+                await asyncio.to_thread(self.broker.publicar, evento)
+            return [[e['id'] for e in await self.recibidos(s)] for s in (todos, por_id, por_categoria, ambos)]
+
+        self.assertEqual(asyncio.run(escenario()), [[1, 2, 3], [1], [2], [2]])
+
+    def test_los_eventos_llevan_una_secuencia_creciente(self):
+        async def escenario():
+            suscripcion = self.broker.suscribir()
+            for producto_id in range(3):
+                self.broker.publicar({'id': producto_id})
+            return [e['secuencia'] for e in await self.recibidos(suscripcion)]
+
+        self.assertEqual(asyncio.run(escenario()), [1, 2, 3])
+
+    @override_settings(PRODUCTOS_EVENTOS_COLA_MAXIMA=2)
+    def test_un_cliente_lento_pierde_los_eventos_mas_antiguos(self):
+        async def escenario():
+            suscripcion = self.broker.suscribir()
+            for producto_id in range(5):
+                self.broker.publicar({'id': producto_id})
+            return [e['id'] for e in await self.recibidos(suscripcion)], suscripcion.perdidos
+
+        self.assertEqual(asyncio.run(escenario()), ([3, 4], 3))
+
+    def test_cancelar_deja_de_entregar(self):
+        async def escenario():
+            suscripcion = self.broker.suscribir(ids=[1], categorias=['Audio'])
+            self.assertEqual(self.broker.total_suscripciones(), 1)
+            self.broker.cancelar(suscripcion)
+            self.broker.publicar({'id': 1, 'categoria': 'Audio'})
+            return await self.recibidos(suscripcion)
+
+        self.assertEqual(asyncio.run(escenario()), [])
+        self.assertEqual(self.broker.total_suscripciones(), 0)
+        self.assertEqual((self.broker._por_id, self.broker._por_categoria), ({}, {}))
+
+    def test_las_suscripciones_de_un_loop_cerrado_se_cancelan(self):
+        async def suscribir():
+            return self.broker.suscribir()
+
+        asyncio.run(suscribir())
+        self.broker.publicar({'id': 1})
+        self.assertEqual(self.broker.total_suscripciones(), 0)
+
+    def test_notificar_cambios_publica_al_confirmar(self):
+        sembrar(1)
+        producto = Producto.objects.get()
+        publicados = []
+        self.broker.publicar = publicados.append
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        async def suscribir():
+            return self.broker.suscribir()
+
+        with mock.patch.object(eventos, '_broker', self.broker):
+            # Sin suscriptores no se leen los productos
+            with self.assertNumQueries(0), self.captureOnCommitCallbacks(execute=True):
+                eventos.notificar_cambios('actualizado', ids=[producto.pk])
+            self.assertEqual(publicados, [])
+
+            loop.run_until_complete(suscribir())
+            with self.captureOnCommitCallbacks(execute=True):
+                eventos.notificar_cambios('actualizado', ids=[producto.pk])
+                self.assertEqual(publicados, [])
+        self.assertEqual(publicados, [eventos.evento_producto(producto, 'actualizado')])
+
+
+@override_settings(PRODUCTOS_COALESCENCIA_TTL=5, PRODUCTOS_COALESCENCIA_OBSOLETO=5, PRODUCTOS_SYNC_MARGEN_SEGUNDOS=0)
+class CoalescenciaTests(TestCase):
+    """Las solicitudes idénticas comparten un solo cálculo y su resultado mientras está fresco"""
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(20)
+
+    def setUp(self):
+        reiniciar_estado()
+        self.coalescedor = Coalescedor(prefijo='prueba')
+        self.llamadas = 0
+
+    def calcular(self, liberar=None, cacheable=True):
+        def funcion():
+            self.llamadas += 1
+            if liberar is not None:
+                liberar.wait(5)
+            return self.llamadas, cacheable
+        return funcion
+
+    def en_hilo(self, resultados, *args, **kwargs):
+        hilo = threading.Thread(target=lambda: resultados.append(self.coalescedor.ejecutar(*args, **kwargs)))
+        hilo.start()
+        return hilo
+
+    def esperar_vuelo(self):
+        limite = time.monotonic() + 5
+        while not self.coalescedor._en_vuelo and time.monotonic() < limite:
+            time.sleep(0.01)
+
+    def test_las_solicitudes_concurrentes_comparten_el_calculo(self):
+        liberar, resultados = threading.Event(), []
+        hilos = [self.en_hilo(resultados, 'clave', self.calcular(liberar))]
+        self.esperar_vuelo()
+        hilos += [self.en_hilo(resultados, 'clave', self.calcular()) for _ in range(4)]
+        time.sleep(0.1)
+        liberar.set()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(self.llamadas, 1)
+        self.assertEqual(sorted(resultados), [(1, 'coalescido')] * 4 + [(1, 'lider')])
+        # Mientras está fresco se sirve desde la cache sin recalcular
+        self.assertEqual(self.coalescedor.ejecutar('clave', self.calcular()), (1, 'cache'))
+        self.assertEqual(self.coalescedor.ejecutar('otra', self.calcular()), (2, 'lider'))
+
+    def test_sirve_el_valor_obsoleto_mientras_se_recalcula(self):
+        self.coalescedor.ejecutar('clave', self.calcular(), ttl=0.05)
+        time.sleep(0.1)
+        liberar, resultados = threading.Event(), []
+        hilo = self.en_hilo(resultados, 'clave', self.calcular(liberar), ttl=0.05)
+        self.esperar_vuelo()
+        self.assertEqual(self.coalescedor.ejecutar('clave', self.calcular(), ttl=0.05), (1, 'obsoleto'))
+        liberar.set()
+        hilo.join()
+        self.assertEqual(resultados, [(2, 'lider')])
+
+    def test_los_resultados_no_cacheables_y_los_errores_no_se_comparten(self):
+        self.coalescedor.ejecutar('clave', self.calcular(cacheable=False))
+        self.assertEqual(self.coalescedor.ejecutar('clave', self.calcular()), (2, 'lider'))
+
+        def fallar():
+            raise RuntimeError('falla')
+        with self.assertRaises(RuntimeError):
+            self.coalescedor.ejecutar('error', fallar)
+        self.assertEqual(self.coalescedor.ejecutar('error', self.calcular()), (3, 'lider'))
+        self.assertEqual(self.coalescedor._en_vuelo, {})
+
+    def test_listado_cacheado_hasta_la_siguiente_escritura(self):
+        def origen(url):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return response['X-Coalescencia']
+
+        self.assertEqual(origen('/api/productos/?activo=true&ordering=precio'), 'lider')
+        # El orden de los parámetros no cambia la clave
+        self.assertEqual(origen('/api/productos/?ordering=precio&activo=true'), 'cache')
+        self.assertEqual(origen('/api/productos/?activo=false&ordering=precio'), 'lider')
+
+        producto = Producto.objects.filter(activo=True).first()
+        self.client.patch(f'/api/productos/{producto.pk}/', {'precio': '1.00'}, content_type='application/json')
+        self.assertEqual(origen('/api/productos/?activo=true&ordering=precio'), 'lider')
+
+
+@override_settings(PRODUCTOS_COALESCENCIA_TTL=0, PRODUCTOS_COALESCENCIA_OBSOLETO=0, PRODUCTOS_CONTEO_UMBRAL_ESTIMADO=1000)
+class ConteosTests(TestCase):
+    """Los totales se cachean por consulta hasta la siguiente escritura y se estiman en tablas grandes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(30)
+
+    def setUp(self):
+        reiniciar_estado()
+
+    def test_el_conteo_se_cachea_por_consulta(self):
+        activos = Producto.objects.filter(activo=True)
+        esperado = activos.count()
+        with self.assertNumQueries(1):
+            self.assertEqual(conteo.contar(activos), (esperado, False))
+        with self.assertNumQueries(0):
+            self.assertEqual(conteo.contar(Producto.objects.filter(activo=True)), (esperado, False))
+        # Otro filtro es otra entrada
+        with self.assertNumQueries(1):
+            self.assertEqual(conteo.contar(Producto.objects.filter(activo=False)), (30 - esperado, False))
+
+    def test_las_escrituras_invalidan_los_conteos(self):
+        self.assertEqual(self.client.get('/api/productos/').json()['count'], 30)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/productos/', {
+                'nombre': 'Nuevo', 'descripcion': 'x', 'precio': '9.99', 'stock': 3,
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.get('/api/productos/').json()['count'], 31)
+
+        # Un UPDATE directo no pasa por notificar_cambios: hasta invalidar se sirve el total anterior
+        activos = conteo.contar(Producto.objects.filter(activo=True))[0]
+        Producto.objects.filter(activo=True).update(activo=False)
+        self.assertEqual(conteo.contar(Producto.objects.filter(activo=True))[0], activos)
+        conteo.invalidar_conteos()
+        self.assertEqual(conteo.contar(Producto.objects.filter(activo=True))[0], 0)
+
+    def test_los_demas_listados_cuentan_sin_cache(self):
+        for url, datos, codigo in [
+            ('/api/almacenes/', {'codigo': 'A1', 'nombre': 'Central'}, 201),
+            ('/api/tareas/', {'tipo': 'estadisticas'}, 202),
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).json()['count'], 0)
+                self.assertEqual(self.client.post(url, datos, content_type='application/json').status_code, codigo)
+                respuesta = self.client.get(url).json()
+                self.assertEqual((respuesta['count'], len(respuesta['results'])), (1, 1))
+
+    def test_sobre_el_umbral_se_usa_la_estimacion(self):
+        with mock.patch.object(conteo, 'estimar', return_value=250000):
+            datos = self.client.get('/api/productos/?activo=true').json()
+        self.assertEqual((datos['count'], datos['conteo_estimado']), (250000, True))
+        self.assertEqual(len(datos['results']), 10)
+
+    def test_bajo_el_umbral_se_cuenta_exacto(self):
+        with mock.patch.object(conteo, 'estimar', return_value=999):
+            datos = self.client.get('/api/productos/').json()
+        self.assertEqual((datos['count'], datos['conteo_estimado']), (30, False))
+
+    def test_sin_estimacion_en_sqlite(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest('PostgreSQL ofrece la estimación del planificador')
+        self.assertIsNone(conteo.estimar(Producto.objects.all()))
+
+
+class EscriturasParcialesTests(TestCase):
+    """Los guardados escriben solo las columnas modificadas y omiten los que no cambian nada"""
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(5)
+
+    def test_save_solo_escribe_lo_modificado(self):
+        producto = Producto.objects.first()
+        with self.assertNumQueries(0):
+            producto.save()
+        producto.stock += 1
+        with CaptureQueriesContext(connection) as contexto:
+            producto.save()
+        sql = contexto.captured_queries[0]['sql']
+        self.assertIn('"stock"', sql)
+        self.assertNotIn('"descripcion"', sql)
+        self.assertEqual(producto.campos_modificados(), [])
+
+    def test_list_editable_con_un_solo_update(self):
+        productos = list(Producto.objects.filter(activo=True).order_by('-fecha_creacion')[:3])
+        datos = {'form-TOTAL_FORMS': '3', 'form-INITIAL_FORMS': '3', '_save': 'Guardar'}
+        for i, producto in enumerate(productos):
+            datos.update({f'form-{i}-id': producto.pk, f'form-{i}-stock': producto.stock, f'form-{i}-activo': 'on'})
+        # Sin cambios el primero, stock en el segundo y desactivado con más stock el tercero
+        datos['form-1-stock'] = productos[1].stock + 4
+        datos['form-2-stock'] = productos[2].stock + 1
+        del datos['form-2-activo']
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.post(reverse('admin:productos_producto_changelist'), datos)
+        self.assertEqual(response.status_code, 302)
+        updates = [c for c in contexto.captured_queries if c['sql'].startswith('UPDATE "productos_producto"')]
+        self.assertEqual(len(updates), 1)
+        inserts = [c for c in contexto.captured_queries if c['sql'].startswith('INSERT INTO "productos_movimientostock"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Producto.objects.get(pk=productos[1].pk).stock, productos[1].stock + 4)
+        self.assertFalse(Producto.objects.get(pk=productos[2].pk).activo)
+        self.assertEqual(
+            list(MovimientoStock.objects.order_by('producto_id').values_list('producto_id', 'cantidad')),
+            sorted([(productos[1].pk, 4), (productos[2].pk, 1)])
+        )
+
+
+@override_settings(PRODUCTOS_COALESCENCIA_TTL=0, PRODUCTOS_COALESCENCIA_OBSOLETO=0)
+class SolicitudesCondicionalesTests(TestCase):
+    """ETag y Last-Modified permiten responder 304 con una consulta y detectar escrituras en conflicto"""
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(10)
+        cls.producto = Producto.objects.first()
+
+    def setUp(self):
+        reiniciar_estado()
+
+    def test_detalle_no_modificado(self):
+        url = f'/api/productos/{self.producto.pk}/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_listados_no_modificados_hasta_una_escritura(self):
+        for ruta in ['/api/productos/?categoria=Audio', '/api/productos/stock_bajo/', '/api/productos/estadisticas/']:
+            with self.subTest(ruta=ruta):
+                respuesta = self.client.get(ruta)
+                self.assertIn('Last-Modified', respuesta)
+                with self.assertNumQueries(1):
+                    response = self.client.get(ruta, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+        etag = self.client.get('/api/productos/')['ETag']
+        self.client.patch(f'/api/productos/{self.producto.pk}/', {'stock': 1}, content_type='application/json')
+        self.assertEqual(self.client.get('/api/productos/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_id_invalido_con_encabezados_condicionales(self):
+        self.assertEqual(self.client.get('/api/productos/abc/', HTTP_IF_NONE_MATCH='"x"').status_code, 404)
+        response = self.client.patch(
+            '/api/productos/abc/', {'stock': 1}, content_type='application/json', HTTP_IF_MATCH='"x"'
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_if_match_en_actualizaciones(self):
+        url = f'/api/productos/{self.producto.pk}/'
+        etag = self.client.get(url)['ETag']
+        response = self.client.patch(url, {'stock': 2}, content_type='application/json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # El ETag anterior ya no corresponde al producto: la escritura se rechaza
+        response = self.client.patch(url, {'stock': 3}, content_type='application/json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, 2)
+
+
+@override_settings(PRODUCTOS_COALESCENCIA_TTL=0, PRODUCTOS_COALESCENCIA_OBSOLETO=0, PRODUCTOS_BATCH_HILOS=1)
+class SolicitudesCompuestasTests(TestCase):
+    """/api/batch/ resuelve varias llamadas en un request y comparte las consultas repetidas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(10)
+        cls.producto = Producto.objects.first()
+
+    def setUp(self):
+        reiniciar_estado()
+
+    def compuesta(self, solicitudes):
+        return self.client.post('/api/batch/', {'solicitudes': solicitudes}, content_type='application/json')
+
+    def test_pantalla_en_una_solicitud(self):
+        solicitudes = [
+            {'id': 'bajos', 'ruta': '/api/productos/stock_bajo/'},
+            {'id': 'audio', 'ruta': '/api/productos/?categoria=Audio', 'parametros': {'ordering': '-precio'}},
+            {'id': 'repetida', 'ruta': '/api/productos/stock_bajo/'},
+        ]
+        # Un solo agregado para los ETag de las tres partes y ninguna consulta para la repetida
+        with self.assertNumQueries(4):
+            response = self.compuesta(solicitudes)
+        self.assertEqual(response.status_code, 200)
+        resultados = response.json()['resultados']
+        self.assertEqual([r['id'] for r in resultados], ['bajos', 'audio', 'repetida'])
+        self.assertEqual({r['estado'] for r in resultados}, {200})
+        self.assertEqual(resultados[0]['datos'], resultados[2]['datos'])
+        self.assertEqual([r['compartida'] for r in resultados], [False, False, True])
+
+    def test_escrituras_en_orden(self):
+        url = f'/api/productos/{self.producto.pk}/'
+        resultados = self.compuesta([
+            {'id': 'antes', 'ruta': url},
+            {'id': 'editar', 'metodo': 'PATCH', 'ruta': url, 'datos': {'stock': 77}},
+            {'id': 'despues', 'ruta': url},
+            {'id': 'admin', 'ruta': '/admin/'},
+        ]).json()['resultados']
+        self.assertEqual([r['estado'] for r in resultados], [200, 200, 200, 400])
+        self.assertNotEqual(resultados[0]['datos']['stock'], 77)
+        self.assertEqual(resultados[2]['datos']['stock'], 77)
+
+    def test_cuerpo_invalido(self):
+        self.assertEqual(self.compuesta([]).status_code, 400)
+        self.assertEqual(self.compuesta([{'metodo': 'GET'}]).status_code, 400)
+        with self.settings(PRODUCTOS_BATCH_MAXIMO=2):
+            self.assertEqual(self.compuesta([{'ruta': '/api/productos/'}] * 3).status_code, 400)
+
+
+@override_settings(PRODUCTOS_COALESCENCIA_TTL=0, PRODUCTOS_COALESCENCIA_OBSOLETO=0, PRODUCTOS_BATCH_HILOS=4)
+class SolicitudesCompuestasConcurrentesTests(TransactionTestCase):
+    """Las lecturas de /api/batch/ corren en el pool de hilos, cada una con su conexión"""
+
+    def setUp(self):
+        sembrar(60)
+        reiniciar_estado()
+        self.addCleanup(self.cerrar_executor)
+        compuestas._executor = None
+
+    @staticmethod
+    def cerrar_executor():
+        if compuestas._executor is not None:
+            compuestas._executor.shutdown()
+            compuestas._executor = None
+
+    def compuesta(self, solicitudes):
+        response = self.client.post('/api/batch/', {'solicitudes': solicitudes}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['resultados']
+
+    def test_lecturas_en_paralelo_dan_lo_mismo_que_en_orden(self):
+        producto = Producto.objects.filter(activo=True).first()
+        url = f'/api/productos/{producto.pk}/'
+        solicitudes = [
+            {'id': 'bajos', 'ruta': '/api/productos/stock_bajo/'},
+            {'id': 'audio', 'ruta': '/api/productos/', 'parametros': {'categoria': 'Audio', 'page': 2}},
+            {'id': 'detalle', 'ruta': url},
+            {'id': 'repetida', 'ruta': '/api/productos/stock_bajo/'},
+            {'id': 'editar', 'metodo': 'PATCH', 'ruta': url, 'datos': {'stock': 77}},
+            {'id': 'despues', 'ruta': url},
+            {'id': 'listado', 'ruta': '/api/productos/', 'parametros': {'ordering': '-stock'}},
+        ]
+        # Referencia: las lecturas en orden sobre la conexión del request
+        with self.settings(PRODUCTOS_BATCH_HILOS=1):
+            en_orden = self.compuesta(solicitudes[:4])
+        reiniciar_estado()
+
+        hilos = set()
+        ejecutar_parte = compuestas.ejecutar_parte
+
+        def registrar_hilo(*args):
+            hilos.add(threading.current_thread().name)
+            return ejecutar_parte(*args)
+
+        with mock.patch.object(compuestas, 'ejecutar_parte', registrar_hilo):
+            paralelas = self.compuesta(solicitudes)
+        self.assertTrue(any(nombre.startswith('batch') for nombre in hilos))
+
+        self.assertEqual([r['estado'] for r in paralelas], [200] * 7)
+        self.assertEqual([r['compartida'] for r in paralelas], [False, False, False, True, False, False, False])
+        self.assertEqual(paralelas[0]['datos'], paralelas[3]['datos'])
+        self.assertEqual(paralelas[5]['datos']['stock'], 77)
+        self.assertEqual(paralelas[6]['datos']['results'][0]['id'], producto.pk)
+        self.assertEqual([r['datos'] for r in en_orden], [r['datos'] for r in paralelas[:4]])
+
+
+@override_settings(PRODUCTOS_SYNC_MARGEN_SEGUNDOS=0)
+class AutocompletarTests(TestCase):
+    """El índice en memoria ignora acentos y mayúsculas y sigue los borrados"""
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(10)
+        cls.camara = Producto.objects.create(nombre='Cámara Réflex', descripcion='x', precio='99.00', stock=1)
+
+    def setUp(self):
+        reiniciar_estado()
+
+    def buscar(self, texto):
+        response = self.client.get('/api/productos/autocompletar/', {'q': texto})
+        return [p['id'] for p in response.json()]
+
+    def test_sin_acentos_ni_mayusculas(self):
+        self.assertEqual(self.buscar('cam'), [self.camara.pk])
+        self.assertEqual(self.buscar('REFLEX'), [self.camara.pk])
+        self.assertEqual(self.buscar(self.camara.codigo_producto.lower()), [self.camara.pk])
+
+    def test_borrado_fisico_sale_del_indice(self):
+        producto = Producto.objects.get(nombre='Producto 1')
+        self.assertIn(producto.pk, self.buscar('producto 1'))
+        with self.captureOnCommitCallbacks(execute=True):
+            producto.delete()
+        self.assertNotIn(producto.pk, self.buscar('producto 1'))
+
+
+@override_settings(
+    PRODUCTOS_COALESCENCIA_TTL=0, PRODUCTOS_COALESCENCIA_OBSOLETO=0, PRODUCTOS_SYNC_MARGEN_SEGUNDOS=0,
+    PRODUCTOS_CATALOGO_REFRESCO_SEGUNDOS=0,
+)
+class CatalogoEnMemoriaTests(TestCase):
+    """El catálogo en memoria responde lo mismo que las consultas del ORM"""
+
+    RUTAS = [
+        '/api/productos/activos/',
+        '/api/productos/con_stock/',
+        '/api/productos/sin_stock/',
+        '/api/productos/stock_bajo/',
+        '/api/productos/por_categoria/?categoria=audio',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(40)
+
+    def setUp(self):
+        reiniciar_estado()
+
+    def respuestas(self, en_memoria):
+        with self.settings(PRODUCTOS_CATALOGO_EN_MEMORIA=en_memoria):
+            return {
+                ruta: sorted(self.client.get(ruta).json(), key=lambda p: p['id'])
+                for ruta in self.RUTAS
+            }
+
+    def test_mismo_resultado_que_el_orm(self):
+        self.assertEqual(self.respuestas(True), self.respuestas(False))
+
+    def test_borrado_fisico_sale_del_catalogo(self):
+        self.respuestas(True)
+        producto = Producto.objects.filter(activo=True, categoria='Audio').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            producto.delete()
+        memoria = self.respuestas(True)
+        self.assertNotIn(producto.pk, [p['id'] for p in memoria['/api/productos/activos/']])
+        self.assertEqual(memoria, self.respuestas(False))
+
+    @override_settings(PRODUCTOS_SYNC_MARGEN_SEGUNDOS=0)
+    def test_corregir_y_reconstruir_los_ordenes_dan_lo_mismo(self):
+        corregido, reconstruido = catalogo.CatalogoEnMemoria(), catalogo.CatalogoEnMemoria()
+        corregido.refrescar()
+        reconstruido.refrescar()
+        ids = Producto.objects.order_by('id').values('id')[:15]
+        Producto.objects.filter(pk__in=ids).update(
+            stock=F('stock') + 7, categoria='Audio', activo=True, fecha_actualizacion=timezone.now()
+        )
+        with mock.patch.object(catalogo, 'REUBICAR_MAXIMO', 1000):
+            self.assertEqual(corregido.refrescar(), 15)
+        with mock.patch.object(catalogo, 'REUBICAR_MAXIMO', 0):
+            self.assertEqual(reconstruido.refrescar(), 15)
+
+        def ordenes(instantanea):
+            return (
+                {campo: list(orden) for campo, orden in instantanea.ordenes.items()},
+                {codigo: list(grupo) for codigo, grupo in instantanea.por_categoria.items() if grupo},
+            )
+        self.assertEqual(ordenes(corregido), ordenes(reconstruido))
+
+
+class TareasTests(TestCase):
+    """Las tareas validan sus parámetros al encolarse y el worker las ejecuta"""
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(3)
+        cls.ids = list(Producto.objects.order_by('id').values_list('id', flat=True))
+
+    def encolar(self, tipo, parametros):
+        return self.client.post('/api/tareas/', {'tipo': tipo, 'parametros': parametros}, content_type='application/json')
+
+    def test_parametros_invalidos(self):
+        for tipo, parametros in [
+            ('aumentar_stock', {'ids': self.ids, 'cantidad': -100}),
+            ('aumentar_stock', [1, 2]),
+            ('activar_productos', {'ids': 'todos'}),
+            ('desactivar_productos', {}),
+            ('resumenes', {'periodo': 'semana'}),
+        ]:
+            with self.subTest(tipo=tipo, parametros=parametros):
+                response = self.encolar(tipo, parametros)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('parametros', response.json())
+        self.assertFalse(Tarea.objects.exists())
+
+    def test_encolar_y_ejecutar(self):
+        stocks = dict(Producto.objects.values_list('id', 'stock'))
+        response = self.encolar('aumentar_stock', {'ids': self.ids[:2], 'cantidad': '5'})
+        self.assertEqual(response.status_code, 202)
+        ejecutar_tarea(reclamar_siguiente())
+        tarea = Tarea.objects.get()
+        self.assertEqual(tarea.estado, Tarea.Estado.COMPLETADA)
+        self.assertEqual(tarea.resultado, {'actualizados': 2})
+        nuevos = dict(Producto.objects.values_list('id', 'stock'))
+        self.assertEqual([nuevos[i] - stocks[i] for i in self.ids], [5, 5, 0])
+
+    def test_tareas_abandonadas_se_reencolan_y_continuan(self):
+        stocks = dict(Producto.objects.values_list('id', 'stock'))
+        tarea = encolar('aumentar_stock', {'ids': self.ids, 'cantidad': 1})
+        reclamar_siguiente()
+        # El worker se cayó después de confirmar el lote del primer producto
+        Tarea.objects.filter(pk=tarea.pk).update(
+            resultado={'ultimo_id': self.ids[0], 'actualizados': 1},
+            fecha_latido=timezone.now() - timedelta(hours=1),
+        )
+        Producto.objects.filter(pk=self.ids[0]).update(stock=F('stock') + 1)
+
+        self.assertEqual(recuperar_vencidas(), (1, 0))
+        ejecutar_tarea(reclamar_siguiente())
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos), (Tarea.Estado.COMPLETADA, 2))
+        self.assertEqual(tarea.resultado, {'actualizados': 3})
+        nuevos = dict(Producto.objects.values_list('id', 'stock'))
+        self.assertEqual([nuevos[i] - stocks[i] for i in self.ids], [1, 1, 1])
+
+    @override_settings(PRODUCTOS_TAREAS_INTENTOS_MAXIMOS=1)
+    def test_tareas_que_agotan_los_intentos_fallan(self):
+        tarea = encolar('estadisticas')
+        reclamar_siguiente()
+        Tarea.objects.filter(pk=tarea.pk).update(fecha_latido=timezone.now() - timedelta(hours=1))
+        self.assertEqual(recuperar_vencidas(), (0, 1))
+        self.assertEqual(Tarea.objects.get().estado, Tarea.Estado.FALLIDA)
+
+
+class InventarioTests(TestCase):
+    """El total de Producto.stock se mantiene con los movimientos por almacén"""
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(1)
+        cls.producto = Producto.objects.get()
+        cls.central = Almacen.objects.create(codigo='A1', nombre='Central')
+        cls.norte = Almacen.objects.create(codigo='B1', nombre='Norte')
+
+    def test_movimientos_y_transferencias_mantienen_el_total(self):
+        stock_inicial = self.producto.stock
+        url = f'/api/productos/{self.producto.pk}/'
+        self.client.post(url + 'stock_almacenes/', {'movimientos': [
+            {'almacen': self.central.pk, 'cantidad': 10},
+            {'almacen': self.norte.pk, 'cantidad': 4},
+        ]}, content_type='application/json')
+        response = self.client.post(url + 'transferir/', {'transferencias': [
+            {'origen': self.central.pk, 'destino': self.norte.pk, 'cantidad': 6},
+        ]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['producto']['stock'], stock_inicial + 14)
+        cantidades = dict(StockAlmacen.objects.values_list('almacen__codigo', 'cantidad'))
+        self.assertEqual(cantidades, {'A1': 4, 'B1': 10})
+
+    def test_stock_insuficiente_no_aplica_ningun_movimiento(self):
+        response = self.client.post(f'/api/productos/{self.producto.pk}/stock_almacenes/', {'movimientos': [
+            {'almacen': self.central.pk, 'cantidad': 5},
+            {'almacen': self.norte.pk, 'cantidad': -1},
+        ]}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StockAlmacen.objects.exists())
+
+    def test_almacen_inactivo_solo_entrega_stock(self):
+        url = f'/api/productos/{self.producto.pk}/'
+        self.client.post(url + 'stock_almacenes/', {'movimientos': [{'almacen': self.central.pk, 'cantidad': 5}]},
+                         content_type='application/json')
+        self.client.patch(f'/api/almacenes/{self.central.pk}/', {'activo': False}, content_type='application/json')
+
+        response = self.client.post(url + 'transferir/', {'transferencias': [
+            {'origen': self.central.pk, 'destino': self.norte.pk, 'cantidad': 3},
+        ]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(url + 'ajustar_stock/', {
+            'cantidad': 2, 'operacion': 'restar', 'almacen': self.central.pk,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(url + 'transferir/', {'transferencias': [
+            {'origen': self.norte.pk, 'destino': self.central.pk, 'cantidad': 1},
+        ]}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(dict(StockAlmacen.objects.values_list('almacen__codigo', 'cantidad')), {'A1': 0, 'B1': 3})
+
+    def test_eliminar_almacen_con_historia(self):
+        vacio = Almacen.objects.create(codigo='C1', nombre='Vacío')
+        self.assertEqual(self.client.delete(f'/api/almacenes/{vacio.pk}/').status_code, 204)
+        self.client.post(f'/api/productos/{self.producto.pk}/stock_almacenes/', {'movimientos': [
+            {'almacen': self.central.pk, 'cantidad': 1},
+        ]}, content_type='application/json')
+        response = self.client.delete(f'/api/almacenes/{self.central.pk}/')
+        self.assertEqual(response.status_code, 409)
+        self.assertTrue(Almacen.objects.filter(pk=self.central.pk).exists())
+
+
+class StockSinAlmacenTests(TestCase):
+    """Las escrituras que no indican almacén no pueden tomar stock asignado a un almacén"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producto = Producto.objects.create(nombre='Parlante', descripcion='x', precio='10.00', stock=0)
+        cls.almacen = Almacen.objects.create(codigo='A1', nombre='Central')
+
+    def setUp(self):
+        self.url = f'/api/productos/{self.producto.pk}/'
+        self.client.post(self.url + 'stock_almacenes/', {'movimientos': [
+            {'almacen': self.almacen.pk, 'cantidad': 10},
+        ]}, content_type='application/json')
+
+    def ajustar(self, **datos):
+        return self.client.post(self.url + 'ajustar_stock/', datos, content_type='application/json')
+
+    def test_restar_sin_almacen_solo_usa_el_stock_no_asignado(self):
+        self.assertEqual(self.ajustar(cantidad=3).status_code, 200)
+        self.assertEqual(self.ajustar(cantidad=8, operacion='restar').status_code, 400)
+        self.assertEqual(self.ajustar(cantidad=3, operacion='restar').status_code, 200)
+        self.assertEqual(self.ajustar(cantidad=-1).status_code, 400)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, 10)
+
+    def test_el_total_no_baja_del_stock_asignado(self):
+        response = self.client.patch(self.url, {'stock': 0}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('stock', response.json())
+
+        ids = [self.producto.pk]
+        for operacion, valor in [('fijar_stock', 4), ('ajustar_stock', -1)]:
+            response = self.client.post('/api/productos/masivo/', {
+                'operacion': operacion, 'valor': valor, 'ids': ids
+            }, content_type='application/json')
+            self.assertEqual(response.json()['afectados'], 0)
+
+        # Restar del almacén sigue funcionando y el total nunca queda negativo
+        self.assertEqual(self.ajustar(cantidad=10, operacion='restar', almacen=self.almacen.pk).status_code, 200)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, 0)
+
+    def test_admin_valida_el_stock_asignado(self):
+        self.producto.refresh_from_db()
+        self.producto.stock = 5
+        with self.assertRaises(ValidationError):
+            self.producto.full_clean()
+
+
+class OperacionesMasivasTests(TestCase):
+    """Las operaciones masivas se aplican con un UPDATE por lote sobre ids o filtros del listado"""
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(30)
+
+    def masivo(self, datos, filtros=''):
+        return self.client.post(f'/api/productos/masivo/{filtros}', datos, content_type='application/json')
+
+    def test_simulacion_no_modifica(self):
+        esperados = Producto.objects.filter(categoria='Audio', activo=True).count()
+        response = self.masivo({'operacion': 'desactivar', 'simulacion': True}, '?categoria=Audio')
+        self.assertEqual(response.json()['afectados'], esperados)
+        self.assertEqual(Producto.objects.filter(categoria='Audio', activo=True).count(), esperados)
+
+    @override_settings(PRODUCTOS_MASIVO_LOTE=4)
+    def test_desactivar_por_filtro_en_lotes(self):
+        esperados = Producto.objects.filter(categoria='Audio', activo=True).count()
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.masivo({'operacion': 'eliminar'}, '?categoria=Audio')
+        self.assertEqual(response.json()['afectados'], esperados)
+        self.assertFalse(Producto.objects.filter(categoria='Audio', activo=True).exists())
+        updates = [c for c in contexto.captured_queries if c['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), -(-esperados // 4))
+
+    def test_stock_y_precio_por_ids(self):
+        ids = list(Producto.objects.order_by('id').values_list('id', flat=True)[:3])
+        precios = dict(Producto.objects.filter(pk__in=ids).values_list('id', 'precio'))
+        self.assertEqual(self.masivo({'operacion': 'fijar_stock', 'valor': 7, 'ids': ids}).json()['afectados'], 3)
+        self.assertEqual(self.masivo({'operacion': 'ajustar_stock', 'valor': -2, 'ids': ids}).json()['afectados'], 3)
+        self.masivo({'operacion': 'precio_porcentaje', 'valor': 10, 'ids': ids})
+
+        for producto in Producto.objects.filter(pk__in=ids):
+            self.assertEqual(producto.stock, 5)
+            self.assertEqual(producto.precio, (precios[producto.pk] * Decimal('1.1')).quantize(Decimal('0.01')))
+        self.assertEqual(MovimientoStock.objects.filter(producto_id=ids[0], tipo='masivo').count(), 2)
+
+    def test_requiere_ids_o_filtros(self):
+        self.assertEqual(self.masivo({'operacion': 'desactivar'}).status_code, 400)
+        self.assertEqual(self.masivo({'operacion': 'fijar_stock', 'ids': [1]}).status_code, 400)
+
+    def test_ids_que_no_son_una_lista_de_enteros(self):
+        activos = Producto.objects.filter(activo=True).count()
+        for ids in ['12', {'1': True, '2': True}, 12, [1.5], [True], ['1', 'x']]:
+            with self.subTest(ids=ids):
+                self.assertEqual(self.masivo({'operacion': 'desactivar', 'ids': ids}).status_code, 400)
+        self.assertEqual(Producto.objects.filter(activo=True).count(), activos)
+
+    def test_valores_fuera_de_rango(self):
+        ids = list(Producto.objects.values_list('pk', flat=True)[:2])
+        for operacion, valor in [
+            ('precio_porcentaje', '1e30'), ('precio_porcentaje', 1001),
+            ('fijar_stock', 2 ** 31), ('fijar_stock', 10 ** 30), ('ajustar_stock', -(2 ** 31)),
+        ]:
+            with self.subTest(operacion=operacion, valor=valor):
+                response = self.masivo({'operacion': operacion, 'valor': valor, 'ids': ids})
+                self.assertEqual(response.status_code, 400)
+
+    def test_no_desborda_las_columnas(self):
+        caro, barato = Producto.objects.all()[:2]
+        Producto.objects.filter(pk=caro.pk).update(precio=Decimal('50000000.00'), stock=2 ** 31 - 10)
+        Producto.objects.filter(pk=barato.pk).update(precio=Decimal('10.00'), stock=0)
+        ids = [caro.pk, barato.pk]
+
+        self.assertEqual(self.masivo({'operacion': 'precio_porcentaje', 'valor': 1000, 'ids': ids}).json()['afectados'], 1)
+        self.assertEqual(self.masivo({'operacion': 'ajustar_stock', 'valor': 100, 'ids': ids}).json()['afectados'], 1)
+        caro.refresh_from_db()
+        barato.refresh_from_db()
+        self.assertEqual((caro.precio, caro.stock), (Decimal('50000000.00'), 2 ** 31 - 10))
+        self.assertEqual((barato.precio, barato.stock), (Decimal('110.00'), 100))
+
+    def test_parametros_desconocidos_no_alcanzan_todo_el_catalogo(self):
+        activos = Producto.objects.filter(activo=True).count()
+        for filtros in ['?stock_max=5', '?categria=Audio', '?format=json', '?categoria=']:
+            with self.subTest(filtros=filtros):
+                self.assertEqual(self.masivo({'operacion': 'eliminar'}, filtros).status_code, 400)
+        self.assertEqual(Producto.objects.filter(activo=True).count(), activos)
+
+
+class ResumenesTests(TestCase):
+    """Los resúmenes por categoría son idempotentes y las tendencias solo los leen a ellos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(20)
+
+    def test_resumen_idempotente_e_incremental(self):
+        ayer = timezone.now() - timedelta(days=1)
+        fecha, filas, recalculado = generar_resumenes('dia', ahora=ayer)
+        self.assertTrue(recalculado)
+        self.assertEqual(filas, len(CATEGORIAS))
+        self.assertEqual(generar_resumenes('dia', ahora=ayer)[1:], (filas, False))
+        self.assertEqual(ResumenCategoria.objects.filter(fecha=fecha).count(), filas)
+
+        # Sin cambios el día siguiente copia el resumen; con cambios lo recalcula
+        self.assertFalse(generar_resumenes('dia')[2])
+        Producto.objects.filter(categoria='Audio').update(activo=False, fecha_actualizacion=timezone.now())
+        self.assertTrue(generar_resumenes('dia')[2])
+        self.assertEqual(ResumenCategoria.objects.filter(categoria='Audio').order_by('fecha').last().activos, 0)
+
+    def test_tendencias_solo_leen_resumenes(self):
+        generar_resumenes('dia', ahora=timezone.now() - timedelta(days=1))
+        generar_resumenes('dia')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/productos/tendencias/', {'categoria': 'Audio'})
+        datos = response.json()
+        self.assertEqual(len(datos['categorias']['Audio']), 2)
+        self.assertEqual(datos['total'][0]['total'], Producto.objects.filter(categoria='Audio').count())
+
+
+@override_settings(PRODUCTOS_COALESCENCIA_TTL=0, PRODUCTOS_COALESCENCIA_OBSOLETO=0, PRODUCTOS_SYNC_MARGEN_SEGUNDOS=0)
+class ArranqueTests(TestCase):
+    """El calentamiento deja listo lo que construiría el primer request"""
+
+    def setUp(self):
+        reiniciar_estado()
+
+    def test_calentar_carga_indice_y_conteos(self):
+        sembrar(10)
+        pasos = calentar(get_wsgi_application())
+        self.assertEqual([p for p, _ in pasos], ['rutas', 'catalogo', 'autocompletar', 'listado', 'categorias'])
+        self.assertIsNotNone(autocompletar._indice)
+        # El conteo del listado quedó cacheado: solo se consultan los validadores y la página
+        with self.assertNumQueries(2):
+            self.client.get('/api/productos/')
+
+    def test_eventos_bajo_wsgi_responde_sin_bloquear(self):
+        response = self.client.get('/api/productos/eventos/')
+        self.assertEqual(response.status_code, 501)
+
+
+class MovimientosStockTests(TestCase):
+    """Cada cambio de stock queda en el registro y los snapshots permiten consultar el pasado"""
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(20)
+        cls.producto = Producto.objects.order_by('id').first()
+        cls.central = Almacen.objects.create(codigo='A1', nombre='Central')
+        cls.norte = Almacen.objects.create(codigo='B1', nombre='Norte')
+
+    def test_los_cambios_de_stock_quedan_registrados(self):
+        url = f'/api/productos/{self.producto.pk}/'
+        self.client.post(url + 'ajustar_stock/', {'cantidad': 3}, content_type='application/json')
+        self.client.patch(url, {'stock': 1}, content_type='application/json')
+        self.client.post(url + 'stock_almacenes/', {'movimientos': [{'almacen': self.central.pk, 'cantidad': 5}]},
+                         content_type='application/json')
+        self.client.post(url + 'transferir/', {'transferencias': [
+            {'origen': self.central.pk, 'destino': self.norte.pk, 'cantidad': 2},
+        ]}, content_type='application/json')
+
+        inicial = self.producto.stock
+        movimientos = list(MovimientoStock.objects.order_by('id').values_list('tipo', 'cantidad', 'stock_resultante'))
+        self.assertEqual(movimientos, [
+            ('ajuste', 3, inicial + 3),
+            ('ajuste', 1 - (inicial + 3), 1),
+            ('ajuste', 5, 6),
+            ('transferencia', -2, 6),
+            ('transferencia', 2, 6),
+        ])
+
+    def test_accion_admin_escribe_los_movimientos_en_un_insert(self):
+        ids = list(Producto.objects.values_list('id', flat=True))
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        with CaptureQueriesContext(connection) as contexto:
+            self.client.post(reverse('admin:productos_producto_changelist'), {
+                'action': 'aumentar_stock', '_selected_action': ids,
+            })
+        inserts = [c for c in contexto.captured_queries if 'INSERT INTO "productos_movimientostock"' in c['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(MovimientoStock.objects.filter(tipo='masivo', cantidad=10).count(), len(ids))
+
+    def test_los_movimientos_se_escriben_con_la_transaccion_del_stock(self):
+        # El lote exterior hace de LoteMovimientosMiddleware: el registro no espera al fin del request
+        with lote_movimientos():
+            mover_stock(self.producto.pk, [(self.central.pk, 5)])
+            ajustar_stock_sin_almacen(self.producto.pk, 2)
+            masivo.aplicar(Producto.objects.filter(pk=self.producto.pk), 'ajustar_stock', 1)
+            with transaction.atomic():
+                self.producto.refresh_from_db()
+                self.producto.aumentar_stock(3)
+            self.assertEqual(
+                list(MovimientoStock.objects.order_by('id').values_list('tipo', 'cantidad')),
+                [('ajuste', 5), ('ajuste', 2), ('masivo', 1), ('ajuste', 3)]
+            )
+
+    def test_los_movimientos_de_una_transaccion_revertida_se_descartan(self):
+        with lote_movimientos():
+            with self.assertRaises(StockInsuficiente):
+                with transaction.atomic():
+                    ajustar_stock_sin_almacen(self.producto.pk, 2)
+                    mover_stock(self.producto.pk, [(self.central.pk, -1)])
+        self.assertFalse(MovimientoStock.objects.exists())
+
+    def test_stock_historico_y_resumen_con_compactacion(self):
+        ahora = timezone.now()
+        t1, t2, t3 = ahora - timedelta(days=3), ahora - timedelta(days=2), ahora - timedelta(days=1)
+        # Historia: 10 unidades iniciales, +5 en t1, -3 en t2 y -4 en t3 → stock actual 8
+        Producto.objects.filter(pk=self.producto.pk).update(stock=8)
+        for fecha, cantidad in [(t1 - timedelta(hours=1), 10), (t1, 5), (t2, -3), (t3, -4)]:
+            MovimientoStock.objects.create(producto=self.producto, cantidad=cantidad, fecha=fecha)
+        self.producto.refresh_from_db()
+
+        self.assertEqual(stock_en(self.producto, t1), 15)
+        self.assertEqual(compactar(t2 + timedelta(hours=1), eliminar=True), 1)
+        self.assertEqual(compactar(t2 + timedelta(hours=1)), 0)
+        self.assertEqual(MovimientoStock.objects.count(), 1)
+
+        snapshot = SnapshotStock.objects.get()
+        self.assertEqual((snapshot.stock, snapshot.entradas, snapshot.salidas), (12, 15, 3))
+        self.assertEqual(stock_en(self.producto, t3 - timedelta(hours=1)), 12)
+        self.assertEqual(stock_en(self.producto, ahora), 8)
+        self.assertEqual(
+            resumen_periodo(t2 + timedelta(hours=1), ahora),
+            {self.producto.pk: {'entradas': 0, 'salidas': 4, 'neto': -4}}
+        )
+
+        response = self.client.get(
+            f'/api/productos/{self.producto.pk}/stock_historico/', {'fecha': t3.date().isoformat()}
+        )
+        self.assertEqual(response.json()['stock'], 12)
+
+
+
+@skipUnless(os.environ.get('PRODUCTOS_BENCHMARK'), 'Definir PRODUCTOS_BENCHMARK=1 para ejecutar los benchmarks')
+@override_settings(PRODUCTOS_COALESCENCIA_TTL=0, PRODUCTOS_COALESCENCIA_OBSOLETO=0, PRODUCTOS_SYNC_MARGEN_SEGUNDOS=0)
+class BenchmarkTests(TestCase):
+    """
+    Tiempos de cada endpoint con catálogos de distintos tamaños comparados con benchmark_baseline.json.
+
+    PRODUCTOS_BENCHMARK_TAMANOS: tamaños separados por coma (default: 1000; por ejemplo 1000,100000,1000000)
+    PRODUCTOS_BENCHMARK_TOLERANCIA: factor permitido sobre la línea base (default: 1.5)
+    PRODUCTOS_BENCHMARK_ACTUALIZAR=1: reescribe la línea base con los tiempos medidos
+    """
+    repeticiones = 5
+
+    def test_tiempos_contra_linea_base(self):
+        tamanos = [int(t) for t in os.environ.get('PRODUCTOS_BENCHMARK_TAMANOS', '1000').split(',')]
+        tolerancia = float(os.environ.get('PRODUCTOS_BENCHMARK_TOLERANCIA', '1.5'))
+        linea_base = json.loads(LINEA_BASE.read_text()) if LINEA_BASE.exists() else {}
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+        medidos = {}
+        for tamano in tamanos:
+            Producto.objects.all().delete()
+            sembrar(tamano)
+            reiniciar_estado()
+            self.client.force_login(admin)
+            for nombre, tiempo in self.medir_endpoints().items():
+                medidos[f'{tamano}:{nombre}'] = round(tiempo, 3)
+
+        if os.environ.get('PRODUCTOS_BENCHMARK_ACTUALIZAR'):
+            linea_base.update(medidos)
+            LINEA_BASE.write_text(json.dumps(linea_base, indent=2, sort_keys=True) + '\n')
+            return
+
+        regresiones = [
+            f'{clave}: {tiempo:.3f} ms (línea base {linea_base[clave]:.3f} ms)'
+            for clave, tiempo in medidos.items()
+            # 1 ms de margen para que los endpoints muy rápidos no fallen por ruido
+            if clave in linea_base and tiempo > linea_base[clave] * tolerancia + 1
+        ]
+        self.assertFalse(regresiones, 'Regresiones de rendimiento:\n' + '\n'.join(regresiones))
+
+    def medir_endpoints(self):
+        """Retorna la mediana en milisegundos de cada endpoint y acción del admin"""
+        producto = Producto.objects.filter(activo=True, stock__gt=5).first()
+        ids = list(Producto.objects.values_list('id', flat=True)[:10])
+        changelist = reverse('admin:productos_producto_changelist')
+        json_ = 'application/json'
+        solicitudes = {
+            'list': lambda: self.client.get('/api/productos/'),
+            'list_ordenado': lambda: self.client.get('/api/productos/?activo=true&ordering=-precio'),
+            'list_busqueda': lambda: self.client.get('/api/productos/?search=producto 12'),
+            'retrieve': lambda: self.client.get(f'/api/productos/{producto.pk}/'),
+            'create': lambda: self.client.post(
+                '/api/productos/', {'nombre': 'N', 'descripcion': 'x', 'precio': '1.00'}, content_type=json_
+            ),
+            'partial_update': lambda: self.client.patch(
+                f'/api/productos/{producto.pk}/', {'stock': 9}, content_type=json_
+            ),
+            'ajustar_stock': lambda: self.client.post(
+                f'/api/productos/{producto.pk}/ajustar_stock/', {'cantidad': 1}, content_type=json_
+            ),
+            'activar_desactivar': lambda: self.client.post(f'/api/productos/{producto.pk}/activar_desactivar/'),
+            'destroy': lambda: self.client.delete(f'/api/productos/{producto.pk}/'),
+            'activos': lambda: self.client.get('/api/productos/activos/'),
+            'con_stock': lambda: self.client.get('/api/productos/con_stock/'),
+            'sin_stock': lambda: self.client.get('/api/productos/sin_stock/'),
+            'stock_bajo': lambda: self.client.get('/api/productos/stock_bajo/'),
+            'por_categoria': lambda: self.client.get('/api/productos/por_categoria/?categoria=Audio'),
+            'estadisticas': lambda: self.client.get('/api/productos/estadisticas/'),
+            'cambios': lambda: self.client.get('/api/productos/cambios/'),
+            'autocompletar': lambda: self.client.get('/api/productos/autocompletar/?q=producto 1'),
+            'admin_changelist': lambda: self.client.get(changelist),
+            'admin_activar_productos': lambda: self.client.post(
+                changelist, {'action': 'activar_productos', '_selected_action': ids}
+            ),
+            'admin_aumentar_stock': lambda: self.client.post(
+                changelist, {'action': 'aumentar_stock', '_selected_action': ids}
+            ),
+        }
+        tiempos = {}
+        for nombre, solicitud in solicitudes.items():
+            solicitud()  # calentamiento
+            muestras = []
+            for _ in range(self.repeticiones):
+                inicio = time.perf_counter()
+                response = solicitud()
+                muestras.append((time.perf_counter() - inicio) * 1000)
+                self.assertLess(response.status_code, 400, nombre)
+            tiempos[nombre] = statistics.median(muestras)
+        return tiempos
@@ -1,10 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductoViewSet
+from .views import ProductoViewSet, AlmacenViewSet, TareaViewSet, eventos_productos, solicitud_compuesta
 
 router = DefaultRouter()
 router.register(r'productos', ProductoViewSet, basename='producto')
+router.register(r'almacenes', AlmacenViewSet, basename='almacen')
+router.register(r'tareas', TareaViewSet, basename='tarea')
 
 urlpatterns = [
+    path('batch/', solicitud_compuesta, name='solicitud-compuesta'),
+    path('productos/eventos/', eventos_productos, name='producto-eventos'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
@@ -1,17 +1,54 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import ProtectedError
+from django.utils import timezone
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
-from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework import viewsets, mixins, status
+from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
-from django.db.models import Q, Count, Avg
-from .models import Producto
+from rest_framework.filters import SearchFilter
+from .models import Producto, EstadoStock, Tarea, Almacen, StockAlmacen, MovimientoStock, ResumenCategoria
+from .filters import ProductoFilter, OrdenamientoProductos
+from .servicios import calcular_estadisticas
+from .tareas import encolar
+from .sincronizacion import obtener_cambios, TokenInvalido
+from .eventos import obtener_broker, formatear_sse
+from .catalogo import obtener_catalogo
+from .autocompletar import autocompletar as buscar_por_prefijo
+from .coalescencia import coalescer
+from .condicionales import (
+    condicional, validadores_coleccion, validadores_producto,
+    es_condicional, respuesta_condicional, agregar_validadores
+)
+from .inventario import (
+    mover_stock, transferir_stock, ajustar_stock_sin_almacen, StockInsuficiente, AlmacenInvalido
+)
+from .movimientos import parsear_fecha, stock_en, resumen_periodo
+from .masivo import aplicar as aplicar_masivo, OperacionInvalida
+from .resumenes import series_tendencias
+from .compuestas import ejecutar as ejecutar_compuesta, SolicitudCompuestaInvalida
+from .paginacion import PaginacionConteoEstimado
 from .serializers import (
     ProductoSerializer, 
     ProductoListSerializer, 
-    ProductoUpdateSerializer
+    ProductoUpdateSerializer,
+    TareaSerializer,
+    AlmacenSerializer,
+    StockAlmacenSerializer,
+    MovimientoStockSerializer
 )
 
+def es_asincrono(request):
+    """Indica si se pidió encolar el cálculo con ?asincrono=true"""
+    return request.query_params.get('asincrono', '').lower() in ('1', 'true')
+
+
 class ProductoViewSet(viewsets.ModelViewSet):
     """
     ViewSet para el CRUD completo de productos.
@@ -25,11 +62,17 @@ class ProductoViewSet(viewsets.ModelViewSet):
     """
     queryset = Producto.objects.all()
     serializer_class = ProductoSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ['activo', 'stock', 'categoria']
+    filter_backends = [DjangoFilterBackend, SearchFilter, OrdenamientoProductos]
+    filterset_class = ProductoFilter
     search_fields = ['nombre', 'descripcion', 'codigo_producto']
-    ordering_fields = ['nombre', 'precio', 'fecha_creacion', 'stock', 'categoria']
+    ordering_fields = ['nombre', 'precio', 'fecha_creacion', 'stock', 'categoria', 'estado_stock']
     ordering = ['-fecha_creacion']
+    # Los conteos cacheados solo se invalidan con escrituras de productos (notificar_cambios)
+    pagination_class = PaginacionConteoEstimado
+
+    def get_queryset(self):
+        """Anota el estado del stock para poder filtrar y ordenar por él en SQL"""
+        return super().get_queryset().con_estado_stock()
 
     def get_serializer_class(self):
         """Retorna el serializador apropiado según la acción"""
@@ -39,72 +82,306 @@ class ProductoViewSet(viewsets.ModelViewSet):
             return ProductoUpdateSerializer
         return ProductoSerializer
 
+    @condicional(validadores_coleccion)
+    @coalescer
+    def list(self, request, *args, **kwargs):
+        """Listado paginado; las solicitudes idénticas concurrentes comparten la consulta"""
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Detalle con ETag; un If-None-Match vigente se responde leyendo solo fecha_actualizacion"""
+        if es_condicional(request):
+            validadores = validadores_producto(request, self.kwargs['pk'])
+            if validadores is not None:
+                response = respuesta_condicional(request, *validadores)
+                if response is not None:
+                    return agregar_validadores(response, *validadores)
+        producto = self.get_object()
+        response = Response(self.get_serializer(producto).data)
+        return agregar_validadores(response, *validadores_producto(request, producto.pk, producto.fecha_actualizacion))
+
+    def update(self, request, *args, **kwargs):
+        """PUT/PATCH con If-Match: responde 412 si el producto cambió desde que el cliente lo leyó"""
+        if not es_condicional(request):
+            response = super().update(request, *args, **kwargs)
+        else:
+            with transaction.atomic():
+                # La fila queda bloqueada hasta guardar, así nadie la cambia entre la comparación y el UPDATE
+                validadores = validadores_producto(request, self.kwargs['pk'], bloquear=True)
+                if validadores is not None:
+                    response = respuesta_condicional(request, *validadores)
+                    if response is not None:
+                        return response
+                response = super().update(request, *args, **kwargs)
+        producto = self.producto_actualizado
+        return agregar_validadores(response, *validadores_producto(request, producto.pk, producto.fecha_actualizacion))
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.producto_actualizado = serializer.instance
+
     @action(detail=False, methods=['get'])
+    @condicional(validadores_coleccion)
     def activos(self, request):
         """Endpoint para obtener solo productos activos"""
-        productos = Producto.objects.filter(activo=True)
+        catalogo = obtener_catalogo()
+        if catalogo is not None:
+            return Response(catalogo.consultar())
+        productos = Producto.objects.con_estado_stock().filter(activo=True)
         serializer = self.get_serializer(productos, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @condicional(validadores_coleccion)
     def con_stock(self, request):
         """Endpoint para obtener productos con stock disponible"""
-        productos = Producto.objects.filter(stock__gt=0, activo=True)
+        catalogo = obtener_catalogo()
+        if catalogo is not None:
+            return Response(catalogo.consultar(con_stock=True))
+        productos = Producto.objects.con_estado_stock().filter(stock__gt=0, activo=True)
         serializer = self.get_serializer(productos, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @condicional(validadores_coleccion)
     def sin_stock(self, request):
         """Endpoint para obtener productos sin stock"""
-        productos = Producto.objects.filter(stock=0, activo=True)
+        catalogo = obtener_catalogo()
+        if catalogo is not None:
+            return Response(catalogo.consultar(estado=EstadoStock.SIN_STOCK))
+        productos = Producto.objects.con_estado_stock().por_estado_stock(EstadoStock.SIN_STOCK)
         serializer = self.get_serializer(productos, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @condicional(validadores_coleccion)
     def stock_bajo(self, request):
-        """Endpoint para obtener productos con stock bajo (≤5)"""
-        productos = Producto.objects.filter(stock__lte=5, stock__gt=0, activo=True)
+        """Endpoint para obtener productos con stock bajo (≤ PRODUCTOS_UMBRAL_STOCK_BAJO)"""
+        catalogo = obtener_catalogo()
+        if catalogo is not None:
+            return Response(catalogo.consultar(estado=EstadoStock.STOCK_BAJO))
+        productos = Producto.objects.con_estado_stock().por_estado_stock(EstadoStock.STOCK_BAJO)
         serializer = self.get_serializer(productos, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @condicional(validadores_coleccion)
     def por_categoria(self, request):
         """Endpoint para obtener productos por categoría"""
         categoria = request.query_params.get('categoria', '')
+        catalogo = obtener_catalogo()
+        if catalogo is not None:
+            return Response(catalogo.consultar(categoria=categoria))
         if categoria:
-            productos = Producto.objects.filter(categoria__icontains=categoria, activo=True)
+            productos = Producto.objects.con_estado_stock().filter(categoria__icontains=categoria, activo=True)
         else:
-            productos = Producto.objects.filter(activo=True)
+            productos = Producto.objects.con_estado_stock().filter(activo=True)
         serializer = self.get_serializer(productos, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get', 'post'])
+    @condicional(validadores_coleccion)
+    def lote(self, request):
+        """
+        Endpoint para obtener varios productos en una sola consulta.
+
+        ?ids=1,2,3 o ?codigos=PRO0001,PRO0002 (también en el body de un POST como listas)
+        ?campos=id,nombre,precio limita los campos de cada producto
+        """
+        datos = request.data if request.method == 'POST' else request.query_params
+        maximo = getattr(settings, 'PRODUCTOS_LOTE_MAXIMO', 200)
+
+        def como_lista(nombre):
+            valor = datos.get(nombre) or []
+            if isinstance(valor, str):
+                valor = valor.split(',')
+            elif not isinstance(valor, list):
+                raise TypeError(nombre)
+            return [str(v).strip() for v in valor if str(v).strip()]
+
+        try:
+            codigos = como_lista('codigos')
+            campos = como_lista('campos')
+            ids = como_lista('ids')
+        except TypeError as e:
+            return Response(
+                {'error': f'{e} debe ser una lista o un texto separado por comas'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            ids = [int(i) for i in ids]
+        except ValueError:
+            return Response(
+                {'error': 'Los ids deben ser números enteros'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if bool(ids) == bool(codigos):
+            return Response(
+                {'error': 'Debe indicar ids o codigos (solo uno de los dos)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        claves = list(dict.fromkeys(ids or codigos))
+        if len(claves) > maximo:
+            return Response(
+                {'error': f'Se pueden consultar como máximo {maximo} productos por lote'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        campo_clave = 'id' if ids else 'codigo_producto'
+        productos = self.get_queryset().order_by().filter(**{f'{campo_clave}__in': claves})
+        if campos:
+            validos = set(ProductoSerializer().fields)
+            invalidos = [c for c in campos if c not in validos]
+            if invalidos:
+                return Response(
+                    {'error': f"Campos inválidos: {', '.join(invalidos)}. Opciones: {', '.join(sorted(validos))}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            columnas = {f.name for f in Producto._meta.concrete_fields}
+            productos = productos.only(campo_clave, *[c for c in campos if c in columnas])
+
+        por_clave = {getattr(p, campo_clave): p for p in productos}
+        encontrados = [por_clave[clave] for clave in claves if clave in por_clave]
+        serializer = ProductoSerializer(encontrados, many=True, campos=campos or None)
+        return Response({
+            'resultados': serializer.data,
+            'faltantes': [clave for clave in claves if clave not in por_clave],
+        })
+
+    @action(detail=False, methods=['post'])
+    def masivo(self, request):
+        """
+        Endpoint para cambiar muchos productos con un UPDATE por lote.
+
+        POST {"operacion": "desactivar", "ids": [1, 2, 3]} o con los mismos filtros del listado
+        en la URL (/api/productos/masivo/?categoria=Audio&estado_stock=Sin%20stock) y {"operacion": ...}.
+        Un parámetro que no es un filtro del listado se rechaza en lugar de ignorarse.
+        Operaciones: activar, desactivar, eliminar (soft delete), fijar_stock, ajustar_stock y
+        precio_porcentaje, las tres últimas con "valor". "simulacion": true solo cuenta los
+        productos que cambiarían.
+        """
+        operacion = request.data.get('operacion')
+        ids = request.data.get('ids')
+        simulacion = str(request.data.get('simulacion', '')).lower() in ('1', 'true')
+        # Un parámetro ignorado por los filtros haría que el UPDATE alcance a todo el catálogo
+        permitidos = set(ProductoFilter.base_filters) | {'search'}
+        desconocidos = [clave for clave in request.query_params if clave not in permitidos]
+        if desconocidos:
+            return Response(
+                {'error': f"Filtros inválidos: {', '.join(desconocidos)}. Opciones: {', '.join(sorted(permitidos))}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        filtros = [clave for clave, valor in request.query_params.items() if valor != '']
+
+        if ids is not None:
+            # Un texto o un objeto se recorrerían por caracteres o claves y alcanzarían otros productos
+            if not isinstance(ids, list) or not all(
+                (isinstance(i, int) and not isinstance(i, bool)) or (isinstance(i, str) and i.isdigit())
+                for i in ids
+            ):
+                return Response(
+                    {'error': 'Los ids deben ser una lista de números enteros'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            ids = [int(i) for i in ids]
+        elif not filtros and request.data.get('todos') is not True:
+            # Evita modificar todo el catálogo por un body incompleto
+            return Response(
+                {'error': 'Debe indicar ids, filtros en la URL o "todos": true'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        productos = self.filter_queryset(self.get_queryset())
+        if ids is not None:
+            productos = productos.filter(pk__in=ids)
+        try:
+            afectados = aplicar_masivo(productos, operacion, request.data.get('valor'), simulacion)
+        except OperacionInvalida as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'operacion': operacion,
+            'simulacion': simulacion,
+            'afectados': afectados,
+        })
+
     @action(detail=False, methods=['get'])
+    def autocompletar(self, request):
+        """Endpoint de autocompletado por prefijo de nombre o código (?q=cam&limite=10)"""
+        try:
+            limite = min(max(int(request.query_params.get('limite', 10)), 1), 50)
+        except ValueError:
+            return Response(
+                {'error': 'El límite debe ser un número entero'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(buscar_por_prefijo(request.query_params.get('q', ''), limite))
+
+    @action(detail=False, methods=['get'])
+    @condicional(lambda request: None if es_asincrono(request) else validadores_coleccion(request))
+    @coalescer
     def estadisticas(self, request):
         """Endpoint para obtener estadísticas de productos"""
-        total_productos = Producto.objects.count()
-        productos_activos = Producto.objects.filter(activo=True).count()
-        productos_sin_stock = Producto.objects.filter(stock=0, activo=True).count()
-        productos_stock_bajo = Producto.objects.filter(stock__lte=5, stock__gt=0, activo=True).count()
-        
-        # Estadísticas por categoría
-        categorias = Producto.objects.filter(activo=True).values('categoria').annotate(
-            total=Count('id'),
-            precio_promedio=Avg('precio')
-        ).exclude(categoria__isnull=True).exclude(categoria='')
-        
-        # Productos más caros
-        productos_caros = Producto.objects.filter(activo=True).order_by('-precio')[:5]
-        productos_caros_serializer = ProductoListSerializer(productos_caros, many=True)
-        
+        # Con ?asincrono=true el cálculo se encola y se consulta en /api/tareas/{id}/
+        if es_asincrono(request):
+            tarea = encolar('estadisticas')
+            return Response(TareaSerializer(tarea).data, status=status.HTTP_202_ACCEPTED)
+        return Response(calcular_estadisticas())
+
+    @action(detail=False, methods=['get'])
+    def tendencias(self, request):
+        """
+        Endpoint con series de tiempo por categoría (?periodo=dia|hora&desde=&hasta=&categoria=).
+
+        Lee solo los resúmenes de generar_resumenes; por defecto los últimos 30 días o 48 horas.
+        """
+        periodo = request.query_params.get('periodo', ResumenCategoria.Periodo.DIA)
+        if periodo not in ResumenCategoria.Periodo.values:
+            return Response(
+                {'error': f"Periodo inválido. Opciones: {', '.join(ResumenCategoria.Periodo.values)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            desde, hasta = self.rango_fechas(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if desde is None:
+            desde = hasta - (timedelta(days=30) if periodo == ResumenCategoria.Periodo.DIA else timedelta(hours=48))
+        series = series_tendencias(periodo, desde, hasta, request.query_params.get('categoria'))
+        return Response({'periodo': periodo, 'desde': desde, 'hasta': hasta, **series})
+
+    @action(detail=False, methods=['get'])
+    def cambios(self, request):
+        """Endpoint de sincronización incremental desde un token (?desde=<token>)"""
+        try:
+            limite = min(max(int(request.query_params.get('limite', 500)), 1), 5000)
+        except ValueError:
+            return Response(
+                {'error': 'El límite debe ser un número entero'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            productos, siguiente, hay_mas = obtener_cambios(request.query_params.get('desde'), limite)
+        except TokenInvalido as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Un solo serializador con many=True: instanciarlo por fila es un orden de magnitud más lento
+        activos = iter(ProductoSerializer([p for p in productos if p.activo], many=True).data)
+        resultados = []
+        for producto in productos:
+            if producto.activo:
+                resultados.append(next(activos))
+            else:
+                # Los productos desactivados (soft delete) se envían como marcas de eliminación
+                resultados.append({
+                    'id': producto.id,
+                    'codigo_producto': producto.codigo_producto,
+                    'eliminado': True,
+                    'fecha_actualizacion': producto.fecha_actualizacion,
+                })
         return Response({
-            'resumen': {
-                'total_productos': total_productos,
-                'productos_activos': productos_activos,
-                'productos_sin_stock': productos_sin_stock,
-                'productos_stock_bajo': productos_stock_bajo,
-            },
-            'categorias': list(categorias),
-            'productos_mas_caros': productos_caros_serializer.data
+            'resultados': resultados,
+            'siguiente': siguiente,
+            'hay_mas': hay_mas,
         })
 
     @action(detail=True, methods=['post'])
@@ -122,31 +399,161 @@ class ProductoViewSet(viewsets.ModelViewSet):
         producto = self.get_object()
         cantidad = request.data.get('cantidad', 0)
         operacion = request.data.get('operacion', 'sumar')  # 'sumar' o 'restar'
+        almacen = request.data.get('almacen')  # opcional: ajusta el stock de ese almacén
         
         try:
             cantidad = int(cantidad)
-            if operacion == 'restar':
-                if producto.reducir_stock(cantidad):
-                    mensaje = f"Stock reducido en {cantidad} unidades"
-                else:
-                    return Response(
-                        {'error': 'Stock insuficiente para realizar la operación'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            else:
-                producto.aumentar_stock(cantidad)
-                mensaje = f"Stock aumentado en {cantidad} unidades"
-            
-            serializer = self.get_serializer(producto)
-            return Response({
-                'mensaje': mensaje,
-                'producto': serializer.data
-            })
-        except ValueError:
+            almacen = int(almacen) if almacen is not None else None
+        except (TypeError, ValueError):
             return Response(
                 {'error': 'La cantidad debe ser un número entero'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        signo = -1 if operacion == 'restar' else 1
+        try:
+            if almacen is not None:
+                producto, _ = mover_stock(producto.pk, [(almacen, signo * cantidad)])
+            else:
+                # Sin almacén solo se mueve el stock no asignado a ninguno
+                producto = ajustar_stock_sin_almacen(producto.pk, signo * cantidad)
+        except (StockInsuficiente, AlmacenInvalido) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        mensaje = f"Stock {'reducido' if signo < 0 else 'aumentado'} en {cantidad} unidades"
+        if almacen is not None:
+            mensaje += f" en el almacén {almacen}"
+        return Response({
+            'mensaje': mensaje,
+            'producto': self.get_serializer(producto).data
+        })
+
+    def respuesta_stock_almacenes(self, producto_id):
+        """Producto con su stock desglosado por almacén"""
+        producto = self.get_queryset().get(pk=producto_id)
+        stocks = StockAlmacen.objects.filter(producto_id=producto_id).select_related('almacen')
+        return Response({
+            'producto': ProductoSerializer(producto).data,
+            'almacenes': StockAlmacenSerializer(stocks, many=True).data,
+        })
+
+    @action(detail=True, methods=['get', 'post'])
+    def stock_almacenes(self, request, pk=None):
+        """
+        Endpoint para consultar o ajustar el stock por almacén.
+
+        POST {"movimientos": [{"almacen": 1, "cantidad": 5}, {"almacen": 2, "cantidad": -3}]}
+        aplica todos los movimientos en una transacción y actualiza el total del producto.
+        """
+        producto = self.get_object()
+        if request.method == 'GET':
+            return self.respuesta_stock_almacenes(producto.pk)
+        try:
+            movimientos = [
+                (int(m['almacen']), int(m['cantidad']))
+                for m in request.data.get('movimientos', [])
+            ]
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {'error': 'Cada movimiento debe tener almacen y cantidad enteros'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not movimientos:
+            return Response({'error': 'Debe indicar al menos un movimiento'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            mover_stock(producto.pk, movimientos)
+        except (StockInsuficiente, AlmacenInvalido) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self.respuesta_stock_almacenes(producto.pk)
+
+    @action(detail=True, methods=['post'])
+    def transferir(self, request, pk=None):
+        """
+        Endpoint para transferir stock entre almacenes sin cambiar el total.
+
+        POST {"transferencias": [{"origen": 1, "destino": 2, "cantidad": 3}, ...]}
+        """
+        producto = self.get_object()
+        try:
+            transferencias = [
+                (int(t['origen']), int(t['destino']), int(t['cantidad']))
+                for t in request.data.get('transferencias', [])
+            ]
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {'error': 'Cada transferencia debe tener origen, destino y cantidad enteros'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not transferencias:
+            return Response({'error': 'Debe indicar al menos una transferencia'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            transferir_stock(producto.pk, transferencias)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self.respuesta_stock_almacenes(producto.pk)
+
+    def rango_fechas(self, request):
+        """Lee ?desde= y ?hasta= (AAAA-MM-DD o ISO); hasta es ahora si no se indica"""
+        desde = request.query_params.get('desde')
+        hasta = request.query_params.get('hasta')
+        return (
+            parsear_fecha(desde) if desde else None,
+            parsear_fecha(hasta) if hasta else timezone.now(),
+        )
+
+    @action(detail=True, methods=['get'])
+    def movimientos(self, request, pk=None):
+        """Endpoint con el registro de movimientos de stock de un producto (?desde=&hasta=)"""
+        producto = self.get_object()
+        try:
+            desde, hasta = self.rango_fechas(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = MovimientoStock.objects.filter(producto=producto, fecha__lte=hasta)
+        if desde:
+            queryset = queryset.filter(fecha__gte=desde)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(MovimientoStockSerializer(page, many=True).data)
+        return Response(MovimientoStockSerializer(queryset, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def stock_historico(self, request, pk=None):
+        """Endpoint con el stock que tenía un producto en una fecha (?fecha=AAAA-MM-DD)"""
+        producto = self.get_object()
+        valor = request.query_params.get('fecha')
+        if not valor:
+            return Response({'error': 'Debe indicar la fecha'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            fecha = parsear_fecha(valor)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'producto': producto.id,
+            'fecha': fecha,
+            'stock': stock_en(producto, fecha),
+        })
+
+    @action(detail=False, methods=['get'])
+    def movimientos_periodo(self, request):
+        """
+        Endpoint con las entradas y salidas por producto en un período (?desde=&hasta=&producto=).
+
+        Se calcula desde los snapshots de compactar_movimientos, sin recorrer toda la historia.
+        """
+        try:
+            desde, hasta = self.rango_fechas(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        producto = request.query_params.get('producto')
+        if producto and not producto.isdigit():
+            return Response({'error': 'El producto debe ser un id numérico'}, status=status.HTTP_400_BAD_REQUEST)
+        if desde is None:
+            return Response({'error': 'Debe indicar la fecha desde'}, status=status.HTTP_400_BAD_REQUEST)
+        resumen = resumen_periodo(desde, hasta, int(producto) if producto else None)
+        return Response({
+            'desde': desde,
+            'hasta': hasta,
+            'productos': [{'producto': pk, **totales} for pk, totales in sorted(resumen.items())],
+        })
 
     def destroy(self, request, *args, **kwargs):
         """Sobrescribir destroy para hacer soft delete"""
@@ -166,3 +573,132 @@ class ProductoViewSet(viewsets.ModelViewSet):
         read_serializer = ProductoSerializer(producto)
         headers = self.get_success_headers(serializer.data)
         return Response(read_serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
+
+class AlmacenViewSet(viewsets.ModelViewSet):
+    """
+    ViewSet para el CRUD de almacenes.
+
+    stock: Obtiene el stock de todos los productos del almacén
+    """
+    queryset = Almacen.objects.all()
+    serializer_class = AlmacenSerializer
+    filterset_fields = ['activo']
+    search_fields = ['nombre', 'codigo']
+
+    def destroy(self, request, *args, **kwargs):
+        """Elimina un almacén sin stock ni movimientos; los demás solo pueden desactivarse"""
+        try:
+            return super().destroy(request, *args, **kwargs)
+        except ProtectedError:
+            return Response(
+                {'error': 'El almacén tiene stock o movimientos registrados; desactívelo en su lugar'},
+                status=status.HTTP_409_CONFLICT
+            )
+
+    @action(detail=True, methods=['get'])
+    def stock(self, request, pk=None):
+        """Endpoint para obtener el stock por producto de un almacén"""
+        almacen = self.get_object()
+        stocks = almacen.stocks.select_related('almacen').order_by('producto_id')
+        pagina = self.paginate_queryset(stocks)
+        datos = [
+            {'producto': s.producto_id, **StockAlmacenSerializer(s).data}
+            for s in (pagina if pagina is not None else stocks)
+        ]
+        if pagina is not None:
+            return self.get_paginated_response(datos)
+        return Response(datos)
+
+
+class TareaViewSet(mixins.CreateModelMixin,
+                   mixins.ListModelMixin,
+                   mixins.RetrieveModelMixin,
+                   viewsets.GenericViewSet):
+    """
+    ViewSet para las tareas en segundo plano.
+
+    list: Obtiene las tareas encoladas
+    create: Encola una nueva tarea
+    retrieve: Consulta el estado, progreso y resultado de una tarea
+    """
+    queryset = Tarea.objects.all()
+    serializer_class = TareaSerializer
+    filterset_fields = ['tipo', 'estado']
+    ordering_fields = ['fecha_creacion', 'estado']
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED, headers=headers)
+
+
+@api_view(['POST'])
+def solicitud_compuesta(request):
+    """
+    Endpoint para resolver varias llamadas a /api/productos/ en un solo viaje de ida y vuelta.
+
+    POST {"solicitudes": [{"id": "stats", "ruta": "/api/productos/estadisticas/"},
+    {"id": "audio", "ruta": "/api/productos/", "parametros": {"categoria": "Audio", "page": 2}},
+    {"id": "editar", "metodo": "PATCH", "ruta": "/api/productos/3/", "datos": {"stock": 4}}]}
+    Retorna el estado, el tiempo y los datos de cada parte en el mismo orden.
+    """
+    inicio = time.perf_counter()
+    try:
+        solicitudes = request.data.get('solicitudes') if hasattr(request.data, 'get') else None
+        resultados = ejecutar_compuesta(request._request, solicitudes)
+    except SolicitudCompuestaInvalida as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        'resultados': resultados,
+        'tiempo_ms': round((time.perf_counter() - inicio) * 1000, 2),
+    })
+
+
+async def eventos_productos(request):
+    """
+    Stream Server-Sent Events con los cambios de productos.
+
+    Parámetros: ?ids=1,2,3 y/o ?categoria=Audio (varias separadas por coma).
+    Sin filtros se reciben todos los cambios. Requiere un servidor ASGI: bajo WSGI Django leería
+    el stream completo antes de enviar nada y la conexión ocuparía un hilo para siempre.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'error': 'El stream de eventos requiere un servidor ASGI (python manage.py serve --asgi)'},
+            status=status.HTTP_501_NOT_IMPLEMENTED
+        )
+    try:
+        ids = [int(i) for i in request.GET.get('ids', '').split(',') if i.strip()]
+    except ValueError:
+        return JsonResponse(
+            {'error': 'Los ids deben ser números enteros'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    categorias = [c.strip() for c in request.GET.get('categoria', '').split(',') if c.strip()]
+    latido = getattr(settings, 'PRODUCTOS_EVENTOS_LATIDO_SEGUNDOS', 15)
+
+    async def stream():
+        broker = obtener_broker()
+        suscripcion = broker.suscribir(ids, categorias)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                evento = await suscripcion.siguiente(espera=latido)
+                if evento is None:
+                    # Comentario SSE para mantener viva la conexión
+                    yield ": ping\n\n"
+                    continue
+                if suscripcion.perdidos:
+                    evento = {**evento, 'perdidos': suscripcion.perdidos}
+                    suscripcion.perdidos = 0
+                yield formatear_sse(evento)
+        finally:
+            broker.cancelar(suscripcion)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -3,6 +3,9 @@ ASGI config for productos_api project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The product event stream (/api/productos/eventos/) is an async view and
+needs to be served through this application to hold connections open.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
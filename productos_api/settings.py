@@ -55,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'productos.middleware.LoteMovimientosMiddleware',
 ]
 
 ROOT_URLCONF = 'productos_api.urls'
@@ -144,6 +145,55 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Configuración de Productos
+# Stock a partir del cual (inclusive) un producto se considera con stock bajo
+PRODUCTOS_UMBRAL_STOCK_BAJO = config('PRODUCTOS_UMBRAL_STOCK_BAJO', default=5, cast=int)
+# Acciones del admin sobre más productos que este umbral se ejecutan como tareas en segundo plano
+PRODUCTOS_TAREAS_UMBRAL_ADMIN = config('PRODUCTOS_TAREAS_UMBRAL_ADMIN', default=1000, cast=int)
+# Una tarea en proceso sin señales del worker durante este tiempo se vuelve a encolar, hasta
+# PRODUCTOS_TAREAS_INTENTOS_MAXIMOS veces
+PRODUCTOS_TAREAS_VENCIMIENTO_SEGUNDOS = config('PRODUCTOS_TAREAS_VENCIMIENTO_SEGUNDOS', default=300, cast=int)
+PRODUCTOS_TAREAS_INTENTOS_MAXIMOS = config('PRODUCTOS_TAREAS_INTENTOS_MAXIMOS', default=3, cast=int)
+
+# Margen de seguridad de /api/productos/cambios/ frente a transacciones aún no confirmadas
+PRODUCTOS_SYNC_MARGEN_SEGUNDOS = config('PRODUCTOS_SYNC_MARGEN_SEGUNDOS', default=5, cast=int)
+
+# Stream de eventos de productos (/api/productos/eventos/)
+PRODUCTOS_EVENTOS_BACKEND = config('PRODUCTOS_EVENTOS_BACKEND', default='productos.eventos.BackendMemoria')
+# Eventos pendientes por cliente antes de descartar los más antiguos
+PRODUCTOS_EVENTOS_COLA_MAXIMA = config('PRODUCTOS_EVENTOS_COLA_MAXIMA', default=100, cast=int)
+PRODUCTOS_EVENTOS_LATIDO_SEGUNDOS = config('PRODUCTOS_EVENTOS_LATIDO_SEGUNDOS', default=15, cast=int)
+
+# Catálogo en memoria por proceso para los filtros y ordenamientos más usados
+PRODUCTOS_CATALOGO_EN_MEMORIA = config('PRODUCTOS_CATALOGO_EN_MEMORIA', default=False, cast=bool)
+PRODUCTOS_CATALOGO_REFRESCO_SEGUNDOS = config('PRODUCTOS_CATALOGO_REFRESCO_SEGUNDOS', default=2, cast=float)
+
+# Índice de prefijos en memoria para /api/productos/autocompletar/
+PRODUCTOS_AUTOCOMPLETAR_EN_MEMORIA = config('PRODUCTOS_AUTOCOMPLETAR_EN_MEMORIA', default=True, cast=bool)
+PRODUCTOS_AUTOCOMPLETAR_REFRESCO_SEGUNDOS = config('PRODUCTOS_AUTOCOMPLETAR_REFRESCO_SEGUNDOS', default=5, cast=float)
+
+# Coalescencia de solicitudes idénticas en el listado y en estadísticas (segundos)
+PRODUCTOS_COALESCENCIA_TTL = config('PRODUCTOS_COALESCENCIA_TTL', default=1, cast=float)
+PRODUCTOS_COALESCENCIA_OBSOLETO = config('PRODUCTOS_COALESCENCIA_OBSOLETO', default=5, cast=float)
+PRODUCTOS_COALESCENCIA_ESPERA = config('PRODUCTOS_COALESCENCIA_ESPERA', default=10, cast=float)
+
+# Conteos de listados: sobre este número de filas estimadas se usa la estimación del planificador
+PRODUCTOS_CONTEO_UMBRAL_ESTIMADO = config('PRODUCTOS_CONTEO_UMBRAL_ESTIMADO', default=100000, cast=int)
+PRODUCTOS_CONTEO_CACHE_SEGUNDOS = config('PRODUCTOS_CONTEO_CACHE_SEGUNDOS', default=60, cast=int)
+
+# Máximo de productos por llamada a /api/productos/lote/
+PRODUCTOS_LOTE_MAXIMO = config('PRODUCTOS_LOTE_MAXIMO', default=200, cast=int)
+
+# Productos modificados por cada UPDATE de /api/productos/masivo/
+PRODUCTOS_MASIVO_LOTE = config('PRODUCTOS_MASIVO_LOTE', default=1000, cast=int)
+
+# Movimientos de stock acumulados antes de escribirlos con un INSERT de varias filas
+PRODUCTOS_MOVIMIENTOS_LOTE_MAXIMO = config('PRODUCTOS_MOVIMIENTOS_LOTE_MAXIMO', default=500, cast=int)
+
+# Solicitudes compuestas (/api/batch/): partes por llamada y lecturas ejecutadas en paralelo
+PRODUCTOS_BATCH_MAXIMO = config('PRODUCTOS_BATCH_MAXIMO', default=20, cast=int)
+PRODUCTOS_BATCH_HILOS = config('PRODUCTOS_BATCH_HILOS', default=4, cast=int)
+
 # CORS Configuration
 CORS_ALLOW_ALL_ORIGINS = True  # Solo para desarrollo
 CORS_ALLOWED_ORIGINS = [
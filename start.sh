@@ -1,4 +1,4 @@
 #!/usr/bin/env bash
 python manage.py migrate
 python manage.py collectstatic --noinput
-python manage.py runserver 0.0.0.0:10000
\ No newline at end of file
+python manage.py serve --bind 0.0.0.0:10000
\ No newline at end of file